@@ -0,0 +1,189 @@
+"""
+Numeric backend module.
+
+This module defines the number types calculations can run in: native
+float, decimal.Decimal at a chosen precision, fractions.Fraction and int.
+A backend parses typed numbers, converts operands, and resolves the
+registered operations into a table that works in its type. The table is
+built once when a backend is selected, so individual calls never check
+which backend is active; the float backend returns the registered
+functions unchanged.
+"""
+
+import decimal
+from decimal import Decimal
+from fractions import Fraction
+from typing import Callable, Dict, Optional
+
+from app.operation import add, divide, multiply, subtract
+
+Operation = Callable[..., object]
+
+_BUILTINS = {'add': add, 'subtract': subtract, 'multiply': multiply, 'divide': divide}
+
+
+class NumericBackend:
+    """Native float arithmetic; the default backend."""
+
+    name = 'float'
+    # Whether results are exact and so must not be squeezed into float arrays
+    exact = False
+
+    def parse(self, text: str) -> object:
+        return float(text)
+
+    def convert(self, value: object) -> object:
+        return value
+
+    def _builtin(self, name: str) -> Optional[Operation]:
+        """Return this backend's version of a built-in operation, if it has one."""
+        return None
+
+    def resolve(self, operations: Dict[str, Operation]) -> Dict[str, Operation]:
+        """Return the table of ``operations`` adapted to this backend."""
+        if type(self) is NumericBackend:
+            return operations
+        convert = self.convert
+        resolved: Dict[str, Operation] = {}
+        for name, func in operations.items():
+            # A built-in replaced through register_operation is used as registered
+            builtin = self._builtin(name) if _BUILTINS.get(name) is func else None
+            resolved[name] = builtin if builtin is not None else self._wrap(func, convert)
+        return resolved
+
+    def _wrap(self, func: Operation, convert: Callable[[object], object]) -> Operation:
+        def operation(a, b):
+            return func(convert(a), convert(b))
+        return operation
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}()"
+
+
+FloatBackend = NumericBackend
+
+
+class DecimalBackend(NumericBackend):
+
+    name = 'decimal'
+    exact = True
+
+    def __init__(self, precision: int = 28):
+        if precision < 1:
+            raise ValueError("Precision must be at least 1")
+        self.precision = precision
+        self.context = decimal.Context(prec=precision, traps=[
+            decimal.InvalidOperation, decimal.DivisionByZero, decimal.Overflow,
+        ])
+
+    def parse(self, text: str) -> Decimal:
+        # EAFP - let Decimal decide what a number looks like
+        try:
+            return self.context.create_decimal(text.strip())
+        except decimal.InvalidOperation:
+            raise ValueError(f"could not convert string to Decimal: '{text}'")
+
+    def convert(self, value: object) -> Decimal:
+        if type(value) is Decimal:
+            return value  # type: ignore[return-value]
+        # A float stands for the number it prints as, not its binary expansion
+        try:
+            return self.context.create_decimal(repr(value) if type(value) is float else value)
+        except decimal.DecimalException:
+            raise ValueError(f"{value!r} is not a decimal number")
+
+    def _builtin(self, name: str) -> Optional[Operation]:
+        context, convert = self.context, self.convert
+        method = {'add': context.add, 'subtract': context.subtract,
+                  'multiply': context.multiply, 'divide': context.divide}[name]
+        check_zero = name == 'divide'
+
+        def operation(a, b):
+            a, b = convert(a), convert(b)
+            # LBYL approach - same check and message as app.operation.divide
+            if check_zero and b == 0:
+                raise ValueError("Cannot divide by zero")
+            try:
+                return method(a, b)
+            except decimal.DecimalException as e:
+                raise ValueError(f"Decimal {type(e).__name__.lower()}")
+        return operation
+
+    def _wrap(self, func: Operation, convert: Callable[[object], object]) -> Operation:
+        context = self.context
+
+        def operation(a, b):
+            # Registered operations compute under this backend's precision
+            with decimal.localcontext(context):
+                return func(convert(a), convert(b))
+        return operation
+
+    def __repr__(self) -> str:
+        return f"DecimalBackend(precision={self.precision})"
+
+
+class FractionBackend(NumericBackend):
+
+    name = 'fraction'
+    exact = True
+
+    def parse(self, text: str) -> Fraction:
+        return Fraction(text.strip())
+
+    def convert(self, value: object) -> Fraction:
+        if type(value) is Fraction:
+            return value  # type: ignore[return-value]
+        return Fraction(repr(value) if type(value) is float else value)  # type: ignore[arg-type]
+
+
+class IntBackend(NumericBackend):
+    """Arbitrary-precision integers; divide is floor division."""
+
+    name = 'int'
+    exact = True
+
+    def parse(self, text: str) -> int:
+        return int(text)
+
+    def convert(self, value: object) -> int:
+        if type(value) is int:
+            return value  # type: ignore[return-value]
+        try:
+            converted = int(value)  # type: ignore[call-overload]
+        except OverflowError:
+            raise ValueError(f"{value} is not an integer")
+        if converted != value:
+            raise ValueError(f"{value} is not an integer")
+        return converted
+
+    def _builtin(self, name: str) -> Optional[Operation]:
+        if name != 'divide':
+            return None
+
+        convert = self.convert
+
+        def floor_divide(a, b):
+            b = convert(b)
+            if b == 0:
+                raise ValueError("Cannot divide by zero")
+            return convert(a) // b
+        return floor_divide
+
+
+BACKENDS = {
+    'float': FloatBackend,
+    'decimal': DecimalBackend,
+    'fraction': FractionBackend,
+    'int': IntBackend,
+}
+
+
+def get_backend(name: str, precision: Optional[int] = None) -> NumericBackend:
+    """Create the backend called ``name``; ``precision`` applies to decimal."""
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown backend: {name}. Available: {', '.join(BACKENDS)}")
+    if precision is not None:
+        if name != 'decimal':
+            raise ValueError(f"Precision only applies to the decimal backend, not {name}")
+        return DecimalBackend(precision)
+    return BACKENDS[name]()
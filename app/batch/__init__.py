@@ -0,0 +1,177 @@
+"""
+Tolerant batch module.
+
+This module evaluates columns of operands without stopping at rows that
+fail. Every row gets an error code in a mask parallel to the results, and
+a failed row's result is ``nan`` or, under the ``ieee`` policy, what IEEE
+754 arithmetic gives for it: ``x / ±0`` is ``±inf`` and ``0 / 0`` is
+``nan``. A BatchResult summarizes which rows failed and why.
+
+Division by zero is found by looking at the divisors before dividing, so
+a column full of zeros costs about as much as a clean one. Other failures
+are only known once an operation raises, and fall back to one row at a
+time.
+"""
+
+import math
+from array import array
+from itertools import compress, repeat
+from operator import add, getitem, mul, not_
+from typing import Callable, Dict, List, Optional, Sequence, Tuple, Union
+
+# Error codes in BatchResult.codes; 0 means the row succeeded
+OK = 0
+DIVISION_BY_ZERO = 1
+INVALID = 2
+OVERFLOW = 3
+REASONS = {
+    DIVISION_BY_ZERO: 'division by zero',
+    INVALID: 'invalid operands',
+    OVERFLOW: 'overflow',
+}
+
+POLICIES = ('nan', 'ieee')
+
+# Rows evaluated per block, so masks and temporaries stay small
+BLOCK = 4096
+
+# Runs of failed rows listed by str(BatchResult) before the rest are counted
+SHOWN_RUNS = 5
+
+_NAN = float('nan')
+_INF = float('inf')
+# Looked up with the divisor as the default: zero divisors (0 == -0.0) turn
+# into nan, and dividing by nan gives nan without raising
+_NAN_FOR_ZERO = {0: _NAN}
+
+
+class BatchResult:
+
+    def __init__(self, values: Union[array, List[object], object], codes: bytearray):
+        self.values = values
+        self.codes = codes
+
+    @property
+    def failed(self) -> int:
+        return len(self.codes) - self.codes.count(OK)
+
+    def failures(self, code: Optional[int] = None) -> List[int]:
+        """Return the indices of failed rows, or only those that failed with ``code``."""
+        flags = self.codes if code is None else map(code.__eq__, self.codes)
+        return list(compress(range(len(self.codes)), flags))
+
+    def summary(self) -> Dict[str, int]:
+        """Return how many rows failed for each reason."""
+        return {reason: self.codes.count(code)
+                for code, reason in REASONS.items() if code in self.codes}
+
+    def __len__(self) -> int:
+        return len(self.codes)
+
+    def __str__(self) -> str:
+        if not self.failed:
+            return f"0 of {len(self)} rows failed"
+        reasons = [f"{reason} at {_runs(self.failures(code))}"
+                   for code, reason in REASONS.items() if code in self.codes]
+        return f"{self.failed} of {len(self)} rows failed: {'; '.join(reasons)}"
+
+    def __repr__(self) -> str:
+        return f"BatchResult({len(self)} rows, {self.failed} failed)"
+
+
+def _runs(indices: List[int]) -> str:
+    """Format sorted indices as ranges, e.g. ``2-4, 9 and 3 more``."""
+    runs: List[List[int]] = []
+    for index in indices:
+        if runs and runs[-1][1] == index - 1:
+            runs[-1][1] = index
+        else:
+            runs.append([index, index])
+    shown = ', '.join(str(first) if first == last else f"{first}-{last}"
+                      for first, last in runs[:SHOWN_RUNS])
+    hidden = sum(last - first + 1 for first, last in runs[SHOWN_RUNS:])
+    return f"{shown} and {hidden} more" if hidden else shown
+
+
+def evaluate(func: Callable[..., object], columns: Sequence[Sequence[object]],
+             policy: str = 'nan', out: Optional[memoryview] = None,
+             divides: bool = False, exact: bool = False) -> Tuple[object, bytearray]:
+    """Evaluate ``func`` over the rows of ``columns``; return results and error codes.
+
+    ``divides`` says ``func`` divides its first operand by its second, so
+    zero divisors are flagged up front. Results are a float array, written
+    into ``out`` when given, or a list of exact values when ``exact`` is set.
+    """
+    values: Union[array, List[object]] = [] if exact else array('d')
+    codes = bytearray()
+    for start in range(0, len(columns[0]), BLOCK):
+        rows = [column[start:start + BLOCK] for column in columns]
+        if exact:
+            block, block_codes = _row_block(func, rows, policy, divides, None)
+        else:
+            block, block_codes = _float_block(func, rows, policy, divides)
+        codes += block_codes
+        if out is not None:
+            out[start:start + len(block)] = block  # type: ignore[assignment]
+        else:
+            values += block  # type: ignore[operator]
+    return (values if out is None else out), codes
+
+
+def _float_block(func: Callable[..., object], rows: List[Sequence[object]],
+                 policy: str, divides: bool) -> Tuple[array, bytearray]:
+    # EAFP - the whole block runs through the C map; only a block where
+    # something unforeseen raises is redone one row at a time
+    try:
+        if divides:
+            a, b = rows
+            zero = bytes(map(not_, b))
+            if zero.count(1):
+                # Every row takes the same steps, however many are flagged
+                if policy == 'ieee':
+                    # Zero divisors become 1 so nothing raises, then flagged
+                    # rows take a * ±inf instead
+                    quotients = map(func, a, map(add, b, zero))
+                    limits = map(mul, a, map(math.copysign, repeat(_INF), b))
+                    block = array('d', map(getitem, zip(quotients, limits), zero))
+                else:
+                    block = array('d', map(func, a, map(_NAN_FOR_ZERO.get, b, b)))
+                return block, bytearray(zero)
+        return array('d', map(func, *rows)), bytearray(len(rows[0]))
+    except (ValueError, ArithmeticError):
+        block, codes = _row_block(func, rows, policy, divides, float)
+        return array('d', block), codes
+
+
+def _row_block(func: Callable[..., object], rows: List[Sequence[object]], policy: str,
+               divides: bool, convert: Optional[Callable[[object], object]]) -> Tuple[List[object], bytearray]:
+    results: List[object] = []
+    codes = bytearray(len(rows[0]))
+    for index, operands in enumerate(zip(*rows)):
+        # LBYL for the failure known in advance, EAFP for everything else
+        if divides and not operands[1]:
+            codes[index] = DIVISION_BY_ZERO
+            results.append(_limit(operands) if policy == 'ieee' else _NAN)
+            continue
+        try:
+            result = func(*operands)
+            results.append(result if convert is None else convert(result))
+        except ZeroDivisionError:
+            codes[index] = DIVISION_BY_ZERO
+            results.append(_NAN)
+        except OverflowError:
+            codes[index] = OVERFLOW
+            results.append(_NAN)
+        except ValueError:
+            codes[index] = INVALID
+            results.append(_NAN)
+    return results, codes
+
+
+def _limit(operands: Tuple[object, ...]) -> float:
+    """Return IEEE 754's ``a / ±0``, or nan if even that is out of range."""
+    a, b = operands
+    try:
+        return a * math.copysign(_INF, b)  # type: ignore[operator, arg-type]
+    except OverflowError:
+        return _NAN
@@ -0,0 +1,582 @@
+"""
+Benchmark module.
+
+This module measures the calculator's hot paths and keeps the numbers in a
+JSON baseline so later changes can be compared against them. Run it with
+``python -m app.bench``; see ``--help`` for saving and comparing baselines.
+
+Every benchmark is a function that receives a size and returns a callable
+performing ``size`` operations. The runner times that callable and reports
+the best time per operation over several repeats. A benchmark of one
+operation on a history of that size, such as an undo, instead performs
+:data:`CALLS` operations per run and is registered with ``operations=CALLS``.
+
+``--startup`` instead checks the one-shot command line: it runs
+``python -X importtime -m app.calculator add 5 3`` and fails if that
+imports any heavyweight module or spends longer importing than the budget.
+"""
+
+import argparse
+import builtins
+import contextlib
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from array import array
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from app.batch import POLICIES
+from app.cache import SharedResultCache
+from app.calculation import CalculationFactory, SessionHistory
+from app.operation import add, divide, multiply, subtract
+
+DEFAULT_BASELINE = 'benchmarks/baseline.json'
+DEFAULT_SIZES = (1000, 10000, 100000)
+FULL_SIZES = (1000, 10000, 100000, 1000000, 10000000)
+# Benchmarks that do not scale with history size run this many operations
+ITERATIONS = 100000
+# Operations per run of a benchmark whose cost does not grow with the
+# history it runs on, so the figure is per operation, not per entry
+CALLS = 100
+
+# One-shot startup: the command timed with -X importtime, the microseconds
+# allowed for everything imported from the app package onwards, and modules
+# it must not import at all
+STARTUP_COMMAND = ('-m', 'app.calculator', 'add', '5', '3')
+STARTUP_BUDGET_US = 10000
+STARTUP_FORBIDDEN = (
+    'argparse', 'typing', 'app.calculation', 'app.calculator.repl',
+    'app.expression', 'app.backend', 'decimal', 'fractions',
+)
+
+_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+Setup = Callable[[int], Callable[[], object]]
+
+# name -> (setup, scales with --sizes, operations per run or None for the size)
+BENCHMARKS: Dict[str, Tuple[Setup, bool, Optional[int]]] = {}
+
+
+def benchmark(name: str, sized: bool = False,
+              operations: Optional[int] = None) -> Callable[[Setup], Setup]:
+    def register(setup: Setup) -> Setup:
+        BENCHMARKS[name] = (setup, sized, operations)
+        return setup
+    return register
+
+
+def _operation_benchmark(func: Callable[[float, float], float]) -> Setup:
+    def setup(n: int) -> Callable[[], object]:
+        def run() -> None:
+            for _ in range(n):
+                func(7.5, 2.5)
+        return run
+    return setup
+
+
+for _func in (add, subtract, multiply, divide):
+    benchmark(f"operation.{_func.__name__}")(_operation_benchmark(_func))
+
+
+@benchmark('factory.create')
+def _factory_create(n: int) -> Callable[[], object]:
+    create = CalculationFactory.create
+
+    def run() -> None:
+        for _ in range(n):
+            create('add', 7.5, 2.5)
+    return run
+
+
+@benchmark('factory.evaluate')
+def _factory_evaluate(n: int) -> Callable[[], object]:
+    # Compare with operation.add for the overhead of dispatching by name
+    evaluate = CalculationFactory.evaluate
+
+    def run() -> None:
+        for _ in range(n):
+            evaluate('add', 7.5, 2.5)
+    return run
+
+
+@benchmark('factory.evaluate_id')
+def _factory_evaluate_id(n: int) -> Callable[[], object]:
+    evaluate = CalculationFactory.evaluate
+    add_id = CalculationFactory.operation_id('add')
+
+    def run() -> None:
+        for _ in range(n):
+            evaluate(add_id, 7.5, 2.5)
+    return run
+
+
+@benchmark('calculation.execute')
+def _calculation_execute(n: int) -> Callable[[], object]:
+    execute = CalculationFactory.create('multiply', 7.5, 2.5).execute
+
+    def run() -> None:
+        for _ in range(n):
+            execute()
+    return run
+
+
+@benchmark('calculation.execute_error')
+def _calculation_execute_error(n: int) -> Callable[[], object]:
+    # Division by zero goes through the LBYL check and the EAFP re-wrapping
+    execute = CalculationFactory.create('divide', 7.5, 0).execute
+
+    def run() -> None:
+        for _ in range(n):
+            try:
+                execute()
+            except ValueError:
+                pass
+    return run
+
+
+@benchmark('metrics.create_execute')
+def _metered_create_execute(n: int) -> Callable[[], object]:
+    # Compare with factory.create + calculation.execute for the metrics overhead
+    def run() -> None:
+        enabled = CalculationFactory._metrics is not None
+        CalculationFactory.enable_metrics()
+        create = CalculationFactory.create
+        try:
+            for _ in range(n):
+                create('multiply', 7.5, 2.5).execute()
+        finally:
+            if not enabled:
+                CalculationFactory.disable_metrics()
+    return run
+
+
+@benchmark('cache.shared_get')
+def _shared_cache_get(n: int) -> Callable[[], object]:
+    # One lookup that hits; the price a worker pays instead of recomputing
+    cache = SharedResultCache(1024)
+    # The mapping outlives its name, so nothing is left in /dev/shm
+    cache.unlink()
+    key = ('multiply', 7.5, 2.5)
+    cache.put(key, 18.75)
+    get = cache.get
+
+    def run() -> None:
+        for _ in range(n):
+            get(key)
+    return run
+
+
+@benchmark('batch.divide')
+def _batch_divide(n: int) -> Callable[[], object]:
+    a = array('d', range(1, n + 1)).tobytes()
+    b = array('d', [2.5] * n)
+    return lambda: CalculationFactory.execute_batch('divide', a, b)
+
+
+@benchmark('batch.divide_into')
+def _batch_divide_into(n: int) -> Callable[[], object]:
+    # Same as batch.divide, writing into a preallocated buffer
+    a = array('d', range(1, n + 1)).tobytes()
+    b = array('d', [2.5] * n)
+    out = bytearray(8 * n)
+    return lambda: CalculationFactory.execute_batch('divide', a, b, out=out)
+
+
+def _tolerant_benchmark(policy: Optional[str], zeros: bool) -> Setup:
+    # Every other divisor is zero in the error-heavy variants; compare them
+    # with batch.tolerant.clean, and batch.divide_errors with batch.divide
+    def setup(n: int) -> Callable[[], object]:
+        a = array('d', range(1, n + 1))
+        b = array('d', [0.0, 2.5] * (n // 2) + [2.5] * (n % 2)) if zeros else array('d', [2.5] * n)
+        if policy is None:
+            return lambda: CalculationFactory.execute_batch('divide', a, b)
+        return lambda: CalculationFactory.execute_tolerant('divide', a, b, policy)
+    return setup
+
+
+benchmark('batch.divide_errors')(_tolerant_benchmark(None, True))
+benchmark('batch.tolerant.clean')(_tolerant_benchmark('nan', False))
+for _policy in POLICIES:
+    benchmark(f"batch.tolerant.{_policy}")(_tolerant_benchmark(_policy, True))
+
+
+def _backend_benchmark(name: str) -> Setup:
+    def setup(n: int) -> Callable[[], object]:
+        def run() -> None:
+            previous = CalculationFactory.get_backend()
+            CalculationFactory.set_backend(name)
+            parse = CalculationFactory.get_backend().parse
+            a, b = parse('7' if name == 'int' else '7.5'), parse('3')
+            create = CalculationFactory.create
+            try:
+                for _ in range(n):
+                    create('divide', a, b).execute()
+            finally:
+                CalculationFactory.set_backend(previous.name, getattr(previous, 'precision', None))
+        return run
+    return setup
+
+
+for _backend in ('float', 'decimal', 'fraction', 'int'):
+    benchmark(f"backend.{_backend}")(_backend_benchmark(_backend))
+
+
+def _reduction_benchmark(name: str) -> Setup:
+    def setup(n: int) -> Callable[[], object]:
+        values = array('d', range(n))
+        return lambda: CalculationFactory.reduce(name, values)
+    return setup
+
+
+for _reduction in CalculationFactory.get_available_reductions():
+    benchmark(f"reduction.{_reduction}")(_reduction_benchmark(_reduction))
+
+
+@benchmark('reduction.add_loop')
+def _reduction_add_loop(n: int) -> Callable[[], object]:
+    # Summing with one add calculation per value, for comparison with reduction.sum
+    values = array('d', range(n))
+    create = CalculationFactory.create
+
+    def run() -> None:
+        history = SessionHistory()
+        total = 0.0
+        for value in values:
+            calculation = create('add', total, value)
+            total = calculation.execute()
+            history.add_calculation(calculation)
+        len(history)
+    return run
+
+
+def _filled_history(n: int) -> SessionHistory:
+    history = SessionHistory()
+    calculation = CalculationFactory.create('add', 7.5, 2.5)
+    calculation.execute()
+    for _ in range(n):
+        history.add_calculation(calculation)
+    len(history)
+    return history
+
+
+@benchmark('history.append', sized=True)
+def _history_append(n: int) -> Callable[[], object]:
+    calculation = CalculationFactory.create('add', 7.5, 2.5)
+    calculation.execute()
+
+    def run() -> None:
+        history = SessionHistory()
+        append = history.add_calculation
+        for _ in range(n):
+            append(calculation)
+        # Reading forces pending rows into the store
+        len(history)
+    return run
+
+
+@benchmark('history.copy', sized=True)
+def _history_copy(n: int) -> Callable[[], object]:
+    history = _filled_history(n)
+    return lambda: list(history.get_history())
+
+
+@benchmark('history.str', sized=True)
+def _history_str(n: int) -> Callable[[], object]:
+    history = _filled_history(n)
+    return lambda: str(history)
+
+
+@benchmark('history.tail', sized=True, operations=CALLS)
+def _history_tail(n: int) -> Callable[[], object]:
+    # The REPL's default view of a long history formats 20 rows whatever n is
+    history = _filled_history(n)
+
+    def run() -> None:
+        for _ in range(CALLS):
+            list(history.lines(-20))
+    return run
+
+
+@benchmark('history.rollback', sized=True, operations=CALLS)
+def _history_rollback(n: int) -> Callable[[], object]:
+    # Taking a snapshot before a risky step and rolling back after it cost
+    # the same whatever n is, where copying the history grew with n
+    history = _filled_history(n)
+    calculation = CalculationFactory.create('divide', 1.0, 3.0)
+    calculation.execute()
+
+    def run() -> None:
+        for _ in range(CALLS):
+            snapshot = history.snapshot()
+            history.add_calculation(calculation)
+            history.rollback(snapshot)
+    return run
+
+
+@benchmark('history.undo', sized=True, operations=CALLS)
+def _history_undo(n: int) -> Callable[[], object]:
+    history = _filled_history(n)
+
+    def run() -> None:
+        for _ in range(CALLS):
+            history.undo()
+            history.redo()
+    return run
+
+
+@benchmark('history.copy_after_undos', sized=True)
+def _history_copy_after_undos(n: int) -> Callable[[], object]:
+    # Fixing each typo with undo leaves one run per fix behind; reading the
+    # history must not walk them all for every row
+    history = SessionHistory()
+    calculation = CalculationFactory.create('add', 7.5, 2.5)
+    calculation.execute()
+    for _ in range(n):
+        history.add_calculation(calculation)
+        history.add_calculation(calculation)
+        history.undo()
+    return lambda: list(history.get_history())
+
+
+_scratch: List[tempfile.TemporaryDirectory] = []
+
+
+def _scratch_path(name: str) -> str:
+    # One directory per process, removed when the interpreter exits
+    if not _scratch:
+        _scratch.append(tempfile.TemporaryDirectory(prefix='calculator-bench-'))
+    return os.path.join(_scratch[0].name, name)
+
+
+def _export_benchmark(format: str) -> Setup:
+    def setup(n: int) -> Callable[[], object]:
+        history = _filled_history(n)
+        path = _scratch_path(f"export.{format}")
+        return lambda: history.export(path, format)
+    return setup
+
+
+def _import_benchmark(format: str) -> Setup:
+    # Reads back what export wrote, so it also covers the round trip
+    def setup(n: int) -> Callable[[], object]:
+        path = _scratch_path(f"import.{format}")
+        _filled_history(n).export(path, format)
+        return lambda: SessionHistory().import_(path, format)
+    return setup
+
+
+for _format in ('columnar', 'csv'):
+    benchmark(f"history.export.{_format}", sized=True)(_export_benchmark(_format))
+    benchmark(f"history.import.{_format}", sized=True)(_import_benchmark(_format))
+
+
+@benchmark('history.query', sized=True, operations=CALLS)
+def _history_query(n: int) -> Callable[[], object]:
+    history = SessionHistory()
+    for i in range(n):
+        calculation = CalculationFactory.create(('add', 'multiply')[i % 2], i, 3)
+        calculation.execute()
+        history.add_calculation(calculation)
+    # The first query builds the index; later ones are lookups
+    history.query_positions('op=add')
+
+    def run() -> None:
+        for _ in range(CALLS):
+            history.query_positions('op=multiply result>=300 result<600')
+    return run
+
+
+@benchmark('repl.scripted', sized=True)
+def _repl_scripted(n: int) -> Callable[[], object]:
+    from app.calculator import CalculatorREPL
+
+    script = ['add', '7.5', '2.5'] * n + ['exit']
+
+    def run() -> None:
+        repl = CalculatorREPL()
+        repl.history = SessionHistory()
+        answers = iter(script)
+        original = builtins.input
+        builtins.input = lambda prompt='': next(answers)
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                repl.run()
+        finally:
+            builtins.input = original
+    return run
+
+
+def import_times(args: Sequence[str] = STARTUP_COMMAND) -> List[Tuple[str, int, int]]:
+    """Run ``python -X importtime`` with ``args``; return ``(module, depth, cumulative us)``.
+
+    Imports before the first top-level ``app`` module belong to interpreter
+    startup and are left out.
+    """
+    completed = subprocess.run([sys.executable, '-X', 'importtime', *args], cwd=_ROOT,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+                               universal_newlines=True, check=True)
+    imports: List[Tuple[str, int, int]] = []
+    # A module is reported after the modules it imported
+    nested: List[Tuple[str, int, int]] = []
+    for line in completed.stderr.splitlines():
+        fields = line.split('|')
+        if len(fields) != 3 or not fields[1].strip().isdigit():
+            continue
+        # Each nesting level indents the module name by two more spaces
+        name = fields[2].strip()
+        depth = (len(fields[2]) - len(name) - 1) // 2
+        nested.append((name, depth, int(fields[1])))
+        if depth == 0:
+            if imports or name.split('.')[0] == 'app':
+                imports.extend(nested)
+            nested = []
+    return imports
+
+
+def check_startup(imports: Sequence[Tuple[str, int, int]], budget_us: int = STARTUP_BUDGET_US,
+                  forbidden: Sequence[str] = STARTUP_FORBIDDEN) -> List[str]:
+    """Return one message per way ``imports`` breaks the startup budget."""
+    problems = [f"imports {name}" for name, _, _ in imports if name in forbidden]
+    total = sum(us for _, depth, us in imports if depth == 0)
+    if total > budget_us:
+        problems.append(f"spends {total:,} us importing, over the {budget_us:,} us budget")
+    return problems
+
+
+def measure(setup: Setup, n: int, repeat: int = 3, operations: Optional[int] = None) -> float:
+    """Return the best wall time per operation in nanoseconds.
+
+    A run performs ``n`` operations unless ``operations`` says otherwise.
+    """
+    run = setup(n)
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        run()
+        best = min(best, time.perf_counter() - started)
+    return best / (operations or n) * 1e9
+
+
+def run_suite(pattern: str = '', sizes: Tuple[int, ...] = DEFAULT_SIZES,
+              repeat: int = 3, iterations: int = ITERATIONS,
+              report: Optional[Callable[[str, float], None]] = None) -> Dict[str, float]:
+    """Run every benchmark whose name contains ``pattern``; return ns per op."""
+    results: Dict[str, float] = {}
+    for name, (setup, sized, operations) in BENCHMARKS.items():
+        if pattern not in name:
+            continue
+        for n in (sizes if sized else (iterations,)):
+            key = f"{name}[{n}]" if sized else name
+            results[key] = measure(setup, n, repeat, operations)
+            if report is not None:
+                report(key, results[key])
+    return results
+
+
+def save_baseline(results: Dict[str, float], path: str) -> None:
+    document = {
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'unit': 'ns/op',
+        'results': results,
+    }
+    with open(path, 'w') as handle:
+        json.dump(document, handle, indent=2, sort_keys=True)
+        handle.write('\n')
+
+
+def load_baseline(path: str) -> Dict[str, float]:
+    with open(path) as handle:
+        return json.load(handle)['results']
+
+
+def compare(results: Dict[str, float], baseline: Dict[str, float],
+            threshold: float = 0.10) -> List[Tuple[str, float, float, float]]:
+    """Return ``(name, baseline, current, change)`` for every regression.
+
+    A benchmark regresses when it is slower than its baseline by more than
+    ``threshold`` (a fraction; 0.10 means 10%). Benchmarks missing from the
+    baseline are ignored.
+    """
+    regressions = []
+    for name, current in results.items():
+        previous = baseline.get(name)
+        if previous is None:
+            continue
+        change = current / previous - 1
+        if change > threshold:
+            regressions.append((name, previous, current, change))
+    return regressions
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Entry point for the benchmark runner."""
+    parser = argparse.ArgumentParser(prog='python -m app.bench')
+    parser.add_argument('-k', '--filter', default='', metavar='SUBSTRING',
+                        help='only run benchmarks whose name contains SUBSTRING')
+    parser.add_argument('--sizes', type=int, nargs='+', metavar='N',
+                        help=f"history sizes (default: {' '.join(map(str, DEFAULT_SIZES))})")
+    parser.add_argument('--full', action='store_true',
+                        help=f"use history sizes {FULL_SIZES[0]:.0e} to {FULL_SIZES[-1]:.0e}")
+    parser.add_argument('--iterations', type=int, default=ITERATIONS,
+                        help='operations per run for size-independent benchmarks')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--save', nargs='?', const=DEFAULT_BASELINE, metavar='PATH',
+                        help=f"write results as a baseline (default: {DEFAULT_BASELINE})")
+    parser.add_argument('--compare', nargs='?', const=DEFAULT_BASELINE, metavar='PATH',
+                        help='compare against a baseline and fail on regressions')
+    parser.add_argument('--threshold', type=float, default=0.10,
+                        help='allowed slowdown before a regression is flagged (default: 0.10)')
+    parser.add_argument('--list', action='store_true', help='list benchmark names and exit')
+    parser.add_argument('--startup', action='store_true',
+                        help=f"check the imports of 'python {' '.join(STARTUP_COMMAND)}' instead")
+    parser.add_argument('--startup-budget', type=int, default=STARTUP_BUDGET_US, metavar='US',
+                        help=f"allowed one-shot import time in microseconds (default: {STARTUP_BUDGET_US})")
+    args = parser.parse_args(argv)
+
+    if args.startup:
+        imports = import_times()
+        for name, depth, us in imports:
+            if depth == 0:
+                print(f"{name:<36} {us:>14,} us")
+        print(f"{'total':<36} {sum(us for _, depth, us in imports if depth == 0):>14,} us"
+              f"   (budget {args.startup_budget:,} us)")
+        problems = check_startup(imports, args.startup_budget)
+        if problems:
+            print(f"\nOne-shot startup {', '.join(problems)}.")
+            return 1
+        print("\nOne-shot startup is within budget.")
+        return 0
+
+    if args.list:
+        for name, (_, sized, _) in BENCHMARKS.items():
+            print(f"{name}{'[size]' if sized else ''}")
+        return 0
+
+    sizes = tuple(args.sizes) if args.sizes else FULL_SIZES if args.full else DEFAULT_SIZES
+    baseline = load_baseline(args.compare) if args.compare else {}
+
+    def report(name: str, ns: float) -> None:
+        line = f"{name:<36} {ns:>14,.1f} ns/op"
+        if name in baseline:
+            line += f"   {ns / baseline[name] - 1:>+8.1%} vs baseline"
+        print(line)
+
+    results = run_suite(args.filter, sizes, args.repeat, args.iterations, report)
+    if args.save:
+        save_baseline(results, args.save)
+        print(f"\nBaseline written to {args.save}")
+    if args.compare:
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) over {args.threshold:.0%}:")
+            for name, previous, current, change in regressions:
+                print(f"  {name}: {previous:,.1f} -> {current:,.1f} ns/op ({change:+.1%})")
+            return 1
+        print(f"\nNo regressions over {args.threshold:.0%}.")
+    return 0
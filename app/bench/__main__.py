@@ -0,0 +1,10 @@
+"""
+Entry point for running the benchmark suite as a module.
+"""
+
+import sys  # pragma: no cover
+
+from app.bench import main  # pragma: no cover
+
+if __name__ == "__main__":  # pragma: no cover
+    sys.exit(main())  # pragma: no cover
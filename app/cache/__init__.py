@@ -0,0 +1,304 @@
+"""
+Result cache module.
+
+This module provides a bounded LRU cache for calculation results keyed by
+operation name and operands, with optional time-to-live expiry, and a
+fixed-size cache in shared memory that several processes read and write.
+"""
+
+import copy
+import functools
+import struct
+import sys
+import time
+import zlib
+from collections import OrderedDict
+from typing import Callable, Dict, Hashable, Iterator, Optional, Tuple
+
+# Returned by ResultCache.get when a key is absent or expired
+MISSING = object()
+
+
+class ResultCache:
+
+    def __init__(self, maxsize: int = 1024, ttl: Optional[float] = None,
+                 clock: Callable[[], float] = time.monotonic):
+        if maxsize < 1:
+            raise ValueError("Cache size must be at least 1")
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._clock = clock
+        self._entries: 'OrderedDict[Hashable, Tuple[object, float]]' = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key: Hashable) -> object:
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return MISSING
+        value, expires = entry
+        if self.ttl is not None and self._clock() >= expires:
+            del self._entries[key]
+            self.expirations += 1
+            self.misses += 1
+            return MISSING
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key: Hashable, value: object) -> None:
+        expires = self._clock() + self.ttl if self.ttl is not None else 0.0
+        self._entries[key] = (value, expires)
+        self._entries.move_to_end(key)
+        if len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, operation_name: str) -> None:
+        # Keys start with the operation name; replacing an operation is rare
+        stale = [key for key in self._entries if key[0] == operation_name]  # type: ignore[index]
+        for key in stale:
+            del self._entries[key]
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def stats(self) -> Dict[str, Optional[float]]:
+        lookups = self.hits + self.misses
+        return {
+            'size': len(self._entries),
+            'maxsize': self.maxsize,
+            'ttl': self.ttl,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'evictions': self.evictions,
+            'expirations': self.expirations,
+        }
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+# Shared cache layout: a header, then fixed-size slots. A slot is the key
+# (generation, operation tag, namespace tag, operand kinds, a, b), the
+# result kind and value, and a CRC32 of everything before it.
+SHARED_MAGIC = b'CALCSHM1'
+_SHARED_HEADER = struct.Struct('<8sIII')
+_GENERATION = struct.Struct('<I')
+_GENERATION_OFFSET = 16
+_KEY = struct.Struct('<IIIIdd')
+_SLOT = struct.Struct('<IIIIddIdI')
+_VALUE = struct.Struct('<Id')
+_CHECKED = _SLOT.size - 4
+# Operand and result kinds; other types are never shared
+_FLOAT, _INT = 1, 2
+
+
+def _kind(value: object) -> int:
+    """Return the kind a value is shared as, or 0 if it cannot round-trip a double."""
+    kind = type(value)
+    if kind is float:
+        return _FLOAT
+    if kind is int:
+        # Large ints would collide with their rounded neighbours
+        try:
+            return _INT if int(float(value)) == value else 0  # type: ignore[arg-type]
+        except OverflowError:
+            return 0
+    return 0
+
+
+@functools.lru_cache(maxsize=1024)
+def _tag(name: str) -> int:
+    # A stable hash: str hashes differ between processes
+    return zlib.crc32(name.encode())
+
+
+class SharedResultCache:
+    """Calculation results shared by every process attached to one memory block.
+
+    The block is a fixed-size open-addressing table, so memory stays bounded:
+    a key probes ``probe`` slots from its hash and, when all of them hold
+    other keys, replaces the first. Only int and float operands and results
+    are shared.
+
+    Writes take no lock. A writer copies a whole slot at once and readers
+    check its CRC, so a slot torn by two concurrent writers reads as a miss
+    rather than as a wrong result. Processes sharing a cache must register
+    the same functions under the same operation names.
+
+    Keys also hold a ``namespace``, which CalculationFactory sets to its
+    numeric backend, so processes on different backends share one block
+    without reading each other's results.
+
+    Hit, miss and eviction counters are kept per process.
+    """
+
+    def __init__(self, slots: int = 65536, name: Optional[str] = None, probe: int = 4,
+                 namespace: str = '', _attach: bool = False):
+        """Create a block of ``slots`` slots, named ``name`` if given.
+
+        Use :meth:`attach` to open a block another process created.
+        """
+        # Deferred: multiprocessing would slow every import of the calculator
+        from multiprocessing import resource_tracker, shared_memory
+        if _attach:
+            if sys.version_info >= (3, 13):  # pragma: no cover
+                memory = shared_memory.SharedMemory(name, track=False)
+            else:
+                memory = shared_memory.SharedMemory(name)
+                # Only the creator may unlink the block when it exits
+                resource_tracker.unregister(memory._name, 'shared_memory')  # type: ignore[attr-defined]
+            try:
+                magic, slots, probe, _ = _SHARED_HEADER.unpack_from(memory.buf)
+            except struct.error:
+                magic = None
+            if magic != SHARED_MAGIC:
+                memory.close()
+                raise ValueError(f"Not a shared result cache: {name}")
+        else:
+            if slots < 1:
+                raise ValueError("Cache size must be at least 1")
+            if not 1 <= probe <= slots:
+                raise ValueError("Probe length must be between 1 and the cache size")
+            memory = shared_memory.SharedMemory(
+                name, create=True, size=_SHARED_HEADER.size + slots * _SLOT.size)
+            # Zeroed slots are generation 0, which is never current
+            _SHARED_HEADER.pack_into(memory.buf, 0, SHARED_MAGIC, slots, probe, 1)
+        self._memory = memory
+        self._buf = memory.buf
+        self._owner = not _attach
+        self.name: str = memory.name
+        self.maxsize = slots
+        self.probe = probe
+        self.namespace = namespace
+        self.ttl = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @classmethod
+    def attach(cls, name: str, namespace: str = '') -> 'SharedResultCache':
+        """Open the shared cache ``name`` created by another process."""
+        return cls(name=name, namespace=namespace, _attach=True)
+
+    def namespaced(self, namespace: str) -> 'SharedResultCache':
+        """Return a handle on the same mapping that keys results by ``namespace``.
+
+        The handle counts its own hits and misses; close only the original.
+        """
+        handle = copy.copy(self)
+        handle.namespace = namespace
+        handle.hits = handle.misses = handle.evictions = 0
+        return handle
+
+    def __reduce__(self) -> Tuple[Callable[[str, str], 'SharedResultCache'], Tuple[str, str]]:
+        # Worker processes attach to the same block instead of copying it
+        return (SharedResultCache.attach, (self.name, self.namespace))
+
+    def _key(self, key: Hashable) -> Optional[bytes]:
+        name, a, b = key[0], key[1], key[2]  # type: ignore[index]
+        kind_a, kind_b = _kind(a), _kind(b)
+        if not (kind_a and kind_b):
+            return None
+        generation = _GENERATION.unpack_from(self._buf, _GENERATION_OFFSET)[0]
+        return _KEY.pack(generation, _tag(name), _tag(self.namespace), kind_a | kind_b << 2, a, b)
+
+    def _slots(self, packed: bytes) -> range:
+        # The generation is left out so a clear does not move keys
+        home = zlib.crc32(packed[4:]) % self.maxsize
+        start = _SHARED_HEADER.size + home * _SLOT.size
+        stop = _SHARED_HEADER.size + (home + self.probe) * _SLOT.size
+        return range(start, stop, _SLOT.size)
+
+    def _offset(self, offset: int) -> int:
+        # Probes run past the last slot back to the first
+        return offset - self.maxsize * _SLOT.size if offset >= len(self._buf) else offset
+
+    def _read(self, offset: int) -> Optional[bytes]:
+        """Return the slot at ``offset`` if it is intact, copied in one go."""
+        raw = self._buf[offset:offset + _SLOT.size].tobytes()
+        if zlib.crc32(raw[:_CHECKED]) != int.from_bytes(raw[_CHECKED:], 'little'):
+            return None
+        return raw
+
+    def get(self, key: Hashable) -> object:
+        packed = self._key(key)
+        if packed is not None:
+            for offset in self._slots(packed):
+                raw = self._read(self._offset(offset))
+                if raw is not None and raw[:_KEY.size] == packed:
+                    kind, value = _VALUE.unpack_from(raw, _KEY.size)
+                    self.hits += 1
+                    return int(value) if kind == _INT else value
+        self.misses += 1
+        return MISSING
+
+    def put(self, key: Hashable, value: object) -> None:
+        packed = self._key(key)
+        kind = _kind(value)
+        if packed is None or not kind:
+            return
+        generation = packed[:4]
+        target = None
+        for offset in self._slots(packed):
+            offset = self._offset(offset)
+            raw = self._read(offset)
+            if raw is None or raw[:4] != generation or raw[:_KEY.size] == packed:
+                target = offset
+                break
+        if target is None:
+            target = self._offset(self._slots(packed)[0])
+            self.evictions += 1
+        slot = packed + _VALUE.pack(kind, value)
+        self._buf[target:target + _SLOT.size] = slot + zlib.crc32(slot).to_bytes(4, 'little')
+
+    def _live(self) -> Iterator[Tuple[int, int]]:
+        """Yield the offset and operation tag of every current, intact slot."""
+        generation = _GENERATION.unpack_from(self._buf, _GENERATION_OFFSET)[0]
+        for offset in range(_SHARED_HEADER.size, len(self._buf), _SLOT.size):
+            if _GENERATION.unpack_from(self._buf, offset)[0] == generation:
+                raw = self._read(offset)
+                if raw is not None:
+                    yield offset, _SLOT.unpack(raw)[1]
+
+    def invalidate(self, operation_name: str) -> None:
+        # In every namespace: the operation is replaced whatever the backend
+        tag = _tag(operation_name)
+        for offset, slot_tag in list(self._live()):
+            if slot_tag == tag:
+                self._buf[offset:offset + _SLOT.size] = bytes(_SLOT.size)
+
+    def clear(self) -> None:
+        # Moving to a new generation empties every slot at once
+        generation = _GENERATION.unpack_from(self._buf, _GENERATION_OFFSET)[0]
+        _GENERATION.pack_into(self._buf, _GENERATION_OFFSET, generation % 0xFFFFFFFF + 1)
+
+    def stats(self) -> Dict[str, Optional[float]]:
+        lookups = self.hits + self.misses
+        return {
+            'size': len(self),
+            'maxsize': self.maxsize,
+            'ttl': self.ttl,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'evictions': self.evictions,
+            'expirations': 0,
+        }
+
+    def close(self) -> None:
+        """Detach this process; the block lives on for the others."""
+        self._buf = None  # type: ignore[assignment]
+        self._memory.close()
+
+    def unlink(self) -> None:
+        """Free the block once every process has closed it."""
+        self._memory.unlink()
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self._live())
@@ -5,11 +5,42 @@ This module implements the Calculation class, CalculationHistory, and Calculatio
 Demonstrates the Factory design pattern, Singleton pattern, and history management.
 """
 
-from typing import Callable, List, Optional
+import bisect
+import itertools
+import operator
+import threading
+import time
+from array import array
+from collections import deque
+from collections.abc import Sequence
+from typing import Callable, Deque, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+from app.backend import FloatBackend, NumericBackend, get_backend
+from app.batch import POLICIES, BatchResult, evaluate as evaluate_tolerant
+from app.cache import MISSING, ResultCache, SharedResultCache
+from app.metrics import Metrics, OperationMetrics
+from app.query import Condition, HistoryIndex, parse_query
+from app.reduction import REDUCTIONS
 from app.operation import add, subtract, multiply, divide
+from app.storage import (
+    BOXED, NO_RESULT, ColumnarStore, DropOldest, EvictionPolicy, MappedLogStore, RingStore,
+    empty_columns, pack, read_columns, unpack, write_columns,
+)
+
+# Display symbols of the built-in operations; other operations show their name
+OPERATION_SYMBOLS = {
+    'add': '+',
+    'subtract': '-',
+    'multiply': '×',
+    'divide': '÷'
+}
 
 
 class Calculation:
+    # Set by CalculationFactory on the calculations it creates while caching is on
+    _cache: Optional[Union[ResultCache, SharedResultCache]] = None
+    # (result, text) once an executed calculation has been formatted
+    _text: Optional[Tuple[float, str]] = None
+    
     def __init__(self, operation_name: str, operand_a: float, operand_b: float, 
                  operation_func: Callable[[float, float], float]):
         self.operation_name = operation_name
@@ -19,68 +50,777 @@ class Calculation:
         self._result: Optional[float] = None
     
     def execute(self) -> float:
+        cache = self._cache
+        if cache is not None:
+            # Types are part of the key so 1 and 1.0 keep distinct results
+            key = (self.operation_name, self.operand_a, self.operand_b,
+                   type(self.operand_a), type(self.operand_b))
+            cached = cache.get(key)
+            if cached is not MISSING:
+                self._result = cached  # type: ignore[assignment]
+                return cached  # type: ignore[return-value]
+        
         # EAFP approach - Easier to Ask Forgiveness than Permission
         try:
             self._result = self.operation_func(self.operand_a, self.operand_b)
-            return self._result
         except (ValueError, ZeroDivisionError) as e:
             raise ValueError(f"Calculation failed: {e}")
+        
+        if cache is not None:
+            cache.put(key, self._result)
+        return self._result
     
     def get_result(self) -> Optional[float]:
         return self._result
     
     def __str__(self) -> str:
-        symbols = {
-            'add': '+',
-            'subtract': '-',
-            'multiply': '×',
-            'divide': '÷'
-        }
-        symbol = symbols.get(self.operation_name, self.operation_name)
-        
-        if self._result is not None:
-            return f"{self.operand_a} {symbol} {self.operand_b} = {self._result}"
-        return f"{self.operand_a} {symbol} {self.operand_b}"
+        result = self._result
+        # Executed calculations do not change, so their text is built once;
+        # the result is compared by identity in case it is assigned again
+        cached = self._text
+        if cached is not None and cached[0] is result:
+            return cached[1]
+        
+        symbol = OPERATION_SYMBOLS.get(self.operation_name, self.operation_name)
+        if result is None:
+            return f"{self.operand_a} {symbol} {self.operand_b}"
+        text = f"{self.operand_a} {symbol} {self.operand_b} = {result}"
+        self._text = (result, text)
+        return text
     
     def __repr__(self) -> str:
         return f"Calculation({self.operation_name}, {self.operand_a}, {self.operand_b})"
+    
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, Calculation):
+            return NotImplemented
+        return (
+            self.operation_name == other.operation_name
+            and self.operand_a == other.operand_a
+            and self.operand_b == other.operand_b
+            and self._result == other._result
+        )
+    
+    def __hash__(self) -> int:
+        return hash((self.operation_name, self.operand_a, self.operand_b))
+
+
+class MeteredCalculation(Calculation):
+    """A Calculation that reports calls, errors and latency to its operation's metrics.
+    
+    CalculationFactory only creates these while metrics are enabled, so plain
+    calculations pay nothing for instrumentation.
+    """
+    
+    # Set by CalculationFactory right after creation
+    _metrics: OperationMetrics
+    
+    def execute(self) -> float:
+        started = time.perf_counter_ns()
+        try:
+            return Calculation.execute(self)
+        except ValueError:
+            self._metrics.errors += 1
+            raise
+        finally:
+            self._metrics.execute_latency.record(time.perf_counter_ns() - started)
+
+
+class Reduction(Calculation):
+    """An aggregate such as ``sum`` over a stream of values.
+    
+    ``operand_a`` holds how many values were reduced and ``operand_b`` is
+    unused, so a reduction takes one history row however long its input.
+    """
+    
+    def __init__(self, operation_name: str, values: Optional[Iterable[object]],
+                 reducer: Callable[..., Tuple[int, object]], operations=None):
+        super().__init__(operation_name, 0, 0, reducer)  # type: ignore[arg-type]
+        self._values = values
+        self._operations = operations
+    
+    def execute(self) -> float:
+        # A stream can only be read once; afterwards the result stands
+        values, self._values = self._values, None
+        if values is None:
+            return self._result  # type: ignore[return-value]
+        # EAFP approach - same wrapping as Calculation.execute
+        try:
+            self.operand_a, self._result = self.operation_func(values, self._operations)  # type: ignore[call-arg]
+        except (ValueError, ZeroDivisionError, OverflowError) as e:
+            # math.fsum raises OverflowError when a partial sum leaves the float range
+            raise ValueError(f"Calculation failed: {e}")
+        return self._result  # type: ignore[return-value]
+    
+    def __str__(self) -> str:
+        if self._values is not None:
+            return f"{self.operation_name} of a stream"
+        return f"{self.operation_name} of {self.operand_a} values = {self._result}"
+    
+    def __repr__(self) -> str:
+        return f"Reduction({self.operation_name}, {self.operand_a})"
+
+
+class HistorySnapshot:
+    """An immutable state of a history, taken and restored in O(1).
+    
+    Stores are append-only, so a state is a store plus which of its rows are
+    visible: runs of consecutive rows, each linked to the runs before it.
+    Undo shortens the last run and adding after an undo starts a new run
+    that shares all earlier ones - a persistent linked list - so no change
+    of state copies rows. Lookups in the last run are O(1); others bisect a
+    table of run starts built once per state, so reads stay O(log runs)
+    however many undos left runs behind.
+    """
+    
+    __slots__ = ('owner', 'store', 'run', 'length', '_table')
+    
+    def __init__(self, owner: object, store, run: Optional[tuple], length: int):
+        self.owner = owner
+        self.store = store
+        # (previous run, position of its first row, sequence of its first row)
+        self.run = run
+        self.length = length
+        # (positions, sequences) of the first row of every run, oldest first
+        self._table: Optional[Tuple[List[int], List[int]]] = None
+    
+    @classmethod
+    def whole(cls, owner: object, store) -> 'HistorySnapshot':
+        """Return the state in which every row of ``store`` is visible."""
+        length = store.offset + len(store)
+        return cls(owner, store, (None, 0, 0) if length else None, length)
+    
+    def covers(self, store) -> bool:
+        """Whether this is the state in which every row of ``store`` is visible."""
+        run = self.run
+        return (self.store is store and self.length == store.offset + len(store)
+                and (run is None or run[0] is None and run[2] == 0))
+    
+    def _starts(self) -> Tuple[List[int], List[int]]:
+        table = self._table
+        if table is None:
+            spans = self._spans()
+            table = self._table = ([position for _, position, _ in spans],
+                                   [first for first, _, _ in spans])
+        return table
+    
+    def sequence(self, position: int) -> int:
+        run = self.run
+        if position >= run[1]:
+            return run[2] + position - run[1]
+        positions, firsts = self._starts()
+        i = bisect.bisect_right(positions, position) - 1
+        return firsts[i] + position - positions[i]
+    
+    def visible_before(self, sequence: int) -> int:
+        """Return how many visible rows come before row ``sequence`` of the store."""
+        if self.run is None:
+            return 0
+        positions, firsts = self._starts()
+        # Sequences grow with positions, so every run before the last one
+        # that starts below ``sequence`` counts in full
+        i = bisect.bisect_left(firsts, sequence) - 1
+        if i < 0:
+            return 0
+        position = positions[i]
+        stop = positions[i + 1] if i + 1 < len(positions) else self.length
+        return position + min(sequence - firsts[i], stop - position)
+    
+    def _spans(self) -> List[Tuple[int, int, int]]:
+        """Return ``(sequence, position, count)`` of every run, oldest first."""
+        spans = []
+        run, stop = self.run, self.length
+        while run is not None:
+            spans.append((run[2], run[1], stop - run[1]))
+            run, stop = run[0], run[1]
+        spans.reverse()
+        return spans
+    
+    def ranges(self, offset: int) -> Iterator[Tuple[int, int]]:
+        """Yield ``(sequence, count)`` of the visible store rows from ``offset`` on."""
+        for first, _, count in self._spans():
+            if first + count > offset:
+                start = max(first, offset)
+                yield start, first + count - start
+    
+    def locate(self, sequences: Iterable[int]) -> Iterator[Tuple[int, int]]:
+        """Yield ``(sequence, position)`` for the visible ones of ascending ``sequences``."""
+        spans = self._spans()
+        firsts = [first for first, _, _ in spans]
+        for sequence in sequences:
+            i = bisect.bisect_right(firsts, sequence) - 1
+            if i >= 0:
+                first, position, count = spans[i]
+                if sequence < first + count:
+                    yield sequence, position + sequence - first
+    
+    def truncated(self, length: int) -> 'HistorySnapshot':
+        run = self.run
+        while run is not None and length <= run[1]:
+            run = run[0]
+        return HistorySnapshot(self.owner, self.store, run, length)
+    
+    def extended(self, sequence: int, count: int) -> 'HistorySnapshot':
+        """Return this state followed by ``count`` store rows from ``sequence`` on."""
+        run, length = self.run, self.length
+        if run is None or run[2] + length - run[1] != sequence:
+            run = (run, length, sequence)
+        return HistorySnapshot(self.owner, self.store, run, length + count)
+    
+    def __len__(self) -> int:
+        return self.length
+    
+    def __repr__(self) -> str:
+        return f"HistorySnapshot({self.length} calculations)"
+
+
+class HistoryView(Sequence):
+    """Read-only window over history rows; Calculation objects are built on access."""
+    
+    def __init__(self, history: 'CalculationHistory', store, start: int, stop: int,
+                 snapshot: Optional[HistorySnapshot] = None):
+        self._history = history
+        self._store = store
+        # Positions map to store rows through the snapshot, if there is one
+        self._snapshot = snapshot
+        self._start = start
+        self._stop = stop
+    
+    def __len__(self) -> int:
+        return self._stop - self._start
+    
+    def __getitem__(self, index: Union[int, slice]):  # type: ignore[override]
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("history index out of range")
+        index += self._start
+        if self._snapshot is not None:
+            index = self._snapshot.sequence(index)
+        return self._history._materialize(self._store, index)
+    
+    def __iter__(self) -> Iterator['Calculation']:
+        # Evicted rows raise EvictedError rather than ending iteration early
+        for index in range(len(self)):
+            yield self[index]
+    
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, Sequence):
+            return NotImplemented
+        return len(self) == len(other) and all(a == b for a, b in zip(self, other))
+    
+    def __repr__(self) -> str:
+        return f"HistoryView({len(self)} calculations)"
+
+
+# Fields of one row in a shard: sequence number, opcode table, opcode,
+# flags, a, b, result and the boxed calculation or None
+_ROW = 8
 
 
 class CalculationHistory:
     
     _instance: Optional['CalculationHistory'] = None
+    _instance_lock = threading.Lock()
+    
+    # Rows a thread may buffer before it folds its shard into the store itself
+    merge_threshold = 4096
+    # Clears and rollbacks that can be undone; each may keep a store alive
+    undo_limit = 100
+    # Bytes the stores kept alive only by undo, redo and checkpoints may hold;
+    # the oldest are forgotten beyond it. None for no bound
+    retained_limit: Optional[int] = None
     
     def __new__(cls):
+        # Double-checked locking: the lock is only taken until the instance exists
         if cls._instance is None:
-            cls._instance = super().__new__(cls)
-            cls._instance.history: List[Calculation] = [] # type: ignore
+            with cls._instance_lock:
+                if cls._instance is None:
+                    instance = super().__new__(cls)
+                    instance._init_storage()
+                    cls._instance = instance
         return cls._instance
     
+    def _init_storage(self) -> None:
+        self._store = ColumnarStore()
+        self._lock = threading.RLock()
+        # Every writer thread appends to its own shard; readers merge them lazily
+        self._local = threading.local()
+        self._shards: List[Tuple[threading.Thread, List[object]]] = []
+        self._sequence = itertools.count()
+        # Built by the first query, then kept up to date as rows are merged
+        self._index: Optional[HistoryIndex] = None
+        # The visible state; None while it is every row of the store, so
+        # appends cost nothing extra until undo or rollback is used
+        self._version: Optional[HistorySnapshot] = None
+        # Entries are (length after the change, state before it)
+        self._undo: Deque[Tuple[int, HistorySnapshot]] = deque(maxlen=self.undo_limit)
+        self._redo: List[Tuple[HistorySnapshot, Optional[Tuple[int, HistorySnapshot]]]] = []
+        self._checkpoints: Dict[str, HistorySnapshot] = {}
+        self._owner = object()
+    
     def add_calculation(self, calculation: Calculation) -> None:
-        self.history.append(calculation)
+        flags, a, b, result = pack(
+            calculation.operand_a, calculation.operand_b, calculation.get_result()
+        )
+        # The opcode is reserved here, so a full opcode table fails this call
+        # rather than a later read; only a name new to the table takes the lock
+        operations = self._store.operations
+        try:
+            opcode = operations.codes[calculation.operation_name]
+        except KeyError:
+            with self._lock:
+                opcode = operations.code(calculation.operation_name)
+        try:
+            shard = self._local.shard
+        except AttributeError:
+            shard = self._register_shard()
+        # next() on a counter and extending a list by a tuple are atomic, so
+        # writers never wait on each other or on readers. Rows lie flat in
+        # the shard, so a merge splits them into columns by slicing
+        shard += (
+            next(self._sequence), operations, opcode, flags, a, b, result,
+            calculation if flags & BOXED else None,
+        )
+        if len(shard) >= self.merge_threshold * _ROW and self._lock.acquire(blocking=False):
+            try:
+                self._merge()
+            finally:
+                self._lock.release()
+    
+    def _register_shard(self) -> List[object]:
+        shard: List[object] = []
+        with self._lock:
+            self._shards.append((threading.current_thread(), shard))
+        self._local.shard = shard
+        return shard
+    
+    def _drain(self) -> List[Tuple[List[object], List[object]]]:
+        drained = []
+        for _, shard in self._shards:
+            # Only this many fields are taken; copying and deleting a slice are
+            # each atomic, so rows appended meanwhile wait for the next merge
+            pending = len(shard)
+            if pending:
+                drained.append((shard, shard[:pending]))
+                del shard[:pending]
+        return drained
+    
+    def _release_shards(self) -> None:
+        # Shards of finished threads can go once they are empty
+        self._shards = [(thread, shard) for thread, shard in self._shards
+                        if shard or thread.is_alive()]
+    
+    def _merge(self):
+        """Fold pending rows of every shard into the store in append order."""
+        with self._lock:
+            store = self._store
+            drained = self._drain()
+            if not drained:
+                self._release_shards()
+                return store
+            if len(drained) == 1:
+                fields = drained[0][1]
+            else:
+                fields = list(itertools.chain.from_iterable(rows for _, rows in drained))
+            count = len(fields) // _ROW
+            sequences, tables, opcodes, flags, a, b, results, boxed = (
+                fields[column::_ROW] for column in range(_ROW))
+            if len(drained) > 1:
+                # Each shard is already ordered, so timsort merges the runs;
+                # two or more rows make itemgetter return a tuple
+                reorder = operator.itemgetter(*sorted(range(count), key=sequences.__getitem__))
+                tables, opcodes, flags, a, b, results, boxed = map(
+                    reorder, (tables, opcodes, flags, a, b, results, boxed))
+            operations = store.operations
+            # Opcodes reserved in a table the store no longer uses are encoded
+            # again; nothing is appended unless every row can be
+            if tables.count(operations) != count:
+                try:
+                    opcodes = [opcode if table is operations
+                               else operations.code(table.names[opcode])
+                               for table, opcode in zip(tables, opcodes)]
+                except ValueError:
+                    for shard, rows in drained:
+                        shard[:0] = rows
+                    raise
+            self._release_shards()
+            # Rows are indexed by store position, which the counter only
+            # matches until the first clear
+            first = store.offset + len(store)
+            if boxed.count(None) == count:
+                store.extend((array('B', opcodes), array('B', flags), array('d', a),
+                              array('d', b), array('d', results)))
+            else:
+                for row in zip(opcodes, flags, a, b, results, boxed):
+                    store.append(*row)
+            self._appended(first, count)
+            index = self._index
+            if index is not None:
+                # Entries of evicted rows pile up in a bounded store; once
+                # they outnumber live rows, rebuild on the next query instead
+                if index.rows > 2 * len(store) + self.merge_threshold:
+                    self._index = None
+                else:
+                    add = index.add
+                    names = operations.names
+                    for sequence, opcode, flag, x, y, result in zip(
+                            itertools.count(first), opcodes, flags, a, b, results):
+                        add(sequence, names[opcode], x, y, result, flag & BOXED)
+            return store
+    
+    def _appended(self, first: int, count: int) -> None:
+        if self._version is not None:
+            self._version = self._version.extended(first, count)
+        # New calculations discard what could be redone
+        self._redo.clear()
+    
+    def export(self, path: str, format: Optional[str] = None) -> int:
+        """Write the history to the file at ``path`` in bulk; return the number of rows.
+        
+        ``format`` is ``'columnar'``, a compact binary file holding each column
+        as one block, or ``'csv'`` with the header ``operation,a,b,result``; a
+        ``.csv`` suffix selects CSV and anything else columnar. Values that
+        float64 cannot hold exactly, such as Decimal results, are written as
+        their float approximation, as in a history log.
+        """
+        with self._lock:
+            store = self._merge()
+            version = self._version
+            if version is None:
+                columns = store.columns(store.offset, store.offset + len(store))
+            else:
+                columns = empty_columns()
+                for first, count in version.ranges(store.offset):
+                    for column, values in zip(columns, store.columns(first, first + count)):
+                        column.extend(values)
+            names = list(store.operations.names)
+        write_columns(path, names, columns, format)
+        return len(columns[0])
     
-    def get_history(self) -> List[Calculation]:
-        return self.history.copy()
+    def import_(self, path: str, format: Optional[str] = None) -> int:
+        """Append the calculations in a file written by :meth:`export`; return how many.
+        
+        Rows are decoded and appended a column at a time, and :meth:`undo`
+        removes them one by one.
+        """
+        names, columns = read_columns(path, format)
+        with self._lock:
+            store = self._merge()
+            code = store.operations.code
+            # Map the file's opcodes onto this store's in one pass over the bytes
+            table = bytes(code(name) for name in names).ljust(256, b'\0')
+            opcodes = array('B', columns[0].tobytes().translate(table))
+            first = store.offset + len(store)
+            store.extend((opcodes,) + columns[1:])  # type: ignore[arg-type]
+            count = len(opcodes)
+            if count:
+                self._appended(first, count)
+                self._index = None
+        return count
+    
+    def get_history(self) -> HistoryView:
+        # O(1) view: rows keep their sequence number and clear_history swaps stores
+        with self._lock:
+            store = self._merge()
+            version = self._version
+        start = store.offset
+        if version is None:
+            return HistoryView(self, store, start, start + len(store))
+        # Rows evicted from a bounded store drop out of the front
+        return HistoryView(self, store, version.visible_before(start), len(version), version)
     
     def clear_history(self) -> None:
-        self.history.clear()
+        """Remove every calculation; :meth:`undo` brings them back.
+        
+        A history log or spill segment is truncated in place, so clearing a
+        history that uses one cannot be undone.
+        """
+        with self._lock:
+            store = self._merge()
+            if store.clears_in_place:
+                self._reset_versions()
+            else:
+                self._undo.append((0, self._snapshot(store)))
+                self._redo.clear()
+            self._store = store.cleared()
+            self._index = None
+            self._version = None
+            self._limit_retained()
+    
+    def _snapshot(self, store) -> HistorySnapshot:
+        version = self._version
+        return version if version is not None else HistorySnapshot.whole(self._owner, store)
+    
+    def _switch(self, snapshot: HistorySnapshot) -> None:
+        if snapshot.store is not self._store:
+            self._store = snapshot.store
+            self._index = None
+            self._limit_retained()
+        self._version = None if snapshot.covers(snapshot.store) else snapshot
+    
+    def _retained(self) -> list:
+        # Stores other than the current one that only snapshots keep alive
+        snapshots = itertools.chain(
+            (snapshot for _, snapshot in self._undo),
+            (snapshot for snapshot, _ in self._redo),
+            (barrier[1] for _, barrier in self._redo if barrier is not None),
+            self._checkpoints.values(),
+        )
+        stores = {id(snapshot.store): snapshot.store for snapshot in snapshots}
+        stores.pop(id(self._store), None)
+        return list(stores.values())
+    
+    def _limit_retained(self) -> None:
+        limit = self.retained_limit
+        if limit is None:
+            return
+        # Oldest first: undo entries, then what could be redone, then checkpoints
+        while sum(store.nbytes() for store in self._retained()) > limit:
+            if self._undo:
+                self._undo.popleft()
+            elif self._redo:
+                del self._redo[0]
+            else:
+                del self._checkpoints[next(iter(self._checkpoints))]
+    
+    def _reset_versions(self) -> None:
+        # Snapshots of the old storage can no longer be restored
+        self._version = None
+        self._undo.clear()
+        self._redo.clear()
+        self._checkpoints.clear()
+        self._owner = object()
+    
+    def snapshot(self, name: Optional[str] = None) -> HistorySnapshot:
+        """Return the current state in O(1), without copying; keep it as checkpoint ``name``.
+        
+        Pass the snapshot, or its name, to :meth:`rollback` to return to it.
+        """
+        with self._lock:
+            snapshot = self._snapshot(self._merge())
+            if name is not None:
+                self._checkpoints[name] = snapshot
+            return snapshot
+    
+    def checkpoints(self) -> List[str]:
+        return list(self._checkpoints)
+    
+    def rollback(self, target: Union[str, HistorySnapshot]) -> None:
+        """Return to a snapshot or named checkpoint in O(1); :meth:`undo` reverses it."""
+        with self._lock:
+            if isinstance(target, str):
+                if target not in self._checkpoints:
+                    available = ', '.join(self._checkpoints) or 'none'
+                    raise ValueError(f"Unknown checkpoint: {target}. Available: {available}")
+                target = self._checkpoints[target]
+            if target.owner is not self._owner:
+                raise ValueError("Snapshot is from another history or from replaced storage")
+            current = self._snapshot(self._merge())
+            self._undo.append((len(target), current))
+            self._redo.clear()
+            self._switch(target)
+    
+    def undo(self) -> bool:
+        """Undo the last calculation added, clear or rollback; False if there is none.
+        
+        Adding a calculation afterwards discards what could be redone. Only
+        what is visible changes; a history log keeps every row it was given.
+        """
+        with self._lock:
+            current = self._snapshot(self._merge())
+            if self._undo and len(current) <= self._undo[-1][0]:
+                barrier: Optional[Tuple[int, HistorySnapshot]] = self._undo.pop()
+                previous = barrier[1]  # type: ignore[index]
+            elif len(current):
+                barrier = None
+                previous = current.truncated(len(current) - 1)
+            else:
+                return False
+            self._redo.append((current, barrier))
+            self._switch(previous)
+            return True
+    
+    def redo(self) -> bool:
+        """Redo the last undone change; False if there is none."""
+        with self._lock:
+            self._merge()
+            if not self._redo:
+                return False
+            snapshot, barrier = self._redo.pop()
+            if barrier is not None:
+                self._undo.append(barrier)
+            self._switch(snapshot)
+            return True
+    
+    def set_capacity(self, capacity: Optional[int],
+                     eviction: Optional[EvictionPolicy] = None) -> None:
+        """Bound the in-memory history to ``capacity`` rows (``None`` for unbounded).
+        
+        Rows pushed out of the ring buffer are handed to ``eviction``, which
+        defaults to :class:`DropOldest`; :class:`SpillToDisk` keeps them readable.
+        """
+        with self._lock:
+            existing = self.get_history()
+            previous = self._store
+            self._index = None
+            self._reset_versions()
+            if capacity is None:
+                self._store = ColumnarStore()
+            else:
+                self._store = RingStore(capacity, eviction if eviction is not None else DropOldest())
+            for calculation in existing:
+                self.add_calculation(calculation)
+            # Only the copied rows needed the old store; free its segment file
+            previous.close()
+    
+    def open_log(self, path: str) -> None:
+        """Back the history with the persistent memory-mapped log at ``path``.
+        
+        The log's existing entries become the history; new calculations are
+        appended to it and survive the process.
+        """
+        with self._lock:
+            self._drain()
+            self._release_shards()
+            self._reset_versions()
+            store = MappedLogStore(path)
+            self._store.close()
+            self._store = store
+            self._index = None
+    
+    def query_positions(self, where: Union[str, Iterable[Condition]]) -> List[int]:
+        """Return 0-based history positions of calculations matching ``where``.
+        
+        ``where`` is query text such as ``"op=divide result>100"`` (see
+        :mod:`app.query`) or parsed conditions. Positions index the view
+        returned by :meth:`get_history` at the same moment.
+        """
+        conditions = parse_query(where) if isinstance(where, str) else list(where)
+        with self._lock:
+            store = self._merge()
+            if self._index is None:
+                self._index = self._build_index(store)
+            start = store.offset
+            candidates, exact = self._index.candidates(conditions)
+            boxed = self._index.boxed
+            if boxed:
+                # Float approximations of boxed values may fall outside a range
+                # their exact values are in, so every boxed row is checked
+                candidates = sorted(boxed.union(candidates))
+            version = self._version
+            if version is None:
+                located: Iterable[Tuple[int, int]] = ((sequence, sequence) for sequence in candidates)
+            else:
+                # Rows hidden by undo or rollback are indexed too
+                located = version.locate(candidates)
+                start = version.visible_before(start)
+            # Rows before the store's offset were evicted but may still be indexed
+            return [position - start for sequence, position in located
+                    if sequence >= store.offset and (exact and sequence not in boxed
+                                                     or self._matches(store, sequence, conditions))]
+    
+    def query(self, where: Union[str, Iterable[Condition]]) -> List[Calculation]:
+        """Return the calculations matching ``where``, oldest first."""
+        with self._lock:
+            history = self.get_history()
+            return [history[position] for position in self.query_positions(where)]
+    
+    def _build_index(self, store) -> HistoryIndex:
+        index = HistoryIndex()
+        names = store.operations.names
+        record = store.record
+        rows = []
+        for sequence in range(store.offset, store.offset + len(store)):
+            opcode, flags, a, b, result = record(sequence)
+            rows.append((sequence, names[opcode], a, b, result, flags & BOXED))
+        index.extend(rows)
+        return index
+    
+    def _matches(self, store, sequence: int, conditions: List[Condition]) -> bool:
+        opcode, flags, a, b, result = store.record(sequence)
+        if flags & BOXED:
+            # The index only holds float approximations of boxed values
+            calculation = store.payload(sequence)
+            values = {
+                'op': calculation.operation_name, 'a': calculation.operand_a,
+                'b': calculation.operand_b, 'result': calculation.get_result(),
+            }
+        else:
+            values = {
+                'op': store.operations.name(opcode), 'a': a, 'b': b,
+                'result': None if flags & NO_RESULT else result,
+            }
+        # EAFP - a boxed value that cannot be compared with numbers never matches
+        try:
+            return all(condition.test(values[condition.field]) for condition in conditions)
+        except TypeError:
+            return False
+    
+    def eviction_stats(self) -> Dict[str, Optional[int]]:
+        return self._merge().stats()
+    
+    def nbytes(self) -> int:
+        """Return the memory held by the history's columns; boxed values are extra.
+        
+        Cleared stores that undo, redo or checkpoints still hold are counted.
+        """
+        with self._lock:
+            return self._merge().nbytes() + sum(store.nbytes() for store in self._retained())
     
     def get_last_calculation(self) -> Calculation:
-        if not self.history:
+        history = self.get_history()
+        if not history:
             raise IndexError("No calculations in history")
-        return self.history[-1]
+        return history[-1]
+    
+    def _materialize(self, store, index: int) -> Calculation:
+        opcode, flags, a, b, result = store.record(index)
+        if flags & BOXED:
+            return store.payload(index)
+        name = store.operations.name(opcode)
+        operand_a, operand_b, value = unpack(flags, a, b, result)
+        reducer = CalculationFactory._reductions.get(name)
+        if reducer is not None:
+            reduction = Reduction(name, None, reducer)
+            reduction.operand_a, reduction._result = operand_a, value
+            return reduction
+        calculation = Calculation(
+            name, operand_a, operand_b,
+            CalculationFactory._operations.get(name),  # type: ignore[arg-type]
+        )
+        calculation._result = value
+        return calculation
     
     def __len__(self) -> int:
-        return len(self.history)
+        return len(self.get_history())
+    
+    def lines(self, start: int = 0, stop: Optional[int] = None) -> Iterator[str]:
+        """Yield numbered lines for entries ``start`` to ``stop``, slice-style.
+        
+        Only the requested entries are materialized and formatted, so
+        ``lines(-10)`` costs the same for ten entries as for ten million.
+        """
+        view = self.get_history()
+        start, stop, _ = slice(start, stop).indices(len(view))
+        for i in range(start, stop):
+            yield f"{i + 1}. {view[i]}"
     
     def __str__(self) -> str:
-        if not self.history:
+        if not self:
             return "No calculations in history"
-        
-        lines = ["Calculation History:"]
-        for i, calc in enumerate(self.history, 1):
-            lines.append(f"{i}. {calc}")
-        return "\n".join(lines)
+        return "\n".join(itertools.chain(["Calculation History:"], self.lines()))
+
+
+class SessionHistory(CalculationHistory):
+    """A CalculationHistory that is not shared; every instance is independent."""
+    
+    def __new__(cls):
+        instance = object.__new__(cls)
+        instance._init_storage()
+        return instance
 
 
 class CalculationFactory:    
@@ -91,23 +831,435 @@ class CalculationFactory:
         'divide': divide,
     }
     
+    # Element-wise kernels implemented in C; mapped over whole columns at once
+    _kernels = {
+        'add': operator.add,
+        'subtract': operator.sub,
+        'multiply': operator.mul,
+        'divide': operator.truediv,
+    }
+    
+    # What register_operation restores when a built-in function comes back
+    _builtin_operations = dict(_operations)
+    _builtin_kernels = dict(_kernels)
+    
+    # Single-pass aggregates over a stream of values; see app.reduction
+    _reductions = REDUCTIONS
+    
+    _cache: Optional[Union[ResultCache, SharedResultCache]] = None
+    _metrics: Optional[Metrics] = None
+    
+    # The selected backend's version of _operations, rebuilt whenever either
+    # changes; with the float backend it is _operations itself
+    _backend: NumericBackend = FloatBackend()
+    _active_operations = _operations
+    
+    # Bumped whenever the operation table changes, so anything compiled
+    # against the old table knows it is stale
+    _version = 0
+    
+    # evaluate()'s table: every active operation under its name and under
+    # its ID; IDs are handed out once per name and never reused
+    _operation_ids: Dict[str, int] = {}
+    _dispatch: Dict[Union[str, int], Callable[[object, object], object]] = {}
+    
     @classmethod
     def create(cls, operation_name: str, a: float, b: float) -> Calculation:
+        if cls._metrics is not None:
+            return cls._create_metered(operation_name, a, b)
+        if operation_name not in cls._operations:
+            raise ValueError(
+                f"Unknown operation: {operation_name}. "
+                f"Available: {', '.join(cls._operations.keys())}"
+            )
+        
+        operation_func = cls._active_operations[operation_name]
+        calculation = Calculation(operation_name, a, b, operation_func)
+        if cls._cache is not None:
+            calculation._cache = cls._cache
+        return calculation
+    
+    @classmethod
+    def evaluate(cls, operation: Union[str, int], a: float, b: float) -> float:
+        """Return the result of ``operation`` on ``a`` and ``b``, and nothing else.
+        
+        The fast path for callers that only need the number: no Calculation
+        is built, the cache, metrics and history are not involved, and errors
+        are raised by the operation itself, e.g. ``ValueError("Cannot divide
+        by zero")``, rather than re-wrapped. ``operation`` is a name or an ID
+        from :meth:`operation_id`.
+        """
+        # EAFP - an unknown operation is the rare case
+        try:
+            func = cls._dispatch[operation]
+        except KeyError:
+            raise ValueError(
+                f"Unknown operation: {operation}. "
+                f"Available: {', '.join(cls._operations.keys())}"
+            )
+        return func(a, b)  # type: ignore[return-value]
+    
+    @classmethod
+    def get_operation_function(cls, operation: Union[str, int]) -> Callable[[object, object], object]:
+        """Return the function :meth:`evaluate` calls for ``operation``.
+        
+        Binding it once takes even the dispatch out of a hot loop; it stays
+        valid until the operation is replaced or the backend changes.
+        """
+        # EAFP - same lookup as evaluate
+        try:
+            return cls._dispatch[operation]
+        except KeyError:
+            raise ValueError(
+                f"Unknown operation: {operation}. "
+                f"Available: {', '.join(cls._operations.keys())}"
+            )
+    
+    @classmethod
+    def operation_id(cls, operation_name: str) -> int:
+        """Return the integer ID :meth:`evaluate` accepts in place of ``operation_name``."""
+        if operation_name not in cls._operations:
+            raise ValueError(
+                f"Unknown operation: {operation_name}. "
+                f"Available: {', '.join(cls._operations.keys())}"
+            )
+        return cls._operation_ids[operation_name]
+    
+    @classmethod
+    def _build_dispatch(cls) -> None:
+        ids = cls._operation_ids
+        dispatch: Dict[Union[str, int], Callable[[object, object], object]] = {}
+        for name, func in cls._active_operations.items():
+            dispatch[name] = dispatch[ids.setdefault(name, len(ids))] = func
+        cls._dispatch = dispatch
+    
+    @classmethod
+    def _create_metered(cls, operation_name: str, a: float, b: float) -> Calculation:
+        started = time.perf_counter_ns()
+        if operation_name not in cls._operations:
+            raise ValueError(
+                f"Unknown operation: {operation_name}. "
+                f"Available: {', '.join(cls._operations.keys())}"
+            )
+        
+        metrics = cls._metrics.operation(operation_name)  # type: ignore[union-attr]
+        calculation = MeteredCalculation(operation_name, a, b, cls._active_operations[operation_name])
+        calculation._metrics = metrics
+        if cls._cache is not None:
+            calculation._cache = cls._cache
+        metrics.create_latency.record(time.perf_counter_ns() - started)
+        return calculation
+    
+    @classmethod
+    def execute_batch(cls, operation_name: str, a_values: Iterable[float],
+                      b_values: Iterable[float], out: object = None) -> Union[array, List[object]]:
+        """Evaluate an operation over two equal-length columns of operands.
+        
+        Accepts lists, ``array.array`` or any object exposing the buffer
+        protocol (such as NumPy arrays); ``bytes``, ``bytearray`` and
+        memoryviews over them are read as packed native doubles, all
+        without copying.
+        Rows that fail, e.g. division by zero, produce ``nan`` instead of
+        aborting the batch. Exact backends return a list rather than a
+        float array.
+        
+        With ``out``, a writable buffer of doubles as long as the columns
+        (``array('d')``, a ``bytearray``, a NumPy float64 array, ...), the
+        results are written into it and ``out`` is returned.
+        """
+        if operation_name not in cls._operations:
+            raise ValueError(
+                f"Unknown operation: {operation_name}. "
+                f"Available: {', '.join(cls._operations.keys())}"
+            )
+        
+        a_column, b_column = _operand_columns(a_values, b_values)
+        
+        if cls._backend.exact:
+            if out is not None:
+                raise ValueError("Exact backends cannot write into a float buffer")
+            # Exact results would be rounded by a float array; build them once
+            # per batch with the backend's table, failures still giving nan
+            return list(map(_guarded(cls._active_operations[operation_name]), a_column, b_column))
+        
+        kernel = cls._kernels.get(operation_name, cls._operations[operation_name])
+        if out is not None:
+            return _execute_into(out, kernel, [a_column, b_column])
+        # EAFP - run the whole column through the kernel and only fall back
+        # to the row-by-row guarded path when a row actually fails
+        try:
+            return array('d', map(kernel, a_column, b_column))
+        except (ValueError, ZeroDivisionError):
+            return array('d', map(_guarded(kernel), a_column, b_column))
+    
+    @classmethod
+    def execute_tolerant(cls, operation_name: str, a_values: Iterable[float],
+                         b_values: Iterable[float], policy: str = 'nan',
+                         out: object = None) -> BatchResult:
+        """Evaluate like :meth:`execute_batch`, recording why each failed row failed.
+        
+        The result's ``values`` hold failed rows as ``nan`` or, with
+        ``policy='ieee'``, as IEEE 754 arithmetic would give them (``1 / 0``
+        is ``inf``); its ``codes`` are a parallel mask of the error codes in
+        :mod:`app.batch`, and ``str()`` lists failed rows by reason. Failures
+        are recorded rather than raised, so error-heavy columns run about as
+        fast as clean ones.
+        """
         if operation_name not in cls._operations:
             raise ValueError(
                 f"Unknown operation: {operation_name}. "
                 f"Available: {', '.join(cls._operations.keys())}"
             )
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown policy: {policy}. Available: {', '.join(POLICIES)}")
+        
+        columns = list(_operand_columns(a_values, b_values))
+        # Only the built-in divide is known to fail on exactly the zero divisors
+        divides = operation_name == 'divide' and 'divide' in cls._kernels
+        if cls._backend.exact:
+            if out is not None:
+                raise ValueError("Exact backends cannot write into a float buffer")
+            if policy == 'ieee':
+                raise ValueError("Exact backends have no IEEE special values")
+            values, codes = evaluate_tolerant(cls._active_operations[operation_name], columns,
+                                              policy, divides=divides, exact=True)
+            return BatchResult(values, codes)
         
-        operation_func = cls._operations[operation_name]
-        return Calculation(operation_name, a, b, operation_func)
+        kernel = cls._kernels.get(operation_name, cls._operations[operation_name])
+        view = None if out is None else _output_view(out, len(columns[0]))
+        values, codes = evaluate_tolerant(kernel, columns, policy, view, divides)
+        return BatchResult(values if out is None else out, codes)
+    
+    @classmethod
+    def reduce(cls, operation_name: str, values: Iterable[object]) -> Reduction:
+        """Reduce ``values`` with ``operation_name`` (sum, mean, ...) in one pass.
+        
+        ``values`` may be any iterable, including a generator over a file
+        such as ``read_numbers(open(path))``; it is consumed once and never
+        held in memory. The executed Reduction is returned, ready to be added
+        to a history as a single entry.
+        """
+        reducer = cls._reductions.get(operation_name)
+        if reducer is None:
+            raise ValueError(
+                f"Unknown reduction: {operation_name}. "
+                f"Available: {', '.join(cls._reductions.keys())}"
+            )
+        backend = cls._backend
+        if backend.exact:
+            reduction = Reduction(operation_name, map(backend.convert, values), reducer,
+                                  cls._active_operations)
+        else:
+            reduction = Reduction(operation_name, values, reducer)
+        reduction.execute()
+        return reduction
     
     @classmethod
     def get_available_operations(cls) -> List[str]:
         
         return list(cls._operations.keys())
     
+    @classmethod
+    def has_operation(cls, operation_name: str) -> bool:
+        # Unlike get_available_operations, builds nothing
+        return operation_name in cls._operations
+    
+    @classmethod
+    def get_available_reductions(cls) -> List[str]:
+        
+        return list(cls._reductions.keys())
+    
     @classmethod
     def register_operation(cls, name: str, func: Callable[[float, float], float]) -> None:
+        # History rows of reductions are recognized by name
+        if name in cls._reductions:
+            raise ValueError(f"Cannot register operation '{name}': it is a reduction")
+        cls._operations[name] = func
+        # A replaced operation must not keep dispatching to the old kernel;
+        # the built-in function gets its own kernel back
+        if func is cls._builtin_operations.get(name):
+            cls._kernels[name] = cls._builtin_kernels[name]
+        else:
+            cls._kernels.pop(name, None)
+        cls._operations_changed(name)
+    
+    @classmethod
+    def unregister_operation(cls, name: str) -> None:
+        """Remove operation ``name``; registering it again gives back its old ID."""
+        if name not in cls._operations:
+            raise ValueError(
+                f"Unknown operation: {name}. "
+                f"Available: {', '.join(cls._operations.keys())}"
+            )
+        del cls._operations[name]
+        cls._kernels.pop(name, None)
+        cls._operations_changed(name)
+    
+    @classmethod
+    def _operations_changed(cls, name: str) -> None:
+        cls._active_operations = cls._backend.resolve(cls._operations)
+        cls._build_dispatch()
+        cls._version += 1
+        # Results computed by the old function must not be served
+        if cls._cache is not None:
+            cls._cache.invalidate(name)
+    
+    @classmethod
+    def set_backend(cls, backend: Union[str, NumericBackend] = 'float',
+                    precision: Optional[int] = None) -> NumericBackend:
+        """Run calculations created from now on in ``backend``.
+        
+        ``backend`` is a name from :data:`app.backend.BACKENDS` or a backend
+        instance; ``precision`` sets the number of significant digits of the
+        decimal backend. The operation table is resolved here, once.
+        """
+        if isinstance(backend, str):
+            backend = get_backend(backend, precision)
+        cls._backend = backend
+        cls._active_operations = backend.resolve(cls._operations)
+        cls._build_dispatch()
+        cls._version += 1
+        if isinstance(cls._cache, SharedResultCache):
+            # Other processes use the shared block too; keys name the backend instead
+            cls._cache.namespace = repr(backend)
+        elif cls._cache is not None:
+            # Cached results were computed in the previous backend
+            cls._cache.clear()
+        return backend
+    
+    @classmethod
+    def get_backend(cls) -> NumericBackend:
+        return cls._backend
+    
+    @classmethod
+    def enable_cache(cls, maxsize: int = 1024, ttl: Optional[float] = None) -> ResultCache:
+        """Memoize results of calculations created from now on."""
+        cls._cache = ResultCache(maxsize, ttl)
+        return cls._cache
+    
+    @classmethod
+    def enable_shared_cache(cls, name: Optional[str] = None, slots: int = 65536) -> SharedResultCache:
+        """Memoize results in a cache shared with other processes.
         
-        cls._operations[name] = func
\ No newline at end of file
+        Attaches to the shared cache ``name`` if one exists and creates it
+        otherwise. Processes forked after this call share the cache as
+        they are; others call it with the same name. Results are keyed by
+        backend, so processes on different backends can share the cache.
+        """
+        namespace = repr(cls._backend)
+        if name is None:
+            cache = SharedResultCache(slots, namespace=namespace)
+        else:
+            try:
+                cache = SharedResultCache(slots, name, namespace=namespace)
+            except FileExistsError:
+                cache = SharedResultCache.attach(name, namespace)
+        cls._cache = cache
+        return cache
+    
+    @classmethod
+    def disable_cache(cls) -> None:
+        cls._cache = None
+    
+    @classmethod
+    def cache_stats(cls) -> Optional[Dict[str, Optional[float]]]:
+        if cls._cache is None:
+            return None
+        return cls._cache.stats()
+    
+    @classmethod
+    def enable_metrics(cls) -> Metrics:
+        """Count and time calculations created from now on."""
+        if cls._metrics is None:
+            cls._metrics = Metrics()
+        return cls._metrics
+    
+    @classmethod
+    def disable_metrics(cls) -> None:
+        cls._metrics = None
+    
+    @classmethod
+    def metrics_snapshot(cls) -> Optional[Dict[str, Dict[str, float]]]:
+        if cls._metrics is None:
+            return None
+        return cls._metrics.snapshot()
+
+
+CalculationFactory._build_dispatch()
+
+
+# Rows computed per block when filling an output buffer
+_BLOCK = 4096
+
+
+def _buffer(values: object) -> Optional[memoryview]:
+    """Return a one-dimensional memoryview of ``values``, or None if it has no buffer."""
+    try:
+        view = memoryview(values)  # type: ignore[arg-type]
+    except TypeError:
+        return None
+    if view.ndim != 1:
+        raise ValueError("Operand columns must be one-dimensional")
+    # Raw bytes, e.g. straight from a file or socket, hold packed doubles;
+    # typed byte buffers such as array('B') or uint8 columns keep their format
+    if view.format in ('B', 'c') and isinstance(view.obj, (bytes, bytearray)):
+        try:
+            view = view.cast('d')
+        except TypeError:
+            raise ValueError(f"A buffer of {view.nbytes} bytes does not hold whole doubles")
+    return view
+
+
+def _as_column(values: Iterable[float]):
+    """Return a sized, sliceable view of ``values`` without copying buffers."""
+    view = _buffer(values)
+    if view is not None:
+        return view
+    return values if isinstance(values, Sequence) else list(values)
+
+
+def _operand_columns(a_values: Iterable[float], b_values: Iterable[float]) -> Tuple[Sequence, Sequence]:
+    a_column = _as_column(a_values)
+    b_column = _as_column(b_values)
+    if len(a_column) != len(b_column):
+        raise ValueError(
+            f"Operand columns differ in length: {len(a_column)} != {len(b_column)}"
+        )
+    return a_column, b_column
+
+
+def _output_view(out: object, length: int) -> memoryview:
+    """Return ``out`` as a writable view of ``length`` doubles."""
+    view = _buffer(out)
+    if view is None or view.readonly or view.format != 'd':
+        raise ValueError("Output must be a writable buffer of doubles, e.g. array('d') or a bytearray")
+    if len(view) != length:
+        raise ValueError(f"Output buffer holds {len(view)} values, not {length}")
+    return view
+
+
+def _execute_into(out: object, kernel: Callable[..., float], columns: List) -> object:
+    """Write ``kernel`` over the rows of ``columns`` into the buffer ``out``."""
+    view = _output_view(out, len(columns[0]))
+    # Each block is computed into a small array and copied in with one slice
+    # assignment, so memory stays bounded and no row is stored from Python
+    for start in range(0, len(view), _BLOCK):
+        rows = [column[start:start + _BLOCK] for column in columns]
+        # EAFP - only a block with a failing row takes the guarded path
+        try:
+            block = array('d', map(kernel, *rows))
+        except (ValueError, ZeroDivisionError):
+            block = array('d', map(_guarded(kernel), *rows))
+        view[start:start + len(block)] = block
+    return out
+
+
+def _guarded(func: Callable[..., float]) -> Callable[..., float]:
+    nan = float('nan')
+    
+    def kernel(*operands: float) -> float:
+        try:
+            return func(*operands)
+        except (ValueError, ZeroDivisionError):
+            return nan
+    return kernel
\ No newline at end of file
@@ -1,146 +1,209 @@
 """
-Calculator REPL interface.
+Calculator command-line module.
 
-This module provides an interactive Read-Eval-Print Loop for the calculator,
-including history management and special commands.
+This module is the entry point for ``python -m app.calculator``. With a
+calculation on the command line, e.g. ``add 5 3``, ``-c "divide 10 4"`` or
+``sum data.txt``, it prints only the result and exits; otherwise it starts
+the interactive REPL from app.calculator.repl. Everything beyond ``sys``
+is imported where it is needed, so one-shot calls from shell scripts start
+as fast as the interpreter allows.
 """
 
-from app.calculation import CalculationFactory, CalculationHistory
-
-
-class CalculatorREPL:
-    
-    def __init__(self):
-        self.history = CalculationHistory()
-        self.running = False
-    
-    def display_welcome(self) -> None:
-        print("Advanced Calculator")
-        print("\nAvailable operations:")
-        for op in CalculationFactory.get_available_operations():
-            print(f"  • {op}")
-        print("\nSpecial commands:")
-        print("  • help    - Show this help message")
-        print("  • history - View calculation history")
-        print("  • clear   - Clear calculation history")
-        print("  • exit    - Exit the calculator")
-    
-    def display_help(self) -> None:
-        print("HELP - Calculator Usage")
-        print("\nTo perform a calculation:")
-        print("  1. Enter operation name (add, subtract, multiply, divide)")
-        print("  2. Enter first number")
-        print("  3. Enter second number")
-        print("\nSpecial Commands:")
-        print("  help    - Display this help message")
-        print("  history - Show all calculations from this session")
-        print("  clear   - Clear the calculation history")
-        print("  exit    - Exit the calculator (also: quit, q)")
-    
-    def display_history(self) -> None:
-        if len(self.history) == 0:
-            print("No calculations in history yet.")
-        else:
-            print(f"Calculation History ({len(self.history)} calculations):")
-            for i, calc in enumerate(self.history.get_history(), 1):
-                print(f"{i}. {calc}")
-    
-    def clear_history(self) -> None:
-        self.history.clear_history()
-        print("\n History cleared.\n")
-    
-    def get_operation(self) -> str:
-        while True:
-            user_input = input("Enter operation or command: ").strip().lower()
-            
-            # Check for exit commands
-            if user_input in ['exit', 'quit', 'q']:
-                return 'exit'
-            
-            # Check for special commands
-            if user_input in ['help', 'history', 'clear']:
-                return user_input
-            
-            # Check for valid operations
-            if user_input in CalculationFactory.get_available_operations():
-                return user_input
-            
-            print(f"Invalid input '{user_input}'. Type 'help' for instructions.\n")
-    
-    def get_number(self, prompt: str) -> float:
-        
-        while True:
-            # EAFP approach - Try to convert, handle exception if it fails
+# Annotations stay strings, so typing is never imported at startup
+from __future__ import annotations
+
+import sys
+
+# Type checkers treat this name as true; at run time typing stays unimported
+TYPE_CHECKING = False
+if TYPE_CHECKING:
+    from typing import List, Optional
+
+# Operations a fresh process has; see run_once
+_BUILTIN_OPERATIONS = ('add', 'subtract', 'multiply', 'divide')
+_REDUCTIONS = ('sum', 'mean', 'variance', 'stddev', 'min', 'max', 'count')
+
+
+def __getattr__(name: str):
+    # The REPL and everything it imports load on first use
+    if name == 'CalculatorREPL':
+        from app.calculator.repl import CalculatorREPL
+        return CalculatorREPL
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def _operands(parse, a: str, b: str) -> tuple:
+    # EAFP - parsing is the fast path, failures are rare
+    try:
+        return parse(a), parse(b)
+    except ValueError:
+        raise ValueError(f"Invalid number in '{a} {b}'")
+
+
+def _evaluate(text: str, history=None) -> object:
+    """Evaluate ``text`` through the factory, honouring backend, cache and metrics."""
+    from app.calculation import CalculationFactory
+
+    fields = text.split()
+    if len(fields) == 3 and fields[0].isalpha():
+        a, b = _operands(CalculationFactory.get_backend().parse, fields[1], fields[2])
+        calculation = CalculationFactory.create(fields[0].lower(), a, b)
+        result = calculation.execute()
+        if history is not None:
+            history.add_calculation(calculation)
+        return result
+
+    from app.expression import compile_expression
+
+    return compile_expression(text).evaluate()
+
+
+def _reduce(name: str, path: Optional[str], history=None) -> object:
+    """Reduce the numbers in the file at ``path``, or stdin, in one pass."""
+    infile = sys.stdin if path is None else open(path)
+    try:
+        if history is None and 'app.calculation' not in sys.modules:
+            from app.reduction import REDUCTIONS, read_numbers
+
+            # EAFP - same wrapping as Reduction.execute
             try:
-                value = input(prompt).strip()
-                return float(value)
-            except ValueError:
-                print(f"Invalid number '{value}'. Please enter a valid number.\n")
-    
-    def perform_calculation(self, operation: str) -> None:
+                return REDUCTIONS[name](read_numbers(infile))[1]
+            except (ValueError, ZeroDivisionError, OverflowError) as e:
+                raise ValueError(f"Calculation failed: {e}")
+
+        from app.calculation import CalculationFactory
+        from app.reduction import read_numbers
+
+        reduction = CalculationFactory.reduce(
+            name, read_numbers(infile, CalculationFactory.get_backend().parse))
+        if history is not None:
+            history.add_calculation(reduction)
+        return reduction.get_result()
+    finally:
+        if path is not None:
+            infile.close()
+
+
+def _is_option(arg: str) -> bool:
+    # As in argparse, '-5', '-.5' and a lone '-' are not options
+    return arg.startswith('-') and arg[1:2] not in ('', '.', *'0123456789')
+
+
+def run_once(text: str, history=None) -> int:
+    """Print the result of one ``operation a b`` line or expression; return the exit status.
+
+    ``reduction [FILE]``, e.g. ``sum data.txt``, reduces the numbers in FILE
+    or on stdin instead.
+
+    Until app.calculation has been imported nothing can have registered an
+    operation or chosen a backend, so a built-in operation is then computed
+    straight from app.operation without loading the factory at all.
+    """
+    fields = text.split()
+    try:
+        if 1 <= len(fields) <= 2 and fields[0].lower() in _REDUCTIONS:
+            result = _reduce(fields[0].lower(), fields[1] if len(fields) == 2 else None, history)
+        elif (len(fields) == 3 and fields[0].lower() in _BUILTIN_OPERATIONS
+                and 'app.calculation' not in sys.modules):
+            from app import operation
+
+            a, b = _operands(float, fields[1], fields[2])
+            # EAFP - same wrapping as Calculation.execute
+            try:
+                result = getattr(operation, fields[0].lower())(a, b)
+            except (ValueError, ZeroDivisionError) as e:
+                raise ValueError(f"Calculation failed: {e}")
+        else:
+            result = _evaluate(text, history)
+    except (ValueError, OSError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+    print(result)
+    return 0
+
+
+def main(argv: Optional[List[str]] = None) -> Optional[int]:
+    """Entry point for the calculator application."""
+    if argv is None:
+        argv = sys.argv[1:]
+    # A bare calculation skips argparse and the REPL imports entirely; with
+    # any option among its words it is left to argparse
+    if argv and not any(map(_is_option, argv)) and not argv[0].startswith('-'):
+        return run_once(' '.join(argv))
+    if len(argv) == 2 and argv[0] in ('-c', '--command'):
+        return run_once(argv[1])
+
+    import argparse
+
+    from app.backend import BACKENDS
+    from app.calculation import CalculationFactory, CalculationHistory
+
+    parser = argparse.ArgumentParser(prog='python -m app.calculator')
+    parser.add_argument('calculation', nargs='*',
+                        help="print the result of one calculation, e.g. 'add 5 3', "
+                             "'(3 + 4) * 2' or 'sum FILE' (stdin without FILE), "
+                             "instead of starting the REPL")
+    parser.add_argument('-c', '--command', metavar='CALCULATION',
+                        help="same as a positional calculation, e.g. -c 'divide 10 4'")
+    parser.add_argument('--history-file', metavar='PATH',
+                        help='keep history in a persistent memory-mapped log at PATH')
+    parser.add_argument('--cache-size', type=int, metavar='N',
+                        help='memoize up to N calculation results')
+    parser.add_argument('--cache-ttl', type=float, metavar='SECONDS',
+                        help='expire cached results after SECONDS')
+    parser.add_argument('--backend', choices=sorted(BACKENDS), default='float',
+                        help='number type for calculations (default: float)')
+    parser.add_argument('--precision', type=int, metavar='DIGITS',
+                        help='significant digits for --backend decimal (default: 28)')
+    parser.add_argument('--metrics', action='store_true',
+                        help='count and time calculations per operation (see the stats command)')
+    parser.add_argument('--metrics-file', metavar='PATH',
+                        help='on exit, write metrics to PATH in Prometheus text format '
+                             '(implies --metrics)')
+    parser.add_argument('--stream', nargs='?', const='-', metavar='FILE',
+                        help="evaluate 'operation a b' lines from FILE (default: stdin) "
+                             "without prompts, printing one result per line")
+    parser.add_argument('--record', action='store_true',
+                        help='with --stream, also add results to the calculation history')
+    args = parser.parse_args(argv)
+
+    if args.backend != 'float' or args.precision is not None:
         try:
-            a = self.get_number("Enter first number: ")
-            b = self.get_number("Enter second number: ")
-            
-            # Create calculation using factory
-            calculation = CalculationFactory.create(operation, a, b)
-            
-            # Execute calculation
-            result = calculation.execute()
-            
-            # Add to history
-            self.history.add_calculation(calculation)
-            
-            # Display result
-            print(f"\n Result: {calculation}\n")
-            
+            CalculationFactory.set_backend(args.backend, args.precision)
         except ValueError as e:
-            # Handle calculation errors (e.g., division by zero)
-            print(f"\nError: {e}\n")
-        except Exception as e:  # pragma: no cover
-            # Catch any unexpected errors
-            print(f"\nUnexpected error: {e}\n")
-    
-    def run(self) -> None:
-        self.running = True
-        self.display_welcome()
-        
-        try:
-            while self.running:
-                # Get operation or command from user
-                choice = self.get_operation()
-                
-                # Handle special commands
-                if choice == 'exit':
-                    self.running = False
-                    print("\nThank you for using the calculator. Goodbye!\n")
-                    break
-                elif choice == 'help':
-                    self.display_help()
-                    continue
-                elif choice == 'history':
-                    self.display_history()
-                    continue
-                elif choice == 'clear':
-                    self.clear_history()
-                    continue
-                
-                # Perform calculation
-                self.perform_calculation(choice)
-                
-        except KeyboardInterrupt:
-            # Handle Ctrl+C gracefully
-            print("\n\nCalculator interrupted. Goodbye!\n")
-        except Exception as e:  # pragma: no cover
-            # Catch any other unexpected errors
-            print(f"\nFatal error: {e}\n")
-
-
-def main():  # pragma: no cover
-    """Entry point for the calculator application."""
-    repl = CalculatorREPL()
-    repl.run()
+            parser.error(str(e))
+    if args.history_file:
+        CalculationHistory().open_log(args.history_file)
+    if args.cache_size:
+        CalculationFactory.enable_cache(args.cache_size, args.cache_ttl)
+    if args.metrics or args.metrics_file:
+        metrics = CalculationFactory.enable_metrics()
+
+    try:
+        if args.command or args.calculation:
+            # A one-shot result is only kept when there is a log to keep it in
+            history = CalculationHistory() if args.history_file else None
+            return run_once(args.command or ' '.join(args.calculation), history)
+
+        if args.stream is not None:
+            from app.stream import run_stream
+
+            if args.stream == '-':
+                errors = run_stream(sys.stdin, sys.stdout, record=args.record)
+            else:
+                with open(args.stream) as infile:
+                    errors = run_stream(infile, sys.stdout, record=args.record)
+            return 1 if errors else 0
+
+        from app.calculator.repl import CalculatorREPL
+
+        repl = CalculatorREPL()
+        repl.run()
+        return None
+    finally:
+        if args.metrics_file:
+            metrics.write_prometheus(args.metrics_file)
 
 
 if __name__ == "__main__":  # pragma: no cover
-    main()
\ No newline at end of file
+    sys.exit(main())
@@ -2,7 +2,9 @@
 Entry point for running the calculator as a module.
 """
 
+import sys  # pragma: no cover
+
 from app.calculator import main  # pragma: no cover
 
 if __name__ == "__main__":  # pragma: no cover
-    main()  # pragma: no cover
+    sys.exit(main())  # pragma: no cover
@@ -0,0 +1,332 @@
+"""
+Calculator REPL module.
+
+This module provides an interactive Read-Eval-Print Loop for the calculator,
+including history management and special commands.
+"""
+
+from typing import Optional, Sequence
+
+from app.calculation import CalculationFactory, CalculationHistory
+from app.expression import compile_expression
+
+
+class CalculatorREPL:
+    
+    # Entries shown per 'history page N' and by a bare 'history' on long histories
+    history_page_size = 20
+    
+    def __init__(self, history: Optional[CalculationHistory] = None):
+        # One REPL per user: pass a session's history to keep users apart
+        self.history = history if history is not None else CalculationHistory()
+        self.running = False
+    
+    def display_welcome(self) -> None:
+        print("Advanced Calculator")
+        print("\nAvailable operations:")
+        for op in CalculationFactory.get_available_operations():
+            print(f"  • {op}")
+        print("\nOr type an expression, e.g. (3 + 4) * 2 / 7")
+        print("\nSpecial commands:")
+        print("  • help    - Show this help message")
+        print("  • history - View calculation history")
+        print("  • cache   - Show result cache statistics")
+        print("  • stats   - Show per-operation call counts and latency")
+        print("  • backend - Show or change the number type (float, decimal, fraction, int)")
+        print("  • clear   - Clear calculation history")
+        print("  • undo    - Undo the last calculation, clear or rollback (redo reverses it)")
+        print("  • checkpoint NAME / rollback NAME - Save and return to a history state")
+        print("  • exit    - Exit the calculator")
+    
+    def display_help(self) -> None:
+        print("HELP - Calculator Usage")
+        print("\nTo perform a calculation:")
+        print("  1. Enter operation name (add, subtract, multiply, divide)")
+        print("  2. Enter first number")
+        print("  3. Enter second number")
+        print("\nOr type an infix expression directly:")
+        print("  (3 + 4) * 2 / 7    - uses + - * / and parentheses")
+        print("  power(2, 10)       - any registered operation as name(a, b)")
+        print("\nSpecial Commands:")
+        print("  help    - Display this help message")
+        print("  history - Show calculations (the latest page when there are many)")
+        print("    history N       - the last N calculations")
+        print("    history tail    - the last page")
+        print("    history page N  - page N, counting from the oldest")
+        print("    history all     - every calculation")
+        print("    history where op=divide result>100")
+        print("                    - calculations matching all conditions on")
+        print("                      op, a, b and result (= != < <= > >=)")
+        print("  cache   - Show result cache hits, misses and evictions")
+        print("  stats   - Show per-operation calls, errors and latency percentiles")
+        print("  backend - Show the number type calculations use")
+        print("    backend float|fraction|int")
+        print("    backend decimal [PRECISION]  - e.g. backend decimal 50")
+        print("  clear   - Clear the calculation history")
+        print("  undo    - Undo the last calculation, clear or rollback")
+        print("  redo    - Redo what undo reversed")
+        print("  checkpoint NAME - Save the history as it is now under NAME")
+        print("  checkpoint      - List saved checkpoints")
+        print("  rollback NAME   - Return the history to checkpoint NAME")
+        print("  exit    - Exit the calculator (also: quit, q)")
+    
+    def display_history(self, args: Sequence[str] = ()) -> None:
+        total = len(self.history)
+        if total == 0:
+            print("No calculations in history yet.")
+            return
+        
+        if args and args[0] == 'where':
+            self.display_query(' '.join(args[1:]))
+            return
+        
+        size = self.history_page_size
+        pages = -(-total // size)
+        # Only the entries shown are formatted; each line is printed as it is made
+        if not args:
+            start, stop = (0, total) if total <= size else (total - size, total)
+        elif args == ['all']:
+            start, stop = 0, total
+        elif args == ['tail']:
+            start, stop = max(total - size, 0), total
+        elif len(args) == 1 and args[0].isdigit() and int(args[0]) > 0:
+            start, stop = max(total - int(args[0]), 0), total
+        elif len(args) == 2 and args[0] == 'page' and args[1].isdigit() and 1 <= int(args[1]) <= pages:
+            start = (int(args[1]) - 1) * size
+            stop = min(start + size, total)
+        else:
+            print(f"Invalid history command. Use 'history N', 'history tail', "
+                  f"'history page 1-{pages}' or 'history all'.\n")
+            return
+        
+        print(f"Calculation History ({total} calculations):")
+        for line in self.history.lines(start, stop):
+            print(line)
+        if stop - start < total:
+            print(f"Showing {start + 1}-{stop} of {total}. "
+                  f"Use 'history page N' (1-{pages}) or 'history all' for more.")
+    
+    def display_query(self, where: str) -> None:
+        try:
+            positions = self.history.query_positions(where)
+        except ValueError as e:
+            print(f"\nError: {e}\n")
+            return
+        if not positions:
+            print("No calculations match.")
+            return
+        print(f"Matching Calculations ({len(positions)} of {len(self.history)}):")
+        view = self.history.get_history()
+        shown = positions[-self.history_page_size:]
+        for position in shown:
+            print(f"{position + 1}. {view[position]}")
+        if len(shown) < len(positions):
+            print(f"Showing the last {len(shown)} of {len(positions)} matches.")
+    
+    def display_cache_stats(self) -> None:
+        stats = CalculationFactory.cache_stats()
+        if stats is None:
+            print("Result cache is disabled.")
+            return
+        print("Result Cache:")
+        print(f"  size       {stats['size']}/{stats['maxsize']}")
+        print(f"  hits       {stats['hits']}")
+        print(f"  misses     {stats['misses']}")
+        print(f"  hit rate   {stats['hit_rate']:.1%}")
+        print(f"  evictions  {stats['evictions']}")
+        print(f"  expired    {stats['expirations']}")
+    
+    def display_metrics(self) -> None:
+        snapshot = CalculationFactory.metrics_snapshot()
+        if snapshot is None:
+            print("Metrics are disabled. Start with --metrics to collect them.")
+            return
+        if not snapshot:
+            print("No calculations measured yet.")
+            return
+        print("Operation Metrics (latency in µs):")
+        print(f"  {'operation':<12} {'calls':>8} {'errors':>7} {'p50':>9} {'p99':>9} {'max':>9}")
+        for name, stats in snapshot.items():
+            print(f"  {name:<12} {stats['calls']:>8} {stats['errors']:>7} "
+                  f"{stats['p50_ns'] / 1000:>9.2f} {stats['p99_ns'] / 1000:>9.2f} "
+                  f"{stats['max_ns'] / 1000:>9.2f}")
+    
+    def change_backend(self, args: Sequence[str] = ()) -> None:
+        if not args:
+            backend = CalculationFactory.get_backend()
+            print(f"Backend: {backend.name}"
+                  + (f" (precision {backend.precision})" if backend.name == 'decimal' else ''))
+            return
+        try:
+            if len(args) > 2 or (len(args) == 2 and not args[1].isdigit()):
+                raise ValueError("Usage: backend NAME [PRECISION]")
+            precision = int(args[1]) if len(args) == 2 else None
+            backend = CalculationFactory.set_backend(args[0], precision)
+        except ValueError as e:
+            print(f"\nError: {e}\n")
+            return
+        print(f"\n Backend set to {backend.name}.\n")
+    
+    def clear_history(self) -> None:
+        self.history.clear_history()
+        print("\n History cleared.\n")
+    
+    def undo(self) -> None:
+        if self.history.undo():
+            print(f"\n Undone. {len(self.history)} calculations in history.\n")
+        else:
+            print("\n Nothing to undo.\n")
+    
+    def redo(self) -> None:
+        if self.history.redo():
+            print(f"\n Redone. {len(self.history)} calculations in history.\n")
+        else:
+            print("\n Nothing to redo.\n")
+    
+    def checkpoint(self, args: Sequence[str] = ()) -> None:
+        if not args:
+            names = self.history.checkpoints()
+            print(f"Checkpoints: {', '.join(names)}" if names else "No checkpoints saved.")
+            return
+        if len(args) > 1:
+            print("\nError: Usage: checkpoint NAME\n")
+            return
+        self.history.snapshot(args[0])
+        print(f"\n Checkpoint '{args[0]}' saved at {len(self.history)} calculations.\n")
+    
+    def rollback(self, args: Sequence[str] = ()) -> None:
+        try:
+            if len(args) != 1:
+                raise ValueError("Usage: rollback NAME")
+            self.history.rollback(args[0])
+        except ValueError as e:
+            print(f"\nError: {e}\n")
+            return
+        print(f"\n Rolled back to '{args[0]}'. {len(self.history)} calculations in history.\n")
+    
+    def get_operation(self) -> str:
+        while True:
+            user_input = input("Enter operation or command: ").strip().lower()
+            
+            # Check for exit commands
+            if user_input in ['exit', 'quit', 'q']:
+                return 'exit'
+            
+            # Check for special commands
+            if user_input in ['help', 'history', 'cache', 'stats', 'clear', 'undo', 'redo']:
+                return user_input
+            if user_input.partition(' ')[0] in ('history', 'backend', 'checkpoint', 'rollback'):
+                return user_input
+            
+            # Check for valid operations
+            if CalculationFactory.has_operation(user_input):
+                return user_input
+            
+            # Anything else may be a complete expression such as (3 + 4) * 2
+            try:
+                if not compile_expression(user_input).variables:
+                    return user_input
+            except ValueError:
+                pass
+            
+            print(f"Invalid input '{user_input}'. Type 'help' for instructions.\n")
+    
+    def get_number(self, prompt: str) -> float:
+        
+        while True:
+            # EAFP approach - Try to convert, handle exception if it fails
+            try:
+                value = input(prompt).strip()
+                return CalculationFactory.get_backend().parse(value)
+            except ValueError:
+                print(f"Invalid number '{value}'. Please enter a valid number.\n")
+    
+    def perform_calculation(self, operation: str) -> None:
+        try:
+            a = self.get_number("Enter first number: ")
+            b = self.get_number("Enter second number: ")
+            
+            # Create calculation using factory
+            calculation = CalculationFactory.create(operation, a, b)
+            
+            # Execute calculation
+            result = calculation.execute()
+            
+            # Add to history
+            self.history.add_calculation(calculation)
+            
+            # Display result
+            print(f"\n Result: {calculation}\n")
+            
+        except ValueError as e:
+            # Handle calculation errors (e.g., division by zero)
+            print(f"\nError: {e}\n")
+        except Exception as e:  # pragma: no cover
+            # Catch any unexpected errors
+            print(f"\nUnexpected error: {e}\n")
+    
+    def evaluate_expression(self, expression: str) -> None:
+        try:
+            result = compile_expression(expression).evaluate()
+            print(f"\n Result: {expression} = {result}\n")
+        except ValueError as e:
+            print(f"\nError: {e}\n")
+    
+    def run(self) -> None:
+        self.running = True
+        self.display_welcome()
+        
+        try:
+            while self.running:
+                # Get operation or command from user
+                choice = self.get_operation()
+                
+                # Handle special commands
+                if choice == 'exit':
+                    self.running = False
+                    print("\nThank you for using the calculator. Goodbye!\n")
+                    break
+                elif choice == 'help':
+                    self.display_help()
+                    continue
+                elif choice.split()[0] == 'history':
+                    self.display_history(choice.split()[1:])
+                    continue
+                elif choice == 'cache':
+                    self.display_cache_stats()
+                    continue
+                elif choice == 'stats':
+                    self.display_metrics()
+                    continue
+                elif choice.split()[0] == 'backend':
+                    self.change_backend(choice.split()[1:])
+                    continue
+                elif choice == 'clear':
+                    self.clear_history()
+                    continue
+                elif choice == 'undo':
+                    self.undo()
+                    continue
+                elif choice == 'redo':
+                    self.redo()
+                    continue
+                elif choice.split()[0] == 'checkpoint':
+                    self.checkpoint(choice.split()[1:])
+                    continue
+                elif choice.split()[0] == 'rollback':
+                    self.rollback(choice.split()[1:])
+                    continue
+                
+                elif not CalculationFactory.has_operation(choice):
+                    self.evaluate_expression(choice)
+                    continue
+                
+                # Perform calculation
+                self.perform_calculation(choice)
+                
+        except KeyboardInterrupt:
+            # Handle Ctrl+C gracefully
+            print("\n\nCalculator interrupted. Goodbye!\n")
+        except Exception as e:  # pragma: no cover
+            # Catch any other unexpected errors
+            print(f"\nFatal error: {e}\n")
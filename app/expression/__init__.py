@@ -0,0 +1,324 @@
+"""
+Expression module.
+
+This module parses infix expressions such as ``(3 + 4) * 2 / x`` into a small
+AST and compiles them into a single Python function that calls the
+operations registered in CalculationFactory, one flat statement per
+operation so that long expressions compile as easily as short ones. Compiled expressions are cached
+by source text, so evaluating the same expression with new variable bindings
+skips parsing and compilation entirely.
+
+Grammar::
+
+    expression := term (('+' | '-') term)*
+    term       := unary (('*' | '/' | '×' | '÷') unary)*
+    unary      := ('-' | '+') unary | primary
+    primary    := NUMBER | NAME | NAME '(' expression ',' expression ')' | '(' expression ')'
+
+``NAME(a, b)`` calls any registered operation, e.g. ``power(2, x)``.
+"""
+
+import keyword
+import re
+from array import array
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Mapping, NamedTuple, Tuple, Union
+
+from app.calculation import CalculationFactory, _as_column, _execute_into, _guarded
+
+SYMBOLS = {
+    '+': 'add',
+    '-': 'subtract',
+    '*': 'multiply',
+    '×': 'multiply',
+    '/': 'divide',
+    '÷': 'divide',
+}
+
+_TOKEN = re.compile(r'''
+    \s*(?:
+        (?P<number>(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?)
+      | (?P<name>[A-Za-z_]\w*)
+      | (?P<symbol>[-+*/×÷(),])
+      | (?P<other>\S)
+    )''', re.VERBOSE)
+
+# Generated code names operations and constants with this prefix; variables may not use it
+_OP_PREFIX = '__op_'
+
+_INF = float('inf')
+
+
+class Number(NamedTuple):
+    value: float
+
+
+class Variable(NamedTuple):
+    name: str
+
+
+class Negate(NamedTuple):
+    operand: 'Node'
+
+
+class Operation(NamedTuple):
+    name: str
+    left: 'Node'
+    right: 'Node'
+
+
+Node = Union[Number, Variable, Negate, Operation]
+
+
+def tokenize(source: str) -> List[Tuple[str, str, int]]:
+    tokens = []
+    for match in _TOKEN.finditer(source):
+        kind = match.lastgroup
+        if kind == 'other':
+            raise ValueError(f"Unexpected character '{match.group(kind)}' at position {match.start(kind)}")
+        tokens.append((kind, match.group(kind), match.start(kind)))
+    return tokens
+
+
+class _Parser:
+
+    def __init__(self, source: str):
+        self.source = source
+        self.tokens = tokenize(source)
+        self.position = 0
+
+    def peek(self) -> Tuple[str, str, int]:
+        if self.position < len(self.tokens):
+            return self.tokens[self.position]
+        return ('end', '', len(self.source))
+
+    def take(self, expected: str) -> None:
+        kind, text, offset = self.peek()
+        if text != expected:
+            found = f"'{text}'" if kind != 'end' else 'end of expression'
+            raise ValueError(f"Expected '{expected}' but found {found} at position {offset}")
+        self.position += 1
+
+    def parse(self) -> Node:
+        node = self.expression()
+        kind, text, offset = self.peek()
+        if kind != 'end':
+            raise ValueError(f"Unexpected '{text}' at position {offset}")
+        return node
+
+    def expression(self) -> Node:
+        node = self.term()
+        while self.peek()[1] in ('+', '-'):
+            symbol = self.peek()[1]
+            self.position += 1
+            node = Operation(SYMBOLS[symbol], node, self.term())
+        return node
+
+    def term(self) -> Node:
+        node = self.unary()
+        while self.peek()[1] in ('*', '×', '/', '÷'):
+            symbol = self.peek()[1]
+            self.position += 1
+            node = Operation(SYMBOLS[symbol], node, self.unary())
+        return node
+
+    def unary(self) -> Node:
+        symbol = self.peek()[1]
+        if symbol in ('-', '+'):
+            self.position += 1
+            operand = self.unary()
+            return Negate(operand) if symbol == '-' else operand
+        return self.primary()
+
+    def primary(self) -> Node:
+        kind, text, offset = self.peek()
+        if kind == 'number':
+            self.position += 1
+            value = float(text)
+            # inf has no literal the generated code could spell
+            if value == _INF:
+                raise ValueError(f"Number out of range: {text} at position {offset}")
+            return Number(value)
+        if kind == 'name':
+            self.position += 1
+            if self.peek()[1] != '(':
+                if text.startswith(_OP_PREFIX) or keyword.iskeyword(text):
+                    raise ValueError(f"Invalid variable name '{text}'")
+                return Variable(text)
+            if text not in CalculationFactory._operations:
+                raise ValueError(f"Unknown operation: {text}")
+            self.take('(')
+            left = self.expression()
+            self.take(',')
+            right = self.expression()
+            self.take(')')
+            return Operation(text, left, right)
+        if text == '(':
+            self.position += 1
+            node = self.expression()
+            self.take(')')
+            return node
+        found = f"'{text}'" if kind != 'end' else 'end of expression'
+        raise ValueError(f"Unexpected {found} at position {offset}")
+
+
+def parse(source: str) -> Node:
+    """Parse an infix expression into its AST."""
+    # Only parentheses and unary signs nest the parser; sums and products loop
+    try:
+        return _Parser(source).parse()
+    except RecursionError:
+        raise ValueError("Expression too deeply nested")
+
+
+def _generate(tree: Node, variables: List[str], operations: Dict[str, object]) -> Tuple[List[str], str]:
+    """Return one assignment per operation in ``tree`` and the name holding its value.
+    
+    The tree is walked with an explicit stack, and every operation's result
+    goes into a local of its own, so neither the walk nor the generated
+    code nests deeper as expressions grow.
+    """
+    lines: List[str] = []
+    # Operands computed so far, as numbers, variables or locals
+    values: List[str] = []
+    stack: List[Tuple[Node, bool]] = [(tree, False)]
+    while stack:
+        node, visited = stack.pop()
+        if isinstance(node, Number):
+            backend = CalculationFactory.get_backend()
+            if not backend.exact:
+                values.append(repr(node.value))
+                continue
+            # Exact backends get their own number objects, bound like operations
+            alias = f"{_OP_PREFIX}{len(operations)}"
+            operations[alias] = backend.convert(node.value)
+            values.append(alias)
+        elif isinstance(node, Variable):
+            if node.name not in variables:
+                variables.append(node.name)
+            values.append(node.name)
+        elif not visited:
+            stack.append((node, True))
+            if isinstance(node, Negate):
+                stack.append((node.operand, False))
+            else:
+                # Popped left first, so operands are evaluated left to right
+                stack.append((node.right, False))
+                stack.append((node.left, False))
+        elif isinstance(node, Negate):
+            values.append(f"(-{values.pop()})")
+        else:
+            alias = _OP_PREFIX + node.name
+            operations[alias] = CalculationFactory._active_operations[node.name]
+            right, left = values.pop(), values.pop()
+            # A digit after the prefix sets locals apart from operation aliases,
+            # the trailing underscore from exact constants
+            local = f"{_OP_PREFIX}{len(lines)}_"
+            lines.append(f"{local} = {alias}({left}, {right})")
+            values.append(local)
+    return lines, values.pop()
+
+
+class CompiledExpression:
+
+    def __init__(self, source: str):
+        self.source = source
+        self.tree = parse(source)
+        variables: List[str] = []
+        operations: Dict[str, object] = {}
+        lines, result = _generate(self.tree, variables, operations)
+        self.variables: Tuple[str, ...] = tuple(variables)
+        # The generated text only contains numbers, validated names and
+        # operation aliases, so executing it is safe
+        # Not prefixed: the function must not shadow an operation alias
+        name = 'compiled'
+        body = ''.join(f"    {line}\n" for line in lines)
+        namespace: Dict[str, object] = {'__builtins__': {}, **operations}
+        exec(f"def {name}({', '.join(self.variables)}):\n{body}    return {result}\n", namespace)
+        self._function = namespace[name]
+        self._version = CalculationFactory._version
+        self._exact = CalculationFactory.get_backend().exact
+
+    def _arguments(self, bindings: Mapping[str, float]) -> List[float]:
+        try:
+            return [bindings[name] for name in self.variables]
+        except KeyError as e:
+            raise ValueError(f"Missing value for variable '{e.args[0]}'")
+
+    def evaluate(self, bindings: Mapping[str, float] = {}, **values: float) -> float:
+        """Evaluate with variables taken from ``bindings`` and keyword arguments."""
+        arguments = self._arguments({**bindings, **values})
+        try:
+            return self._function(*arguments)
+        except (ValueError, ZeroDivisionError) as e:
+            raise ValueError(f"Calculation failed: {e}")
+
+    __call__ = evaluate
+
+    def evaluate_many(self, columns: Mapping[str, Iterable[float]], out: object = None) -> array:
+        """Evaluate over equal-length columns of bindings, one row per result.
+
+        Rows that fail, e.g. division by zero, produce ``nan``. Columns and
+        ``out`` take the same buffers as CalculationFactory.execute_batch.
+        """
+        arguments = [_as_column(column) for column in self._arguments(columns)]  # type: ignore[arg-type]
+        if len({len(column) for column in arguments}) > 1:
+            raise ValueError("Variable columns differ in length")
+        if not arguments:
+            raise ValueError("Expression has no variables to bind")
+        if self._exact:
+            if out is not None:
+                raise ValueError("Exact backends cannot write into a float buffer")
+            return list(map(_guarded(self._function), *arguments))
+        if out is not None:
+            return _execute_into(out, self._function, arguments)  # type: ignore[return-value]
+        try:
+            return array('d', map(self._function, *arguments))
+        except (ValueError, ZeroDivisionError):
+            return array('d', map(_guarded(self._function), *arguments))
+
+    def __repr__(self) -> str:
+        return f"CompiledExpression({self.source!r})"
+
+
+class ExpressionCache:
+    """LRU of compiled expressions keyed by source text."""
+
+    def __init__(self, maxsize: int = 256):
+        self.maxsize = maxsize
+        self._compiled: 'OrderedDict[str, CompiledExpression]' = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def compile(self, source: str) -> CompiledExpression:
+        compiled = self._compiled.get(source)
+        # Expressions bind operation functions when compiled; recompile when
+        # the factory's table has changed since
+        if compiled is not None and compiled._version == CalculationFactory._version:
+            self._compiled.move_to_end(source)
+            self.hits += 1
+            return compiled
+        self.misses += 1
+        compiled = CompiledExpression(source)
+        self._compiled[source] = compiled
+        if len(self._compiled) > self.maxsize:
+            self._compiled.popitem(last=False)
+        return compiled
+
+    def clear(self) -> None:
+        self._compiled.clear()
+
+    def __len__(self) -> int:
+        return len(self._compiled)
+
+
+_cache = ExpressionCache()
+
+
+def compile_expression(source: str) -> CompiledExpression:
+    """Return the compiled form of ``source``, reusing a cached compilation."""
+    return _cache.compile(source)
+
+
+def evaluate(source: str, bindings: Mapping[str, float] = {}, **values: float) -> float:
+    return compile_expression(source).evaluate(bindings, **values)
@@ -0,0 +1,199 @@
+"""
+Calculation graph module.
+
+This module builds spreadsheet-style graphs where a calculation may take
+other nodes as operands. Changing an input only recomputes the calculations
+downstream of it, in dependency order, and stops early wherever a
+recomputed value comes out unchanged.
+"""
+
+import heapq
+from typing import Dict, List, Optional, Tuple, Union
+
+from app.calculation import Calculation, CalculationFactory, CalculationHistory
+
+
+class _Node:
+
+    def __init__(self, graph: 'CalculationGraph', name: Optional[str]):
+        # Checked before a calculation links itself to its operands, so a
+        # rejected node never becomes anyone's dependent
+        if name is not None and name in graph._names:
+            raise ValueError(f"Duplicate node name: {name}")
+        self.graph = graph
+        # Nodes can only refer to nodes created before them, so creation
+        # order is a topological order
+        self.index = len(graph._nodes)
+        self.name = name
+        self.dependents: List['CalculationNode'] = []
+        self._value: Optional[float] = None
+        self.error: Optional[str] = None
+
+    @property
+    def label(self) -> str:
+        return self.name if self.name is not None else f"#{self.index}"
+
+
+class InputNode(_Node):
+
+    def __init__(self, graph: 'CalculationGraph', name: str, value: float):
+        super().__init__(graph, name)
+        self._value = value
+
+    @property
+    def value(self) -> float:
+        return self._value  # type: ignore[return-value]
+
+    def set(self, value: float) -> None:
+        self.graph.set(self, value)
+
+    def __repr__(self) -> str:
+        return f"InputNode({self.label}={self._value})"
+
+
+Operand = Union[_Node, float]
+
+
+class CalculationNode(_Node):
+
+    def __init__(self, graph: 'CalculationGraph', operation_name: str,
+                 a: Operand, b: Operand, name: Optional[str] = None):
+        if operation_name not in CalculationFactory._operations:
+            raise ValueError(
+                f"Unknown operation: {operation_name}. "
+                f"Available: {', '.join(CalculationFactory._operations.keys())}"
+            )
+        for operand in (a, b):
+            if isinstance(operand, _Node) and operand.graph is not graph:
+                raise ValueError("Operands must belong to the same graph")
+        super().__init__(graph, name)
+        self.operation_name = operation_name
+        self.operands: Tuple[Operand, Operand] = (a, b)
+        self._func = CalculationFactory._active_operations[operation_name]
+        for operand in self.operands:
+            if isinstance(operand, _Node):
+                operand.dependents.append(self)
+        self._evaluate()
+
+    def _evaluate(self) -> None:
+        arguments = []
+        for operand in self.operands:
+            if isinstance(operand, _Node):
+                if operand.error is not None:
+                    self._value = None
+                    self.error = f"Depends on failed node {operand.label}"
+                    return
+                arguments.append(operand._value)
+            else:
+                arguments.append(operand)
+        # EAFP - a failing node records its error instead of breaking the graph
+        try:
+            self._value = self._func(*arguments)
+            self.error = None
+        except (ValueError, ZeroDivisionError) as e:
+            self._value = None
+            self.error = f"Calculation failed: {e}"
+
+    @property
+    def value(self) -> float:
+        self.graph.recompute()
+        if self.error is not None:
+            raise ValueError(self.error)
+        return self._value  # type: ignore[return-value]
+
+    def to_calculation(self) -> Calculation:
+        a, b = (operand._value if isinstance(operand, _Node) else operand
+                for operand in self.operands)
+        calculation = CalculationFactory.create(self.operation_name, a, b)  # type: ignore[arg-type]
+        calculation._result = self._value
+        return calculation
+
+    def __repr__(self) -> str:
+        return f"CalculationNode({self.label}: {self.operation_name})"
+
+
+class CalculationGraph:
+
+    def __init__(self):
+        self._nodes: List[_Node] = []
+        self._names: Dict[str, _Node] = {}
+        self._changed: List[InputNode] = []
+        self.recomputations = 0
+
+    def _add(self, node: _Node) -> None:
+        if node.name is not None:
+            self._names[node.name] = node
+        self._nodes.append(node)
+
+    def input(self, name: str, value: float) -> InputNode:
+        node = InputNode(self, name, value)
+        self._add(node)
+        return node
+
+    def calculation(self, operation_name: str, a: Operand, b: Operand,
+                    name: Optional[str] = None) -> CalculationNode:
+        node = CalculationNode(self, operation_name, a, b, name)
+        self._add(node)
+        return node
+
+    def __getitem__(self, name: str) -> _Node:
+        return self._names[name]
+
+    def __len__(self) -> int:
+        return len(self._nodes)
+
+    def set(self, node: Union[InputNode, str], value: float) -> None:
+        """Change an input; dependents recompute on the next read or recompute()."""
+        if isinstance(node, str):
+            node = self._names[node]  # type: ignore[assignment]
+        if not isinstance(node, InputNode):
+            raise ValueError(f"Only input nodes can be set, not {node!r}")
+        if node._value != value:
+            node._value = value
+            self._changed.append(node)
+
+    def recompute(self) -> List[CalculationNode]:
+        """Recompute the nodes affected by changed inputs; return them in order."""
+        if not self._changed:
+            return []
+        heap: List[Tuple[int, CalculationNode]] = []
+        queued = set()
+
+        def schedule(node: _Node) -> None:
+            for dependent in node.dependents:
+                if dependent.index not in queued:
+                    queued.add(dependent.index)
+                    heapq.heappush(heap, (dependent.index, dependent))
+
+        for node in self._changed:
+            schedule(node)
+        self._changed.clear()
+
+        recomputed = []
+        while heap:
+            _, node = heapq.heappop(heap)
+            before = (node._value, node.error)
+            node._evaluate()
+            recomputed.append(node)
+            # Early cutoff: an unchanged result leaves its dependents alone
+            if (node._value, node.error) != before:
+                schedule(node)
+        self.recomputations += len(recomputed)
+        return recomputed
+
+    def record(self, nodes: Optional[List[CalculationNode]] = None,
+               history: Optional[CalculationHistory] = None) -> int:
+        """Add current results of ``nodes`` (default: all) to the history.
+
+        Failed nodes are skipped. Returns the number of recorded calculations.
+        """
+        self.recompute()
+        if nodes is None:
+            nodes = [node for node in self._nodes if isinstance(node, CalculationNode)]
+        history = history if history is not None else CalculationHistory()
+        recorded = 0
+        for node in nodes:
+            if node.error is None:
+                history.add_calculation(node.to_calculation())
+                recorded += 1
+        return recorded
@@ -0,0 +1,123 @@
+"""
+Parallel execution module.
+
+This module runs large lists of ``(operation, a, b)`` jobs across a pool of
+worker processes. Jobs are split into chunks, evaluated with the functions
+registered in CalculationFactory, and merged back in input order. Given a
+SharedResultCache, workers reuse each other's results through it.
+"""
+
+import multiprocessing
+import pickle
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from app.backend import FloatBackend
+from app.cache import MISSING, SharedResultCache
+from app.calculation import Calculation, CalculationFactory, CalculationHistory
+
+Job = Tuple[str, float, float]
+
+
+def _run_chunk(operations: Dict[str, Callable[[float, float], float]],
+               jobs: Sequence[Job],
+               cache: Optional[SharedResultCache] = None) -> List[Optional[float]]:
+    # Shipped operations win over whatever the worker inherited or imported
+    table = dict(CalculationFactory._operations)
+    table.update(operations)
+    results: List[Optional[float]] = []
+    for job in jobs:
+        if cache is not None:
+            result = cache.get(job)
+            if result is not MISSING:
+                results.append(result)  # type: ignore[arg-type]
+                continue
+        name, a, b = job
+        try:
+            result = table[name](a, b)
+        except (ValueError, ZeroDivisionError):
+            results.append(None)
+            continue
+        if cache is not None:
+            cache.put(job, result)
+        results.append(result)
+    return results
+
+
+def _default_context() -> multiprocessing.context.BaseContext:
+    # fork lets workers inherit operations that cannot be pickled
+    if 'fork' in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context('fork')
+    return multiprocessing.get_context()  # pragma: no cover
+
+
+class ParallelExecutor:
+
+    def __init__(self, workers: Optional[int] = None, chunk_size: int = 10000,
+                 mp_context: Optional[multiprocessing.context.BaseContext] = None,
+                 cache: Optional[SharedResultCache] = None):
+        if chunk_size < 1:
+            raise ValueError("Chunk size must be at least 1")
+        self.workers = workers
+        self.chunk_size = chunk_size
+        self.mp_context = mp_context if mp_context is not None else _default_context()
+        self.cache = cache
+
+    def _shippable_operations(self, jobs: Sequence[Job]) -> Dict[str, Callable[[float, float], float]]:
+        """Collect the functions the jobs need, as registered right now."""
+        registered = CalculationFactory._operations
+        operations = {}
+        for name in {job[0] for job in jobs}:
+            if name not in registered:
+                raise ValueError(
+                    f"Unknown operation: {name}. "
+                    f"Available: {', '.join(registered.keys())}"
+                )
+            func = registered[name]
+            try:
+                pickle.dumps(func)
+            except (pickle.PicklingError, AttributeError, TypeError):
+                # A forked worker already holds the parent's registration
+                if self.mp_context.get_start_method() != 'fork':
+                    raise ValueError(
+                        f"Operation '{name}' cannot be sent to worker processes; "
+                        "register a module-level function instead"
+                    )
+                continue
+            operations[name] = func
+        return operations
+
+    def map(self, jobs: Iterable[Job]) -> List[Optional[float]]:
+        """Evaluate every job; failed jobs (e.g. division by zero) give ``None``."""
+        jobs = list(jobs)
+        operations = self._shippable_operations(jobs)
+        # Workers run the plain functions, which is the float backend
+        cache = None if self.cache is None else self.cache.namespaced(repr(FloatBackend()))
+        chunks = [jobs[i:i + self.chunk_size] for i in range(0, len(jobs), self.chunk_size)]
+        if self.workers == 1 or len(chunks) <= 1:
+            merged = [_run_chunk(operations, chunk, cache) for chunk in chunks]
+        else:
+            # A fresh pool per call so forked workers see current registrations;
+            # the cache travels by name and each chunk attaches to it
+            with ProcessPoolExecutor(self.workers, mp_context=self.mp_context) as pool:
+                merged = list(pool.map(_run_chunk, [operations] * len(chunks), chunks,
+                                       [cache] * len(chunks)))
+        return [result for chunk_results in merged for result in chunk_results]
+
+    def run(self, jobs: Iterable[Job], record: bool = True) -> List[Calculation]:
+        """Evaluate jobs in parallel and return calculations in input order.
+
+        Successful calculations are added to CalculationHistory in input
+        order when ``record`` is set; failed ones are returned unexecuted.
+        """
+        jobs = list(jobs)
+        history = CalculationHistory() if record else None
+        calculations = []
+        for (name, a, b), result in zip(jobs, self.map(jobs)):
+            calculation = CalculationFactory.create(name, a, b)
+            if result is not None:
+                calculation._result = result
+                if history is not None:
+                    history.add_calculation(calculation)
+            calculations.append(calculation)
+        return calculations
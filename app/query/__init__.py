@@ -0,0 +1,303 @@
+"""
+History query module.
+
+This module answers filters such as ``op=divide result>100`` over a
+calculation history without scanning it. A HistoryIndex keeps, per
+operation, the sequence numbers of its rows, and for each numeric column
+a sorted index of ``(value, sequence number)`` pairs. A query looks up
+the most selective condition in its index and only checks the remaining
+conditions against the rows that survive.
+
+Query syntax is whitespace-separated conditions, all of which must hold::
+
+    op=divide  result>100  a<=5  b!=0
+
+Fields are ``op`` (or ``operation``), ``a``, ``b`` and ``result``, in any
+case; operators are ``=`` (or ``==``), ``!=``, ``<``, ``<=``, ``>`` and
+``>=``. Operation names match exactly, as registered.
+"""
+
+import numbers
+import operator
+import re
+from array import array
+from bisect import bisect_left, bisect_right
+from typing import Callable, Dict, Iterable, Iterator, List, NamedTuple, Sequence, Set, Tuple, Union
+
+NUMERIC_FIELDS = ('a', 'b', 'result')
+
+_OPERATORS: Dict[str, Callable[[object, object], bool]] = {
+    '=': operator.eq,
+    '==': operator.eq,
+    '!=': operator.ne,
+    '<': operator.lt,
+    '<=': operator.le,
+    '>': operator.gt,
+    '>=': operator.ge,
+}
+
+_CONDITION = re.compile(r'^([A-Za-z_]\w*)\s*(==|!=|<=|>=|=|<|>)\s*(\S+)$')
+
+_INF = float('inf')
+
+
+class Condition(NamedTuple):
+    field: str
+    op: str
+    value: Union[str, float]
+
+    def test(self, value: object) -> bool:
+        # Like NULL in SQL, a missing result satisfies no condition
+        if value is None:
+            return False
+        target = self.value
+        if isinstance(target, float) and isinstance(value, numbers.Number) \
+                and not isinstance(value, (int, float)):
+            # Boxed values such as Decimal('0.3') compare with the literal
+            # in their own type rather than with its binary approximation
+            try:
+                target = type(value)(repr(target))  # type: ignore[call-arg]
+            except (TypeError, ValueError, ArithmeticError):
+                pass
+        return _OPERATORS[self.op](value, target)
+
+
+def parse_query(text: str) -> List[Condition]:
+    """Parse ``op=divide result>100`` style text into conditions."""
+    conditions = []
+    # Operators may be written with or without surrounding spaces
+    for term in re.findall(r'[^\s<>=!]+\s*(?:==|!=|<=|>=|=|<|>)\s*[^\s<>=!]+|\S+', text):
+        if term.lower() == 'and':
+            continue
+        match = _CONDITION.match(term)
+        if match is None:
+            raise ValueError(f"Invalid condition '{term}'. Expected e.g. op=divide or result>100")
+        field, op, value = match.groups()
+        field = field.lower()
+        if field == 'operation':
+            field = 'op'
+        if field == 'op':
+            if op not in ('=', '==', '!='):
+                raise ValueError(f"Operation names only support = and !=, not '{op}'")
+            # Operation names are case-sensitive, so only the field is normalized
+            conditions.append(Condition(field, op, value))
+        elif field in NUMERIC_FIELDS:
+            try:
+                conditions.append(Condition(field, op, float(value)))
+            except ValueError:
+                raise ValueError(f"Invalid number '{value}' in condition '{term}'")
+        else:
+            raise ValueError(f"Unknown field '{field}'. Available: op, {', '.join(NUMERIC_FIELDS)}")
+    if not conditions:
+        raise ValueError("Query needs at least one condition, e.g. op=divide")
+    return conditions
+
+
+class SortedColumn:
+    """Sorted ``(value, sequence number)`` pairs kept in bounded-size chunks.
+
+    Inserting bisects to a chunk and shifts at most ``2 * load`` entries, so
+    it stays cheap at any size; range lookups bisect the chunk maxima and
+    then the chunks themselves. NaN values are not indexed.
+    """
+
+    def __init__(self, load: int = 1000):
+        self.load = load
+        self._keys: List[array] = []
+        self._sequences: List[array] = []
+        # Largest key of each chunk, for locating chunks
+        self._maxes: List[float] = []
+        self._len = 0
+
+    def add(self, value: float, sequence: int) -> None:
+        if value != value:
+            return
+        self._len += 1
+        if not self._maxes:
+            self._keys.append(array('d', [value]))
+            self._sequences.append(array('q', [sequence]))
+            self._maxes.append(value)
+            return
+        # Equal keys go after existing ones so each chunk stays in append order
+        chunk = bisect_right(self._maxes, value)
+        if chunk == len(self._maxes):
+            chunk -= 1
+            self._maxes[chunk] = value
+        keys = self._keys[chunk]
+        position = bisect_right(keys, value)
+        keys.insert(position, value)
+        self._sequences[chunk].insert(position, sequence)
+        if len(keys) > 2 * self.load:
+            self._split(chunk)
+
+    def extend(self, values: Sequence[float], sequences: Sequence[int]) -> None:
+        """Add many values with their sequence numbers; one sort when empty."""
+        if self._len:
+            for value, sequence in zip(values, sequences):
+                self.add(value, sequence)
+            return
+        # Sorting positions by value is stable, so equal values stay in
+        # sequence order just as add() would leave them
+        order = sorted((i for i, value in enumerate(values) if value == value),
+                       key=values.__getitem__)
+        keys = array('d', [values[i] for i in order])
+        ordered = array('q', [sequences[i] for i in order])
+        for start in range(0, len(keys), self.load):
+            self._keys.append(keys[start:start + self.load])
+            self._sequences.append(ordered[start:start + self.load])
+            self._maxes.append(self._keys[-1][-1])
+        self._len = len(keys)
+
+    def _split(self, chunk: int) -> None:
+        keys, sequences = self._keys[chunk], self._sequences[chunk]
+        half = len(keys) // 2
+        self._keys[chunk:chunk + 1] = [keys[:half], keys[half:]]
+        self._sequences[chunk:chunk + 1] = [sequences[:half], sequences[half:]]
+        self._maxes[chunk:chunk + 1] = [keys[half - 1], keys[-1]]
+
+    def _spans(self, low: float, high: float, include_low: bool,
+               include_high: bool) -> Iterator[Tuple[int, int, int]]:
+        """Yield ``(chunk, start, stop)`` covering keys within the bounds."""
+        maxes = self._maxes
+        first = bisect_left(maxes, low) if include_low else bisect_right(maxes, low)
+        for chunk in range(first, len(maxes)):
+            keys = self._keys[chunk]
+            if keys[0] > high or (keys[0] == high and not include_high):
+                return
+            start = bisect_left(keys, low) if include_low else bisect_right(keys, low)
+            stop = bisect_right(keys, high) if include_high else bisect_left(keys, high)
+            if start < stop:
+                yield chunk, start, stop
+
+    def count(self, low: float, high: float, include_low: bool = True,
+              include_high: bool = True) -> int:
+        return sum(stop - start for _, start, stop in self._spans(low, high, include_low, include_high))
+
+    def range(self, low: float, high: float, include_low: bool = True,
+              include_high: bool = True) -> List[int]:
+        """Return sequence numbers of keys between ``low`` and ``high``, unordered."""
+        found: List[int] = []
+        for chunk, start, stop in self._spans(low, high, include_low, include_high):
+            found.extend(self._sequences[chunk][start:stop])
+        return found
+
+    def __len__(self) -> int:
+        return self._len
+
+
+class _Range:
+    """Intersection of a field's comparison conditions as one interval."""
+
+    def __init__(self):
+        self.low, self.high = -_INF, _INF
+        self.include_low = self.include_high = True
+
+    def narrow(self, op: str, value: float) -> None:
+        if op in ('=', '=='):
+            self.narrow('>=', value)
+            self.narrow('<=', value)
+        elif op in ('>', '>='):
+            if value > self.low or (value == self.low and op == '>'):
+                self.low, self.include_low = value, op == '>='
+        elif op in ('<', '<='):
+            if value < self.high or (value == self.high and op == '<'):
+                self.high, self.include_high = value, op == '<='
+
+    def arguments(self) -> Tuple[float, float, bool, bool]:
+        return self.low, self.high, self.include_low, self.include_high
+
+
+class _OperationIndex:
+
+    def __init__(self):
+        self.postings = array('q')
+        self.columns = {field: SortedColumn() for field in NUMERIC_FIELDS}
+
+
+class HistoryIndex:
+    """Per-operation postings and sorted operand and result columns.
+
+    Sequence numbers of boxed rows are also kept aside: the index only holds
+    float approximations of their values, so callers recheck them all.
+    """
+
+    def __init__(self):
+        self.operations: Dict[str, _OperationIndex] = {}
+        self.boxed: Set[int] = set()
+        self.rows = 0
+
+    def add(self, sequence: int, operation_name: str, a: float, b: float,
+            result: float, boxed: bool = False) -> None:
+        index = self.operations.get(operation_name)
+        if index is None:
+            index = self.operations[operation_name] = _OperationIndex()
+        index.postings.append(sequence)
+        columns = index.columns
+        columns['a'].add(a, sequence)
+        columns['b'].add(b, sequence)
+        columns['result'].add(result, sequence)
+        if boxed:
+            self.boxed.add(sequence)
+        self.rows += 1
+
+    def extend(self, rows: Iterable[Tuple[int, str, float, float, float, bool]]) -> None:
+        """Add many ``(sequence, operation, a, b, result, boxed)`` rows at once."""
+        grouped: Dict[str, List[tuple]] = {}
+        for row in rows:
+            grouped.setdefault(row[1], []).append(row)
+            if row[5]:
+                self.boxed.add(row[0])
+            self.rows += 1
+        for name, group in grouped.items():
+            index = self.operations.get(name)
+            if index is None:
+                index = self.operations[name] = _OperationIndex()
+            sequences = [row[0] for row in group]
+            index.postings.extend(sequences)
+            for position, field in enumerate(NUMERIC_FIELDS, 2):
+                index.columns[field].extend([row[position] for row in group], sequences)
+
+    def candidates(self, conditions: Iterable[Condition]) -> Tuple[List[int], bool]:
+        """Return ascending sequence numbers that may match, and whether they all do.
+
+        For each operation the query allows, the smallest of its postings and
+        its column ranges is used. The result is exact, except for boxed rows,
+        when the conditions on that one column were all the query had.
+        """
+        names = set(self.operations)
+        ranges: Dict[str, _Range] = {}
+        exact = True
+        for condition in conditions:
+            if condition.field == 'op':
+                if condition.op == '!=':
+                    names.discard(condition.value)  # type: ignore[arg-type]
+                else:
+                    names &= {condition.value}
+            elif condition.op == '!=':
+                exact = False
+            else:
+                ranges.setdefault(condition.field, _Range()).narrow(condition.op, condition.value)  # type: ignore[arg-type]
+
+        found: List[Iterable[int]] = []
+        for name in names:
+            index = self.operations[name]
+            counts = sorted((index.columns[field].count(*interval.arguments()), field)
+                            for field, interval in ranges.items())
+            if not counts or counts[0][0] >= len(index.postings):
+                found.append(index.postings)
+                # Postings won, so any ranges still have to be checked
+                exact = exact and not ranges
+                continue
+            smallest, field = counts[0]
+            sequences = index.columns[field].range(*ranges[field].arguments())
+            for count, field in counts[1:]:
+                # Intersecting another range pays off while it is not much larger
+                if count > 16 * smallest:
+                    exact = False
+                    break
+                sequences = set(sequences).intersection(
+                    index.columns[field].range(*ranges[field].arguments()))
+            found.append(sequences)
+        if len(found) == 1 and isinstance(found[0], array):
+            return found[0], exact  # type: ignore[return-value]
+        return sorted(sequence for sequences in found for sequence in sequences), exact
@@ -0,0 +1,115 @@
+"""
+Reduction module.
+
+This module implements the aggregate operations CalculationFactory offers
+next to its binary ones. Each reduction consumes an iterable of numbers in
+a single pass and keeps O(1) state, so a file of any size can be reduced
+without holding it in memory:
+
+* ``sum`` and ``mean`` use math.fsum, which tracks exact partial sums and
+  returns the correctly rounded total - no worse than Kahan or pairwise
+  summation, and computed in C
+* ``variance`` and ``stddev`` use Welford's online algorithm and are the
+  sample statistics (divided by n - 1)
+* ``min``, ``max`` and ``count``
+
+Every reduction returns ``(count, result)``. Given the active backend's
+operation table, ``sum`` and ``mean`` add and divide in the backend's type
+and ``min`` and ``max`` compare in it; ``variance`` and ``stddev`` always
+compute in float.
+"""
+
+import itertools
+import math
+import operator
+from collections import deque
+from typing import Callable, Dict, Iterable, Iterator, Optional, Tuple
+
+Operations = Optional[Dict[str, Callable[[object, object], object]]]
+Reducer = Callable[..., Tuple[int, object]]
+
+_first = operator.itemgetter(0)
+
+
+def _counted(values: Iterable[object]) -> Tuple[Iterator[object], Callable[[], int]]:
+    """Return ``values`` passed through a counter, and a function reading the count."""
+    counter = itertools.count()
+    # zip stops at the end of values before drawing from the counter, so the
+    # next number the counter yields is how many values went through
+    return map(_first, zip(values, counter)), counter.__next__
+
+
+def total(values: Iterable[object], operations: Operations = None) -> Tuple[int, object]:
+    values, count = _counted(values)
+    if operations is None:
+        result = math.fsum(values)  # type: ignore[arg-type]
+    else:
+        add = operations['add']
+        result = 0
+        for value in values:
+            result = add(result, value)
+    return count(), result
+
+
+def mean(values: Iterable[object], operations: Operations = None) -> Tuple[int, object]:
+    count, result = total(values, operations)
+    if count == 0:
+        raise ValueError("mean requires at least one value")
+    if operations is None:
+        return count, result / count  # type: ignore[operator]
+    return count, operations['divide'](result, count)
+
+
+def variance(values: Iterable[object], operations: Operations = None) -> Tuple[int, float]:
+    count = 0
+    running_mean = squares = 0.0
+    for value in (values if operations is None else map(float, values)):  # type: ignore[arg-type]
+        count += 1
+        delta = value - running_mean  # type: ignore[operator]
+        running_mean += delta / count
+        squares += delta * (value - running_mean)  # type: ignore[operator]
+    if count < 2:
+        raise ValueError("variance requires at least two values")
+    return count, squares / (count - 1)
+
+
+def stddev(values: Iterable[object], operations: Operations = None) -> Tuple[int, float]:
+    count, result = variance(values, operations)
+    return count, math.sqrt(result)
+
+
+def _extreme(pick: Callable[..., object], name: str) -> Reducer:
+    def reducer(values: Iterable[object], operations: Operations = None) -> Tuple[int, object]:
+        values, count = _counted(values)
+        # EAFP - the builtin raises on empty input, which is rare
+        try:
+            result = pick(values)
+        except ValueError:
+            raise ValueError(f"{name} requires at least one value")
+        return count(), result
+    reducer.__name__ = name
+    return reducer
+
+
+def count(values: Iterable[object], operations: Operations = None) -> Tuple[int, int]:
+    values, counted = _counted(values)
+    # A zero-length deque drains an iterator in C
+    deque(values, maxlen=0)
+    result = counted()
+    return result, result
+
+
+REDUCTIONS: Dict[str, Reducer] = {
+    'sum': total,
+    'mean': mean,
+    'variance': variance,
+    'stddev': stddev,
+    'min': _extreme(min, 'min'),
+    'max': _extreme(max, 'max'),
+    'count': count,
+}
+
+
+def read_numbers(lines: Iterable[str], parse: Callable[[str], object] = float) -> Iterator[object]:
+    """Lazily parse whitespace-separated numbers from ``lines``, e.g. an open file."""
+    return map(parse, itertools.chain.from_iterable(map(str.split, lines)))
@@ -0,0 +1,351 @@
+"""
+Calculation server module.
+
+This module exposes CalculationFactory over a local asyncio TCP or Unix
+socket server speaking newline-delimited JSON. Clients may pipeline any
+number of requests on one connection, and every connection keeps its own
+calculation history instead of the process-wide singleton. A request
+naming a ``session`` uses that session of the server's SessionRegistry
+instead, so a user's history can outlive a connection and is bounded by
+the registry's budget.
+
+Requests are JSON objects with an optional ``id`` echoed in the response:
+
+    {"id": 1, "op": "add", "a": 5, "b": 3}                  -> {"id": 1, "result": 8}
+    {"id": 2, "type": "batch", "op": "divide", "a": [..], "b": [..]}
+                                                            -> {"id": 2, "results": [..]}
+    {"id": 3, "type": "history"}                            -> {"id": 3, "history": [..]}
+    {"id": 4, "type": "clear"}                              -> {"id": 4, "cleared": true}
+    {"id": 5, "op": "add", "a": 1, "b": 2, "session": "ann"} -> {"id": 5, "result": 3}
+    {"id": 6, "type": "sessions"}                           -> {"id": 6, "sessions": {..}}
+
+Failures produce ``{"id": ..., "error": "..."}`` and never close the connection;
+a request longer than the server's line limit is skipped and answered with
+``{"id": null, "error": "Request too large"}``. Exact results, such as those
+of the decimal backend, are sent as strings so no digits are lost, and so
+are infinite results, which JSON cannot spell as numbers.
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import time
+from typing import Any, Dict, List, Optional
+
+from app.calculation import CalculationFactory, CalculationHistory, SessionHistory
+from app.session import SessionRegistry
+
+# Longest request or response line, in bytes; asyncio's default of 64 KiB
+# would not even hold a batch of 10000 numbers
+LINE_LIMIT = 16 * 1024 * 1024
+
+_INF = float('inf')
+
+
+def _number(message: Dict[str, Any], field: str) -> float:
+    value = message[field]
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        raise ValueError(f"Field '{field}' must be a number")
+    return value
+
+
+def _json_value(value: object) -> object:
+    # JSON has no nan or inf: failed rows become null and infinities the
+    # text 'inf' or '-inf'; exact numbers keep their digits as text
+    if isinstance(value, float):
+        if value != value:
+            return None
+        return value if abs(value) != _INF else str(value)
+    if isinstance(value, int):
+        return value
+    return str(value)
+
+
+async def read_line(reader: asyncio.StreamReader) -> Optional[bytes]:
+    """Return the next line, ``b''`` at the end, or None for a line over the reader's limit.
+    
+    An over-long line is read to its end and thrown away, so the line after
+    it is read normally.
+    """
+    try:
+        return await reader.readuntil(b'\n')
+    except asyncio.IncompleteReadError as e:
+        return e.partial
+    except asyncio.LimitOverrunError as e:
+        consumed = e.consumed
+    # The end of the line may not have arrived yet; drop what has, a buffer at a time
+    while True:
+        await reader.readexactly(consumed)
+        try:
+            await reader.readuntil(b'\n')
+            return None
+        except asyncio.IncompleteReadError:
+            return None
+        except asyncio.LimitOverrunError as e:
+            consumed = e.consumed
+
+
+def handle_message(message: Any, history: CalculationHistory,
+                   sessions: Optional[SessionRegistry] = None) -> Dict[str, Any]:
+    if not isinstance(message, dict):
+        return {'id': None, 'error': "Request must be a JSON object"}
+    response: Dict[str, Any] = {'id': message.get('id')}
+    kind = message.get('type', 'calculate')
+    try:
+        if 'session' in message:
+            if sessions is None:
+                raise ValueError("Named sessions are not enabled")
+            if not isinstance(message['session'], str):
+                raise ValueError("Field 'session' must be a string")
+            history = sessions.get(message['session'])
+        if kind == 'calculate':
+            calculation = CalculationFactory.create(
+                message['op'], _number(message, 'a'), _number(message, 'b'))
+            response['result'] = _json_value(calculation.execute())
+            history.add_calculation(calculation)
+        elif kind == 'batch':
+            results = CalculationFactory.execute_batch(message['op'], message['a'], message['b'])
+            response['results'] = [_json_value(result) for result in results]
+        elif kind == 'history':
+            response['history'] = [str(calculation) for calculation in history.get_history()]
+        elif kind == 'clear':
+            history.clear_history()
+            response['cleared'] = True
+        elif kind == 'sessions' and sessions is not None:
+            response['sessions'] = sessions.report()
+        else:
+            raise ValueError(f"Unknown message type: {kind}")
+    except KeyError as e:
+        response['error'] = f"Missing field: {e.args[0]}"
+    except (TypeError, ValueError, ArithmeticError) as e:
+        # ArithmeticError: e.g. an integer operand too large for a float
+        response['error'] = str(e)
+    return response
+
+
+def respond(line: bytes, history: CalculationHistory,
+            sessions: Optional[SessionRegistry] = None) -> bytes:
+    try:
+        message = json.loads(line)
+    except ValueError as e:
+        response: Dict[str, Any] = {'id': None, 'error': f"Invalid JSON: {e}"}
+    else:
+        response = handle_message(message, history, sessions)
+    return json.dumps(response).encode() + b'\n'
+
+
+class CalculationServer:
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0, path: Optional[str] = None,
+                 sessions: Optional[SessionRegistry] = None, limit: int = LINE_LIMIT):
+        self.host = host
+        self.port = port
+        self.path = path
+        self.sessions = sessions if sessions is not None else SessionRegistry()
+        self.limit = limit
+        self._server: Optional[asyncio.AbstractServer] = None
+
+    async def start(self) -> None:
+        if self.path is not None:
+            self._server = await asyncio.start_unix_server(self._handle, path=self.path,
+                                                           limit=self.limit)
+        else:
+            self._server = await asyncio.start_server(self._handle, self.host, self.port,
+                                                      limit=self.limit)
+            # Port 0 asks the OS for a free port; report the one we got
+            self.port = self._server.sockets[0].getsockname()[1]
+
+    async def serve_forever(self) -> None:  # pragma: no cover
+        await self._server.serve_forever()  # type: ignore[union-attr]
+
+    async def close(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def __aenter__(self) -> 'CalculationServer':
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc_info: object) -> None:
+        await self.close()
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        history = SessionHistory()
+        try:
+            # Requests are answered in arrival order; the client does not have
+            # to wait for one response before sending the next request
+            while True:
+                line = await read_line(reader)
+                if line is None:
+                    writer.write(b'{"id": null, "error": "Request too large"}\n')
+                elif not line:
+                    break
+                else:
+                    writer.write(respond(line, history, self.sessions))
+                await writer.drain()
+        except ConnectionError:  # pragma: no cover
+            pass
+        finally:
+            writer.close()
+
+
+class CalculationClient:
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter,
+                 session: Optional[str] = None):
+        self._reader = reader
+        self._writer = writer
+        # Every request names this session, if there is one
+        self._session = session
+        self._ids = itertools.count(1)
+        self._pending: Dict[int, 'asyncio.Future[Dict[str, Any]]'] = {}
+        self._listener = asyncio.ensure_future(self._listen())
+
+    @classmethod
+    async def connect(cls, host: str = '127.0.0.1', port: int = 0, path: Optional[str] = None,
+                      session: Optional[str] = None, limit: int = LINE_LIMIT) -> 'CalculationClient':
+        if path is not None:
+            reader, writer = await asyncio.open_unix_connection(path, limit=limit)
+        else:
+            reader, writer = await asyncio.open_connection(host, port, limit=limit)
+        return cls(reader, writer, session)
+
+    async def _listen(self) -> None:
+        try:
+            while True:
+                line = await read_line(self._reader)
+                if line is None:
+                    response: Dict[str, Any] = {'id': None, 'error': "Response too large"}
+                elif not line:
+                    break
+                else:
+                    response = json.loads(line)
+                request_id = response.get('id')
+                if request_id is None and self._pending:
+                    # Responses come in request order, so one the server could
+                    # not give an ID, e.g. "Request too large", is for the oldest
+                    request_id = next(iter(self._pending))
+                future = self._pending.pop(request_id, None)
+                if future is not None and not future.done():
+                    future.set_result(response)
+        finally:
+            for future in self._pending.values():
+                if not future.done():
+                    future.set_exception(ConnectionError("Connection closed"))
+            self._pending.clear()
+
+    async def request(self, message: Dict[str, Any]) -> Dict[str, Any]:
+        request_id = next(self._ids)
+        future = asyncio.get_running_loop().create_future()
+        self._pending[request_id] = future
+        message = dict(message, id=request_id)
+        if self._session is not None:
+            message['session'] = self._session
+        self._writer.write(json.dumps(message).encode() + b'\n')
+        await self._writer.drain()
+        response = await future
+        if 'error' in response:
+            raise ValueError(response['error'])
+        return response
+
+    async def calculate(self, operation: str, a: float, b: float) -> float:
+        return (await self.request({'op': operation, 'a': a, 'b': b}))['result']
+
+    async def batch(self, operation: str, a_values: List[float],
+                    b_values: List[float]) -> List[Optional[float]]:
+        message = {'type': 'batch', 'op': operation, 'a': a_values, 'b': b_values}
+        return (await self.request(message))['results']
+
+    async def history(self) -> List[str]:
+        return (await self.request({'type': 'history'}))['history']
+
+    async def clear_history(self) -> None:
+        await self.request({'type': 'clear'})
+
+    async def sessions(self) -> Dict[str, Dict[str, Optional[float]]]:
+        return (await self.request({'type': 'sessions'}))['sessions']
+
+    async def close(self) -> None:
+        self._writer.close()
+        await self._writer.wait_closed()
+        await self._listener
+
+
+async def load_test(clients: int = 4, requests: int = 10000, pipeline: int = 64,
+                    path: Optional[str] = None) -> Dict[str, float]:
+    """Run ``requests`` calculations per client against a local server.
+
+    Each client keeps ``pipeline`` requests in flight. Returns throughput in
+    requests per second and p50/p99 latency in milliseconds.
+    """
+    latencies: List[float] = []
+
+    async def timed(client: CalculationClient, i: int) -> None:
+        started = time.perf_counter()
+        await client.calculate('multiply', i, 1.5)
+        latencies.append(time.perf_counter() - started)
+
+    async def run_client(port: int) -> None:
+        client = await CalculationClient.connect(port=port, path=path)
+        for window in range(0, requests, pipeline):
+            await asyncio.gather(*(
+                timed(client, i) for i in range(window, min(window + pipeline, requests))
+            ))
+        await client.close()
+
+    async with CalculationServer(path=path) as server:
+        started = time.perf_counter()
+        await asyncio.gather(*(run_client(server.port) for _ in range(clients)))
+        elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        'requests': len(latencies),
+        'seconds': elapsed,
+        'requests_per_second': len(latencies) / elapsed,
+        'p50_ms': latencies[len(latencies) // 2] * 1000,
+        'p99_ms': latencies[min(int(len(latencies) * 0.99), len(latencies) - 1)] * 1000,
+    }
+
+
+async def serve(host: str, port: int, path: Optional[str],
+                sessions: SessionRegistry) -> None:  # pragma: no cover
+    async with CalculationServer(host, port, path, sessions) as server:
+        print(f"Calculation server listening on {path or f'{server.host}:{server.port}'}")
+        await server.serve_forever()
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    """Entry point for the calculation server."""
+    parser = argparse.ArgumentParser(prog='python -m app.server')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--unix', metavar='PATH', help='listen on a Unix socket instead of TCP')
+    parser.add_argument('--session-budget', type=int, metavar='BYTES',
+                        help='memory budget of each named session; its oldest calculations '
+                             'are dropped beyond it')
+    parser.add_argument('--session-idle', type=float, metavar='SECONDS',
+                        help='close named sessions unused for SECONDS')
+    parser.add_argument('--load-test', action='store_true',
+                        help='benchmark a local server instance and exit')
+    parser.add_argument('--clients', type=int, default=4)
+    parser.add_argument('--requests', type=int, default=10000, help='requests per client')
+    parser.add_argument('--pipeline', type=int, default=64, help='requests in flight per client')
+    args = parser.parse_args(argv)
+    try:
+        sessions = SessionRegistry(args.session_budget, args.session_idle)
+    except ValueError as e:
+        parser.error(str(e))
+
+    if not args.load_test:  # pragma: no cover
+        asyncio.run(serve(args.host, args.port, args.unix, sessions))
+        return
+
+    report = asyncio.run(load_test(args.clients, args.requests, args.pipeline, args.unix))
+    print(f"{report['requests']} requests in {report['seconds']:.2f}s")
+    print(f"  throughput  {report['requests_per_second']:.0f} req/s")
+    print(f"  p50 latency {report['p50_ms']:.3f} ms")
+    print(f"  p99 latency {report['p99_ms']:.3f} ms")
@@ -0,0 +1,8 @@
+"""
+Entry point for running the calculation server as a module.
+"""
+
+from app.server import main  # pragma: no cover
+
+if __name__ == "__main__":  # pragma: no cover
+    main()  # pragma: no cover
@@ -0,0 +1,149 @@
+"""
+Session module.
+
+This module hosts many independent calculation histories in one process.
+A SessionRegistry hands out named sessions, bounds each one's memory with
+a budget, reports their sizes and evicts sessions that have been idle for
+too long. The process-wide CalculationHistory singleton is the session
+called ``default``, so code that never names a session behaves as before.
+
+A budget is a number of bytes for the history's columns. A session over
+budget drops its oldest calculations, so one heavy user cannot drive the
+memory of the others; boxed values such as Decimal results are kept
+beside the columns and are not counted. Cleared histories kept for undo,
+redo and checkpoints get a second budget of the same size, beyond which
+the oldest are forgotten, so a session holds at most twice its budget.
+"""
+
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+from app.calculation import CalculationHistory, SessionHistory
+from app.storage import ROW_BYTES
+
+DEFAULT_SESSION = 'default'
+
+
+def budget_capacity(budget: int) -> int:
+    """Return how many calculations fit in ``budget`` bytes."""
+    if budget < ROW_BYTES:
+        raise ValueError(f"Session budget must be at least {ROW_BYTES} bytes")
+    return budget // ROW_BYTES
+
+
+class _Session:
+
+    __slots__ = ('history', 'budget', 'last_used')
+
+    def __init__(self, history: CalculationHistory, budget: Optional[int], last_used: float):
+        self.history = history
+        self.budget = budget
+        self.last_used = last_used
+
+
+class SessionRegistry:
+
+    def __init__(self, budget: Optional[int] = None, idle_timeout: Optional[float] = None,
+                 clock: Callable[[], float] = time.monotonic):
+        """Create a registry holding only the default session.
+
+        ``budget`` applies to every named session it creates and
+        ``idle_timeout`` is how many seconds a named session may go unused
+        before :meth:`get` sweeps it away. The default session keeps its
+        capacity unless :meth:`set_budget` changes it.
+        """
+        if budget is not None:
+            budget_capacity(budget)
+        self.budget = budget
+        self.idle_timeout = idle_timeout
+        self._clock = clock
+        self._lock = threading.Lock()
+        now = clock()
+        self._sessions: Dict[str, _Session] = {
+            DEFAULT_SESSION: _Session(CalculationHistory(), None, now),
+        }
+        self._swept = now
+
+    def get(self, name: str = DEFAULT_SESSION) -> CalculationHistory:
+        """Return the history of session ``name``, creating it on first use.
+
+        Fetching a session is what marks it as used, so callers should get
+        it per request rather than keep the history around.
+        """
+        with self._lock:
+            now = self._clock()
+            # Sweeping at most once per timeout keeps lookups O(1) on average
+            if self.idle_timeout is not None and now - self._swept >= self.idle_timeout:
+                self._evict(now - self.idle_timeout)
+                self._swept = now
+            session = self._sessions.get(name)
+            if session is None:
+                history = SessionHistory()
+                if self.budget is not None:
+                    history.set_capacity(budget_capacity(self.budget))
+                    history.retained_limit = self.budget
+                session = self._sessions[name] = _Session(history, self.budget, now)
+            session.last_used = now
+            return session.history
+
+    def set_budget(self, name: str, budget: Optional[int]) -> None:
+        """Bound session ``name`` to ``budget`` bytes, or lift its bound with ``None``."""
+        capacity = None if budget is None else budget_capacity(budget)
+        history = self.get(name)
+        with self._lock:
+            history.set_capacity(capacity)
+            history.retained_limit = budget
+            self._sessions[name].budget = budget
+
+    def names(self) -> List[str]:
+        with self._lock:
+            return list(self._sessions)
+
+    def close(self, name: str) -> None:
+        """Discard session ``name`` and its history."""
+        if name == DEFAULT_SESSION:
+            raise ValueError("The default session cannot be closed")
+        with self._lock:
+            if self._sessions.pop(name, None) is None:
+                raise ValueError(f"Unknown session: {name}")
+
+    def evict_idle(self, max_idle: Optional[float] = None) -> List[str]:
+        """Close named sessions unused for ``max_idle`` seconds; return their names.
+
+        ``max_idle`` defaults to the registry's idle timeout.
+        """
+        if max_idle is None:
+            max_idle = self.idle_timeout
+        if max_idle is None:
+            raise ValueError("No idle timeout given")
+        with self._lock:
+            return self._evict(self._clock() - max_idle)
+
+    def _evict(self, cutoff: float) -> List[str]:
+        idle = [name for name, session in self._sessions.items()
+                if session.last_used <= cutoff and name != DEFAULT_SESSION]
+        for name in idle:
+            del self._sessions[name]
+        return idle
+
+    def report(self) -> Dict[str, Dict[str, Optional[float]]]:
+        """Return calculations, column bytes, budget and idle seconds per session.
+
+        Bytes include cleared histories that undo and checkpoints still hold.
+        """
+        with self._lock:
+            sessions = list(self._sessions.items())
+            now = self._clock()
+        return {
+            name: {
+                'calculations': len(session.history),
+                'bytes': session.history.nbytes(),
+                'budget': session.budget,
+                'idle_seconds': now - session.last_used,
+            }
+            for name, session in sessions
+        }
+
+    def __len__(self) -> int:
+        return len(self._sessions)
@@ -0,0 +1,768 @@
+"""
+Calculation storage module.
+
+This module keeps calculation history as compact columns of packed values
+(struct-of-arrays) instead of one Python object per entry. Each row holds a
+one-byte opcode, a one-byte flags field and three float64 values.
+
+Rows are addressed by their absolute sequence number, so a bounded store can
+evict old rows without renumbering the ones it keeps. Every store owns the
+opcode table used to encode its rows.
+
+Whole columns move in bulk between stores and files: :func:`write_columns`
+and :func:`read_columns` handle a compact binary columnar format and CSV.
+"""
+
+import csv
+import mmap
+import operator
+import os
+import struct
+import sys
+import tempfile
+import weakref
+from array import array
+from contextlib import contextmanager
+from itertools import compress
+from typing import BinaryIO, Callable, Dict, Iterable, Iterator, List, Optional, TextIO, Tuple
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover
+    fcntl = None  # type: ignore[assignment]
+
+# Flags describing how to rebuild the original Python values of a row
+INT_A = 1
+INT_B = 2
+INT_RESULT = 4
+NO_RESULT = 8
+BOXED = 16
+
+BUILTIN_OPERATIONS = ('add', 'subtract', 'multiply', 'divide')
+
+Record = Tuple[int, int, float, float, float]
+# opcodes, flags, operand_a, operand_b, results
+Columns = Tuple[array, array, array, array, array]
+
+# On-disk layout of one row; padded so the float64 fields stay 8-byte aligned
+RECORD = struct.Struct('<BB6xddd')
+# In-memory cost of one row: the opcode and flags bytes and three float64 values
+ROW_BYTES = 2 + 3 * 8
+
+_NAN = float('nan')
+# Strided casts read and write file rows in place only on little-endian hosts
+_LITTLE_ENDIAN = sys.byteorder == 'little'
+# Clears the BOXED bit of every byte of a flags column
+_UNBOX = bytes(flags & ~BOXED for flags in range(256))
+
+
+class EvictedError(LookupError):
+    """A row that was evicted or cleared, and so can no longer be read.
+
+    Not an :class:`IndexError`: sequence iteration treats that as the end of
+    the rows, which would silently cut a stale view short.
+    """
+
+
+class OpcodeTable:
+
+    def __init__(self, names: Iterable[str] = BUILTIN_OPERATIONS):
+        self.names: List[str] = []
+        self.codes: Dict[str, int] = {}
+        for name in names:
+            self.code(name)
+
+    def code(self, name: str) -> int:
+        # EAFP - known names are the common case
+        try:
+            return self.codes[name]
+        except KeyError:
+            if len(self.names) > 0xFF:
+                raise ValueError("Opcode table is full (256 operations)")
+            self.codes[name] = len(self.names)
+            self.names.append(name)
+            return self.codes[name]
+
+    def name(self, code: int) -> str:
+        return self.names[code]
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+
+def _pack_value(value: object, int_flag: int) -> Tuple[int, float]:
+    if type(value) is float:
+        return 0, value  # type: ignore[return-value]
+    try:
+        packed = float(value)  # type: ignore[arg-type]
+    except (TypeError, ValueError, OverflowError):
+        return BOXED, _NAN
+    if type(value) is int and packed == value:
+        return int_flag, packed
+    # Anything a float64 column cannot reproduce exactly is kept boxed
+    return BOXED, packed
+
+
+def pack(a: object, b: object, result: object) -> Tuple[int, float, float, float]:
+    """Encode operands and result as float64 values plus a flags byte."""
+    flags_a, packed_a = _pack_value(a, INT_A)
+    flags_b, packed_b = _pack_value(b, INT_B)
+    if result is None:
+        flags_result, packed_result = NO_RESULT, _NAN
+    else:
+        flags_result, packed_result = _pack_value(result, INT_RESULT)
+    return flags_a | flags_b | flags_result, packed_a, packed_b, packed_result
+
+
+def unpack(flags: int, a: float, b: float,
+           result: float) -> Tuple[float, float, Optional[float]]:
+    """Inverse of :func:`pack` for rows that are not boxed."""
+    return (
+        int(a) if flags & INT_A else a,
+        int(b) if flags & INT_B else b,
+        None if flags & NO_RESULT else int(result) if flags & INT_RESULT else result,
+    )
+
+
+def empty_columns() -> Columns:
+    return array('B'), array('B'), array('d'), array('d'), array('d')
+
+
+def _column_bytes(columns: Iterable[array]) -> int:
+    return sum(column.buffer_info()[1] * column.itemsize for column in columns)
+
+
+def _gather(record: Callable[[int], Record], start: int, stop: int) -> Columns:
+    """Build columns for rows ``start`` to ``stop`` one record at a time."""
+    columns = empty_columns()
+    appends = [column.append for column in columns]
+    for index in range(start, stop):
+        for append, value in zip(appends, record(index)):
+            append(value)
+    return columns
+
+
+class ColumnarStore:
+
+    # Sequence number of the oldest row still readable; unbounded stores keep all
+    offset = 0
+    # Whether cleared() reuses this store's storage, so the old rows are lost
+    clears_in_place = False
+
+    def __init__(self, operations: Optional[OpcodeTable] = None):
+        self.operations = operations if operations is not None else OpcodeTable()
+        self.opcodes = array('B')
+        self.flags = array('B')
+        self.operand_a = array('d')
+        self.operand_b = array('d')
+        self.results = array('d')
+        # Sparse side table for rows flagged BOXED, keyed by row index
+        self.boxed: Dict[int, object] = {}
+
+    def append(self, opcode: int, flags: int, a: float, b: float, result: float,
+               boxed: object = None) -> None:
+        if flags & BOXED:
+            self.boxed[len(self.opcodes)] = boxed
+        self.opcodes.append(opcode)
+        self.flags.append(flags)
+        self.operand_a.append(a)
+        self.operand_b.append(b)
+        self.results.append(result)
+
+    def record(self, index: int) -> Record:
+        return (
+            self.opcodes[index],
+            self.flags[index],
+            self.operand_a[index],
+            self.operand_b[index],
+            self.results[index],
+        )
+
+    def payload(self, index: int) -> object:
+        return self.boxed.get(index)
+
+    def columns(self, start: int, stop: int) -> Columns:
+        """Return copies of the columns of rows ``start`` to ``stop``."""
+        return (self.opcodes[start:stop], self.flags[start:stop], self.operand_a[start:stop],
+                self.operand_b[start:stop], self.results[start:stop])
+
+    def extend(self, columns: Columns) -> None:
+        """Append whole columns of rows that are not boxed."""
+        for column, values in zip((self.opcodes, self.flags, self.operand_a,
+                                   self.operand_b, self.results), columns):
+            column.extend(values)
+
+    def stats(self) -> Dict[str, Optional[int]]:
+        return {'capacity': None, 'in_memory': len(self), 'evictions': 0, 'spilled': 0}
+
+    def cleared(self) -> 'ColumnarStore':
+        return ColumnarStore(self.operations)
+
+    def close(self) -> None:
+        """Nothing to release; the columns live in memory."""
+
+    def nbytes(self) -> int:
+        return _column_bytes((self.opcodes, self.flags, self.operand_a,
+                              self.operand_b, self.results))
+
+    def __len__(self) -> int:
+        return len(self.opcodes)
+
+
+class EvictionPolicy:
+    """Receives rows pushed out of a full :class:`RingStore`."""
+
+    # Whether reset() reuses this policy's storage, so the old rows are lost
+    clears_in_place = False
+
+    def __init__(self):
+        self.evictions = 0
+
+    def evict(self, record: Record, payload: object) -> None:
+        self.evictions += 1
+
+    def reset(self) -> 'EvictionPolicy':
+        return type(self)()
+
+    def close(self) -> None:
+        """Release whatever holds the evicted rows."""
+
+    def stats(self) -> Dict[str, int]:
+        return {'evictions': self.evictions, 'spilled': len(self)}
+
+    def __len__(self) -> int:
+        # Number of evicted rows that can still be read back
+        return 0
+
+
+class DropOldest(EvictionPolicy):
+    """Discard evicted rows; only the newest ``capacity`` rows stay readable."""
+
+
+def _close_segment(file: BinaryIO, temporary: Optional[str]) -> None:
+    file.close()
+    if temporary is not None:
+        os.remove(temporary)
+
+
+class SpillToDisk(EvictionPolicy):
+    """Append evicted rows to a segment file of fixed-width records.
+
+    Without a ``path`` the segment is a temporary file, removed by
+    :meth:`close` or at the latest when the process exits.
+    """
+
+    clears_in_place = True
+
+    def __init__(self, path: Optional[str] = None):
+        super().__init__()
+        temporary = path is None
+        if path is None:
+            fd, path = tempfile.mkstemp(prefix='calculation-history-', suffix='.seg')
+            os.close(fd)
+        self.path = path
+        self._temporary = temporary
+        self._file = open(path, 'w+b')
+        self._dirty = False
+        # Must not refer to self, or the policy would never be collected
+        self._finalizer = weakref.finalize(
+            self, _close_segment, self._file, path if temporary else None)
+
+    def evict(self, record: Record, payload: object) -> None:
+        # Boxed payloads cannot be serialized; the float64 approximation is kept
+        opcode, flags, a, b, result = record
+        self._file.seek(0, os.SEEK_END)
+        self._file.write(RECORD.pack(opcode, flags & ~BOXED, a, b, result))
+        self._dirty = True
+        super().evict(record, payload)
+
+    def record(self, index: int) -> Record:
+        if self._file.closed:
+            raise EvictedError("Spilled calculations were cleared")
+        if self._dirty:
+            self._file.flush()
+            self._dirty = False
+        self._file.seek(index * RECORD.size)
+        return RECORD.unpack(self._file.read(RECORD.size))  # type: ignore[return-value]
+
+    def reset(self) -> 'SpillToDisk':
+        self.close()
+        return SpillToDisk(None if self._temporary else self.path)
+
+    def close(self) -> None:
+        self._finalizer()
+
+    def __len__(self) -> int:
+        return self.evictions
+
+
+class RingStore:
+
+    def __init__(self, capacity: int, eviction: Optional[EvictionPolicy] = None,
+                 operations: Optional[OpcodeTable] = None):
+        if capacity < 1:
+            raise ValueError("History capacity must be at least 1")
+        self.operations = operations if operations is not None else OpcodeTable()
+        self.capacity = capacity
+        self.eviction = eviction if eviction is not None else DropOldest()
+        # The columns grow to the capacity as rows arrive, so a large bound
+        # costs nothing until it is used
+        self.opcodes, self.flags, self.operand_a, self.operand_b, self.results = empty_columns()
+        self.boxed: Dict[int, object] = {}
+        self.total = 0
+
+    @property
+    def memory_start(self) -> int:
+        return max(self.total - self.capacity, 0)
+
+    @property
+    def offset(self) -> int:
+        return self.memory_start - len(self.eviction)
+
+    def append(self, opcode: int, flags: int, a: float, b: float, result: float,
+               boxed: object = None) -> None:
+        if self.total < self.capacity:
+            self.opcodes.append(opcode)
+            self.flags.append(flags)
+            self.operand_a.append(a)
+            self.operand_b.append(b)
+            self.results.append(result)
+        else:
+            oldest = self.total - self.capacity
+            slot = oldest % self.capacity
+            self.eviction.evict(self._slot_record(slot), self.boxed.pop(oldest, None))
+            self.opcodes[slot] = opcode
+            self.flags[slot] = flags
+            self.operand_a[slot] = a
+            self.operand_b[slot] = b
+            self.results[slot] = result
+        if flags & BOXED:
+            self.boxed[self.total] = boxed
+        self.total += 1
+
+    def _slot_record(self, slot: int) -> Record:
+        return (
+            self.opcodes[slot],
+            self.flags[slot],
+            self.operand_a[slot],
+            self.operand_b[slot],
+            self.results[slot],
+        )
+
+    def record(self, index: int) -> Record:
+        if self.memory_start <= index < self.total:
+            return self._slot_record(index % self.capacity)
+        if self.offset <= index < self.memory_start:
+            return self.eviction.record(index - self.offset)
+        raise EvictedError("Calculation was evicted from history")
+
+    def payload(self, index: int) -> object:
+        return self.boxed.get(index)
+
+    def columns(self, start: int, stop: int) -> Columns:
+        memory_start = min(max(start, self.memory_start), stop)
+        columns = _gather(self.record, start, memory_start)
+        ring = (self.opcodes, self.flags, self.operand_a, self.operand_b, self.results)
+        # In-memory rows are at most two slices of the ring
+        while memory_start < stop:
+            slot = memory_start % self.capacity
+            end = min(slot + stop - memory_start, self.capacity)
+            for column, values in zip(columns, ring):
+                column.extend(values[slot:end])
+            memory_start += end - slot
+        return columns
+
+    def extend(self, columns: Columns) -> None:
+        for row in zip(*columns):
+            self.append(*row)
+
+    def stats(self) -> Dict[str, Optional[int]]:
+        stats: Dict[str, Optional[int]] = {
+            'capacity': self.capacity,
+            'in_memory': self.total - self.memory_start,
+        }
+        stats.update(self.eviction.stats())
+        return stats
+
+    @property
+    def clears_in_place(self) -> bool:
+        return self.eviction.clears_in_place
+
+    def cleared(self) -> 'RingStore':
+        return RingStore(self.capacity, self.eviction.reset(), self.operations)
+
+    def close(self) -> None:
+        self.eviction.close()
+
+    def nbytes(self) -> int:
+        return _column_bytes((self.opcodes, self.flags, self.operand_a,
+                              self.operand_b, self.results))
+
+    def __len__(self) -> int:
+        return self.total - self.offset
+
+
+# Mapped log layout: a fixed header, then RECORD-sized rows back to back.
+# The header holds the row count and the NUL-separated opcode names.
+LOG_MAGIC = b'CALCLOG1'
+LOG_HEADER = struct.Struct('<8sIIQ')
+LOG_HEADER_SIZE = 4096
+_NAMES_START = 32
+_NAMES_LENGTH = struct.Struct('<I')
+_COUNT = struct.Struct('<Q')
+_NAMES_LENGTH_AT = 12
+_COUNT_AT = 16
+
+
+class _LogOpcodeTable(OpcodeTable):
+    """Opcode table persisted in a log header and shared by every process."""
+
+    def __init__(self, log: 'MappedLogStore'):
+        self._log = log
+        super().__init__(())
+        self._reload()
+
+    def _reload(self) -> None:
+        self.names = self._log._read_names()
+        self.codes = {name: code for code, name in enumerate(self.names)}
+
+    def code(self, name: str) -> int:
+        try:
+            return self.codes[name]
+        except KeyError:
+            with self._log._locked():
+                # Another process may have assigned the name in the meantime
+                self._reload()
+                if name not in self.codes:
+                    super().code(name)
+                    self._log._write_names(self.names)
+            return self.codes[name]
+
+    def name(self, code: int) -> str:
+        if code >= len(self.names):
+            self._reload()
+        return self.names[code]
+
+
+class MappedLogStore:
+    """Append-only history log of fixed-width records in a memory-mapped file.
+
+    Reads unpack rows straight from the mapping, so reopening a log of any
+    size is instant, and processes appending to the same path share it.
+    """
+
+    offset = 0
+    clears_in_place = True
+
+    def __init__(self, path: str, reserve: int = 1024):
+        self.path = path
+        self._file = open(os.open(path, os.O_RDWR | os.O_CREAT, 0o644), 'r+b')
+        with self._locked():
+            if os.fstat(self._file.fileno()).st_size == 0:
+                self._create(reserve)
+            self._map = mmap.mmap(self._file.fileno(), 0)
+        if (len(self._map) < LOG_HEADER_SIZE
+                or LOG_HEADER.unpack_from(self._map, 0)[:2] != (LOG_MAGIC, RECORD.size)):
+            self.close()
+            raise ValueError(f"Not a calculation log: {path}")
+        self.operations: OpcodeTable = _LogOpcodeTable(self)
+
+    def _create(self, reserve: int) -> None:
+        names = '\0'.join(BUILTIN_OPERATIONS).encode()
+        header = LOG_HEADER.pack(LOG_MAGIC, RECORD.size, len(names), 0)
+        header = header.ljust(_NAMES_START, b'\0') + names
+        self._file.write(header.ljust(LOG_HEADER_SIZE, b'\0'))
+        self._file.truncate(LOG_HEADER_SIZE + reserve * RECORD.size)
+        self._file.flush()
+
+    @contextmanager
+    def _locked(self) -> Iterator[None]:
+        if fcntl is None:  # pragma: no cover
+            yield
+            return
+        fcntl.flock(self._file.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+
+    def _read_names(self) -> List[str]:
+        (length,) = _NAMES_LENGTH.unpack_from(self._map, _NAMES_LENGTH_AT)
+        raw = self._map[_NAMES_START:_NAMES_START + length]
+        return raw.decode().split('\0') if raw else []
+
+    def _write_names(self, names: List[str]) -> None:
+        raw = '\0'.join(names).encode()
+        if _NAMES_START + len(raw) > LOG_HEADER_SIZE:
+            raise ValueError("Calculation log opcode table is full")
+        self._map[_NAMES_START:_NAMES_START + len(raw)] = raw
+        _NAMES_LENGTH.pack_into(self._map, _NAMES_LENGTH_AT, len(raw))
+
+    def _remap(self, size: int) -> None:
+        # Grow geometrically; another process may already have grown the file
+        if os.fstat(self._file.fileno()).st_size < size:
+            self._file.truncate(max(size, 2 * len(self._map)))
+        self._map.close()
+        self._map = mmap.mmap(self._file.fileno(), 0)
+
+    def append(self, opcode: int, flags: int, a: float, b: float, result: float,
+               boxed: object = None) -> None:
+        # Boxed payloads cannot be serialized; the float64 approximation is kept
+        with self._locked():
+            count = len(self)
+            end = LOG_HEADER_SIZE + (count + 1) * RECORD.size
+            if end > len(self._map):
+                self._remap(end)
+            RECORD.pack_into(self._map, end - RECORD.size,
+                             opcode, flags & ~BOXED, a, b, result)
+            _COUNT.pack_into(self._map, _COUNT_AT, count + 1)
+
+    def record(self, index: int) -> Record:
+        if not 0 <= index < len(self):
+            raise IndexError("history log index out of range")
+        position = LOG_HEADER_SIZE + index * RECORD.size
+        if position + RECORD.size > len(self._map):
+            self._remap(position + RECORD.size)
+        return RECORD.unpack_from(self._map, position)  # type: ignore[return-value]
+
+    def payload(self, index: int) -> object:
+        return None
+
+    def columns(self, start: int, stop: int) -> Columns:
+        if not _LITTLE_ENDIAN:  # pragma: no cover
+            return _gather(self.record, start, stop)
+        columns = empty_columns()
+        if start >= stop:
+            return columns
+        begin = LOG_HEADER_SIZE + start * RECORD.size
+        end = LOG_HEADER_SIZE + stop * RECORD.size
+        if end > len(self._map):
+            self._remap(end)
+        # Each column is a strided view of the rows, copied out in C
+        with memoryview(self._map) as view:
+            rows = view[begin:end]
+            doubles = rows.cast('d')
+            columns[0].frombytes(rows[0::RECORD.size].tobytes())
+            columns[1].frombytes(rows[1::RECORD.size].tobytes())
+            for column, field in zip(columns[2:], (1, 2, 3)):
+                column.frombytes(doubles[field::4].tobytes())
+            doubles.release()
+            rows.release()
+        return columns
+
+    def extend(self, columns: Columns) -> None:
+        if not _LITTLE_ENDIAN:  # pragma: no cover
+            for row in zip(*columns):
+                self.append(*row)
+            return
+        count = len(columns[0])
+        # Rows are interleaved in a buffer with strided writes, then copied
+        # into the mapping at once
+        rows = bytearray(count * RECORD.size)
+        with memoryview(rows) as view:
+            doubles = view.cast('d')
+            view[0::RECORD.size] = columns[0].tobytes()
+            view[1::RECORD.size] = columns[1].tobytes().translate(_UNBOX)
+            for column, field in zip(columns[2:], (1, 2, 3)):
+                doubles[field::4] = column
+            doubles.release()
+        with self._locked():
+            length = len(self)
+            begin = LOG_HEADER_SIZE + length * RECORD.size
+            if begin + len(rows) > len(self._map):
+                self._remap(begin + len(rows))
+            self._map[begin:begin + len(rows)] = rows
+            _COUNT.pack_into(self._map, _COUNT_AT, length + count)
+
+    def stats(self) -> Dict[str, Optional[int]]:
+        return {'capacity': None, 'in_memory': 0, 'evictions': 0, 'spilled': 0,
+                'persisted': len(self)}
+
+    def cleared(self) -> 'MappedLogStore':
+        with self._locked():
+            _COUNT.pack_into(self._map, _COUNT_AT, 0)
+        return self
+
+    def nbytes(self) -> int:
+        # Rows live in the mapped file, which the OS pages in and out
+        return 0
+
+    def flush(self) -> None:
+        self._map.flush()
+
+    def close(self) -> None:
+        self._map.close()
+        self._file.close()
+
+    def __len__(self) -> int:
+        return _COUNT.unpack_from(self._map, _COUNT_AT)[0]
+
+
+# Columnar file layout: a header, the NUL-separated opcode names, then each
+# column as one contiguous little-endian block
+COLUMNAR_MAGIC = b'CALCCOL1'
+COLUMNAR_HEADER = struct.Struct('<8sIQ')
+CSV_HEADER = ['operation', 'a', 'b', 'result']
+TRANSFER_FORMATS = ('columnar', 'csv')
+
+
+def _write_columnar(file: BinaryIO, names: List[str], columns: Columns) -> None:
+    raw = '\0'.join(names).encode()
+    file.write(COLUMNAR_HEADER.pack(COLUMNAR_MAGIC, len(raw), len(columns[0])) + raw)
+    # Boxed payloads cannot be serialized; the float64 approximation is kept
+    columns = (columns[0], array('B', columns[1].tobytes().translate(_UNBOX))) + columns[2:]
+    for column in columns:
+        if not _LITTLE_ENDIAN:  # pragma: no cover
+            column = array(column.typecode, column)
+            column.byteswap()
+        # One write per column, however many rows there are
+        file.write(column)  # type: ignore[arg-type]
+
+
+def _read_columnar(file: BinaryIO) -> Tuple[List[str], Columns]:
+    header = file.read(COLUMNAR_HEADER.size)
+    if len(header) < COLUMNAR_HEADER.size or header[:8] != COLUMNAR_MAGIC:
+        raise ValueError(f"Not a calculation columnar file: {file.name}")
+    _, length, count = COLUMNAR_HEADER.unpack(header)
+    raw = file.read(length)
+    names = raw.decode().split('\0') if raw else []
+    columns = empty_columns()
+    # EAFP - a complete file is the common case
+    try:
+        for column in columns:
+            column.fromfile(file, count)  # type: ignore[arg-type]
+    except (EOFError, ValueError):
+        # fromfile raises ValueError when the file ends inside a value
+        raise ValueError(f"Truncated calculation columnar file: {file.name}")
+    if not _LITTLE_ENDIAN:  # pragma: no cover
+        for column in columns:
+            column.byteswap()
+    if count and max(columns[0]) >= len(names):
+        raise ValueError(f"Unknown opcode in calculation columnar file: {file.name}")
+    # A row claiming a boxed payload would have nothing to rebuild it from
+    return names, (columns[0], array('B', columns[1].tobytes().translate(_UNBOX))) + columns[2:]
+
+
+def _flagged(flags: bytes, flag: int) -> bytes:
+    """Return one byte per row, 1 where ``flag`` is set."""
+    return flags.translate(bytes(bool(value & flag) for value in range(256)))
+
+
+def _csv_column(values: array, flags: bytes, flag: int, empty: int = 0) -> Iterable[object]:
+    # Columns without integers or missing values are written as they are
+    integers = _flagged(flags, flag)
+    missing = _flagged(flags, empty)
+    if not any(integers) and not any(missing):
+        return values
+    return ['' if gap else int(value) if integer else value
+            for value, integer, gap in zip(values, integers, missing)]
+
+
+def _write_csv(file: TextIO, names: List[str], columns: Columns) -> None:
+    opcodes, flags, a, b, results = columns
+    raw = flags.tobytes()
+    writer = csv.writer(file, lineterminator='\n')
+    writer.writerow(CSV_HEADER)
+    # repr of a float round-trips exactly; a missing result is an empty field
+    writer.writerows(zip(map(names.__getitem__, opcodes), _csv_column(a, raw, INT_A),
+                         _csv_column(b, raw, INT_B), _csv_column(results, raw, INT_RESULT, NO_RESULT)))
+
+
+def _csv_number(text: str) -> object:
+    # EAFP - integers are tried first so they keep their INT flag
+    try:
+        return int(text)
+    except ValueError:
+        return float(text)
+
+
+_strip_sign = operator.methodcaller('lstrip', '-+')
+
+
+def _mask(texts: Iterable[str], test: Callable[[str], bool]) -> bytes:
+    """Return one byte per text, 1 where ``test`` holds."""
+    return bytes(map(test, texts))
+
+
+def _parse_csv_columns(rows: List[List[str]]) -> Tuple[List[str], Columns]:
+    """Parse whole columns with C-level maps; raise ValueError on anything unusual."""
+    if set(map(len, rows)) - {4}:
+        raise ValueError("ragged rows")
+    names_column, *texts = zip(*rows) if rows else ((), (), (), ())
+    operations = OpcodeTable(dict.fromkeys(names_column))
+    opcodes = array('B', map(operations.codes.__getitem__, names_column))
+    # An empty result field is a calculation that was never executed
+    masks = [_mask(texts[2], operator.not_)]
+    texts[2] = [text or 'nan' for text in texts[2]]
+    values = [array('d', map(float, column)) for column in texts]
+    for column, text in zip(values, texts):
+        masks.append(_mask(map(_strip_sign, text), str.isdigit))
+        # Integers a float64 cannot hold exactly need pack's rules
+        if max(map(abs, compress(column, masks[-1])), default=0) >= 2 ** 53:
+            raise ValueError("inexact integer")
+    # Each mask as one integer with a byte per row: distinct flag bits
+    # scale and add without carrying into the next row's byte
+    flags = sum(int.from_bytes(mask, 'little') * flag
+                for mask, flag in zip(masks, (NO_RESULT, INT_A, INT_B, INT_RESULT)))
+    return operations.names, (opcodes, array('B', flags.to_bytes(len(rows), 'little')),
+                              values[0], values[1], values[2])
+
+
+def _read_csv(file: TextIO) -> Tuple[List[str], Columns]:
+    reader = csv.reader(file)
+    if next(reader, None) != CSV_HEADER:
+        raise ValueError(f"Not a calculation CSV file (header {','.join(CSV_HEADER)}): {file.name}")
+    rows = list(reader)
+    # EAFP - well-formed files are parsed a column at a time; anything else
+    # goes row by row, which also finds the line to report
+    try:
+        return _parse_csv_columns(rows)
+    except ValueError:
+        pass
+    operations = OpcodeTable(())
+    code = operations.code
+    columns = empty_columns()
+    opcodes, flags, operand_a, operand_b, results = (column.append for column in columns)
+    for line, row in enumerate(rows, 2):
+        try:
+            name, a, b, result = row
+            packed = pack(_csv_number(a), _csv_number(b),
+                          _csv_number(result) if result else None)
+        except ValueError:
+            raise ValueError(f"Invalid row {line} in {file.name}: {','.join(row)}")
+        opcodes(code(name))
+        # Values a float64 cannot hold exactly keep their approximation
+        flags(packed[0] & ~BOXED)
+        operand_a(packed[1])
+        operand_b(packed[2])
+        results(packed[3])
+    return operations.names, columns
+
+
+def transfer_format(path: str, format: Optional[str] = None) -> str:
+    """Return ``format``, or the one a ``.csv`` suffix implies, defaulting to columnar."""
+    if format is None:
+        return 'csv' if path.lower().endswith('.csv') else 'columnar'
+    if format not in TRANSFER_FORMATS:
+        raise ValueError(f"Unknown format: {format}. Available: {', '.join(TRANSFER_FORMATS)}")
+    return format
+
+
+def write_columns(path: str, names: List[str], columns: Columns,
+                  format: Optional[str] = None) -> None:
+    """Write ``columns``, whose opcodes index ``names``, to the file at ``path``."""
+    if transfer_format(path, format) == 'csv':
+        with open(path, 'w', newline='', buffering=1 << 20) as text:
+            _write_csv(text, names, columns)
+    else:
+        with open(path, 'wb') as binary:
+            _write_columnar(binary, names, columns)
+
+
+def read_columns(path: str, format: Optional[str] = None) -> Tuple[List[str], Columns]:
+    """Read the file at ``path``; return its opcode names and columns."""
+    if transfer_format(path, format) == 'csv':
+        with open(path, newline='', buffering=1 << 20) as text:
+            return _read_csv(text)
+    with open(path, 'rb') as binary:
+        return _read_columnar(binary)
@@ -0,0 +1,80 @@
+"""
+Streaming calculator module.
+
+This module evaluates ``operation a b`` lines from a file or stdin through a
+generator pipeline and writes one result per input line, so arbitrarily
+large workloads run in constant memory without any prompts.
+"""
+
+from typing import IO, Iterable, Iterator, List, Optional, Tuple
+
+from app.calculation import CalculationFactory, CalculationHistory
+
+ERROR_PREFIX = 'error: '
+
+
+def tokenize(lines: Iterable[str]) -> Iterator[Tuple[int, List[str]]]:
+    for lineno, line in enumerate(lines, 1):
+        fields = line.split()
+        # Blank lines and comments produce no output
+        if fields and not fields[0].startswith('#'):
+            yield lineno, fields
+
+
+def evaluate(tokens: Iterable[Tuple[int, List[str]]],
+             history: Optional[CalculationHistory] = None) -> Iterator[str]:
+    """Yield one output line per token, recording into ``history`` if given."""
+    # Resolved once for the whole stream
+    operations = CalculationFactory._active_operations
+    parse = CalculationFactory.get_backend().parse
+    for lineno, fields in tokens:
+        if len(fields) != 3:
+            yield f"{ERROR_PREFIX}line {lineno}: expected 'operation a b'\n"
+            continue
+        name, a, b = fields
+        name = name.lower()
+        func = operations.get(name)
+        if func is None:
+            yield f"{ERROR_PREFIX}line {lineno}: unknown operation '{name}'\n"
+            continue
+        # EAFP - parsing numbers is the fast path, failures are rare
+        try:
+            x, y = parse(a), parse(b)
+        except ValueError:
+            yield f"{ERROR_PREFIX}line {lineno}: invalid number in '{a} {b}'\n"
+            continue
+
+        if history is None and CalculationFactory._metrics is None:
+            # Without history or metrics there is no Calculation object to build
+            try:
+                yield f"{func(x, y)}\n"
+            except (ValueError, ZeroDivisionError) as e:
+                yield f"{ERROR_PREFIX}line {lineno}: Calculation failed: {e}\n"
+        else:
+            calculation = CalculationFactory.create(name, x, y)
+            try:
+                result = calculation.execute()
+            except ValueError as e:
+                yield f"{ERROR_PREFIX}line {lineno}: {e}\n"
+                continue
+            if history is not None:
+                history.add_calculation(calculation)
+            yield f"{result}\n"
+
+
+def run_stream(infile: Iterable[str], outfile: IO[str], record: bool = False,
+               chunk_lines: int = 8192) -> int:
+    """Evaluate every line of ``infile`` into ``outfile``; return the error count."""
+    history = CalculationHistory() if record else None
+    errors = 0
+    buffer: List[str] = []
+    for line in evaluate(tokenize(infile), history):
+        if line.startswith(ERROR_PREFIX):
+            errors += 1
+        buffer.append(line)
+        if len(buffer) >= chunk_lines:
+            outfile.write(''.join(buffer))
+            buffer.clear()
+    outfile.write(''.join(buffer))
+    outfile.flush()
+    return errors
@@ -0,0 +1,90 @@
+"""
+Stress benchmark for concurrent CalculationHistory appends.
+
+Runs the same number of appends per thread for increasing thread counts
+and reports aggregate append throughput of the sharded history next to a
+history that serializes every append on one lock, best of ``--repeat``
+runs. On interpreters with a GIL the aggregate rate is bounded by the GIL
+whichever history is used. A sharded append costs less than a locked one,
+but a merge that has to order rows from several shards costs about twice
+as much per row as one from a single shard: on one core the sharded
+history leads with one or two writers, is about even at four and trails
+by about a fifth at eight. What sharding buys there is that readers and
+merges never hold writers up. Usage:
+
+    python benchmarks/history_threads.py [--appends N] [--threads 1 2 4 8] [--repeat R]
+"""
+
+import argparse
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.calculation import CalculationFactory, SessionHistory  # noqa: E402
+from app.storage import ColumnarStore, pack  # noqa: E402
+
+
+class LockedHistory:
+    """Baseline: one lock around every append into a single store."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._store = ColumnarStore()
+
+    def add_calculation(self, calculation) -> None:
+        with self._lock:
+            flags, a, b, result = pack(
+                calculation.operand_a, calculation.operand_b, calculation.get_result())
+            self._store.append(self._store.operations.code(calculation.operation_name),
+                               flags, a, b, result)
+
+    def __len__(self) -> int:
+        return len(self._store)
+
+
+def measure(threads: int, appends: int, history_type=SessionHistory) -> float:
+    """Return appends per second for ``threads`` concurrent writers."""
+    history = history_type()
+    calculation = CalculationFactory.create('add', 1.5, 2.5)
+    calculation.execute()
+    barrier = threading.Barrier(threads + 1)
+
+    def writer() -> None:
+        add = history.add_calculation
+        barrier.wait()
+        for _ in range(appends):
+            add(calculation)
+
+    workers = [threading.Thread(target=writer) for _ in range(threads)]
+    for worker in workers:
+        worker.start()
+    barrier.wait()
+    started = time.perf_counter()
+    for worker in workers:
+        worker.join()
+    # Include the final merge so buffered rows are not counted for free
+    assert len(history) == threads * appends
+    return threads * appends / (time.perf_counter() - started)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--appends', type=int, default=200000, help='appends per thread')
+    parser.add_argument('--threads', type=int, nargs='+', default=[1, 2, 4, 8])
+    parser.add_argument('--repeat', type=int, default=5, help='runs per figure; the best is kept')
+    args = parser.parse_args()
+
+    baseline = None
+    print(f"{'threads':>7}  {'sharded/s':>12}  {'vs 1 thread':>11}  {'one lock/s':>12}")
+    for count in args.threads:
+        rate = max(measure(count, args.appends) for _ in range(args.repeat))
+        locked = max(measure(count, args.appends, LockedHistory) for _ in range(args.repeat))
+        baseline = baseline or rate
+        print(f"{count:>7}  {rate:>12,.0f}  {rate / baseline:>10.2f}x  {locked:>12,.0f}")
+
+
+if __name__ == "__main__":
+    main()
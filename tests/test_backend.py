@@ -0,0 +1,194 @@
+"""
+Unit tests for numeric backends.
+
+This module tests number parsing and conversion in each backend, the
+operation tables they resolve, and how the factory, batches, streams,
+expressions and graphs use the selected backend.
+"""
+
+import io
+import math
+from array import array
+from decimal import Decimal
+from fractions import Fraction
+
+import pytest
+from app.backend import (
+    BACKENDS, DecimalBackend, FloatBackend, FractionBackend, IntBackend, get_backend,
+)
+from app.calculation import CalculationFactory, CalculationHistory, SessionHistory
+from app.expression import compile_expression
+from app.graph import CalculationGraph
+from app.operation import add
+from app.stream import run_stream
+
+
+class TestBackends:
+    """Test cases for the backends themselves."""
+    
+    def test_get_backend(self):
+        """Test creating backends by name."""
+        assert sorted(BACKENDS) == ['decimal', 'float', 'fraction', 'int']
+        assert isinstance(get_backend('int'), IntBackend)
+        assert get_backend('decimal', 50).precision == 50
+        assert repr(get_backend('decimal', 5)) == "DecimalBackend(precision=5)"
+        assert repr(get_backend('fraction')) == "FractionBackend()"
+        with pytest.raises(ValueError, match="Unknown backend: complex. Available: float"):
+            get_backend('complex')
+        with pytest.raises(ValueError, match="Precision only applies"):
+            get_backend('int', 10)
+        with pytest.raises(ValueError, match="Precision must be at least 1"):
+            DecimalBackend(0)
+    
+    def test_float_table_is_unchanged(self):
+        """Test that the float backend adds no wrapper at all."""
+        operations = {'add': add}
+        assert FloatBackend().resolve(operations) is operations
+        assert FloatBackend().convert(0.1) == 0.1
+    
+    @pytest.mark.parametrize('backend, text, expected', [
+        (FloatBackend(), '0.1', 0.1),
+        (DecimalBackend(), ' 0.1 ', Decimal('0.1')),
+        (FractionBackend(), '1/3', Fraction(1, 3)),
+        (IntBackend(), '12345678901234567890', 12345678901234567890),
+    ])
+    def test_parse(self, backend, text, expected):
+        """Test parsing typed numbers."""
+        value = backend.parse(text)
+        assert value == expected and type(value) is type(expected)
+    
+    @pytest.mark.parametrize('backend, text', [
+        (DecimalBackend(), 'abc'),
+        (FractionBackend(), '0.1.2'),
+        (IntBackend(), '2.5'),
+    ])
+    def test_parse_invalid(self, backend, text):
+        """Test that unparsable numbers raise ValueError."""
+        with pytest.raises(ValueError):
+            backend.parse(text)
+    
+    def test_convert(self):
+        """Test that floats convert to the number they print as."""
+        assert DecimalBackend().convert(0.1) == Decimal('0.1')
+        assert DecimalBackend(3).convert(Decimal('1.23456')) == Decimal('1.23456')
+        assert DecimalBackend(3).convert(2) == Decimal(2)
+        assert FractionBackend().convert(0.1) == Fraction(1, 10)
+        assert FractionBackend().convert(Decimal('0.5')) == Fraction(1, 2)
+        assert IntBackend().convert(4.0) == 4
+        for value in (2.5, math.inf):
+            with pytest.raises(ValueError, match="is not an integer"):
+                IntBackend().convert(value)
+        with pytest.raises(ValueError, match="is not a decimal number"):
+            DecimalBackend().convert('x')
+    
+    def test_decimal_operations(self):
+        """Test precision, division by zero and trapped conditions."""
+        table = DecimalBackend(10).resolve(CalculationFactory._operations)
+        assert table['divide'](1, 3) == Decimal('0.3333333333')
+        assert table['add'](0.1, 0.2) == Decimal('0.3')
+        with pytest.raises(ValueError, match="Cannot divide by zero"):
+            table['divide'](1, 0)
+        huge = Decimal('9e999999')
+        with pytest.raises(ValueError, match="Decimal overflow"):
+            table['multiply'](huge, huge)
+    
+    def test_registered_operations_are_wrapped(self):
+        """Test that custom operations get converted operands and precision."""
+        operations = dict(CalculationFactory._operations, average=lambda a, b: (a + b) / 2,
+                          ratio=lambda a, b: a / b)
+        assert DecimalBackend(4).resolve(operations)['ratio'](1, 3) == Decimal('0.3333')
+        assert FractionBackend().resolve(operations)['average'](1, 0.5) == Fraction(3, 4)
+        # A replaced built-in is used as registered rather than as the builtin
+        operations['divide'] = lambda a, b: a // b
+        assert IntBackend().resolve(operations)['divide'](7, 2) == 3
+    
+    def test_int_divide_floors(self):
+        """Test the int backend's floor division."""
+        table = IntBackend().resolve(CalculationFactory._operations)
+        assert table['divide'](7, 2) == 3
+        assert table['divide'](-7, 2) == -4
+        assert table['multiply'](2 ** 64, 2 ** 64) == 2 ** 128
+        with pytest.raises(ValueError, match="Cannot divide by zero"):
+            table['divide'](1, 0)
+
+
+class TestFactoryBackend:
+    """Test cases for selecting a backend through CalculationFactory."""
+    
+    def setup_method(self):
+        """Clear history before each test."""
+        CalculationHistory().clear_history()
+    
+    def teardown_method(self):
+        """Return to the float backend."""
+        CalculationFactory.set_backend('float')
+    
+    def test_default_is_float(self):
+        """Test that the float backend dispatches to the registered functions."""
+        assert CalculationFactory.get_backend().name == 'float'
+        assert CalculationFactory._active_operations is CalculationFactory._operations
+        assert CalculationFactory.create('add', 1, 2).operation_func is add
+    
+    def test_decimal_calculations_in_history(self):
+        """Test exact results end up in history unchanged."""
+        backend = CalculationFactory.set_backend('decimal', precision=40)
+        calculation = CalculationFactory.create('divide', backend.parse('1'), backend.parse('7'))
+        assert str(calculation.execute()) == "0.1428571428571428571428571428571428571429"
+        history = SessionHistory()
+        history.add_calculation(calculation)
+        assert history.get_last_calculation().get_result() == calculation.get_result()
+    
+    def test_backend_switch_clears_cache(self):
+        """Test that cached float results are not served to another backend."""
+        CalculationFactory.enable_cache()
+        try:
+            assert CalculationFactory.create('add', 0.1, 0.2).execute() == 0.1 + 0.2
+            CalculationFactory.set_backend(FractionBackend())
+            assert CalculationFactory.create('add', 0.1, 0.2).execute() == Fraction(3, 10)
+        finally:
+            CalculationFactory.disable_cache()
+    
+    def test_register_operation_under_backend(self):
+        """Test that registering re-resolves the active table."""
+        CalculationFactory.set_backend('fraction')
+        original = dict(CalculationFactory._operations)
+        try:
+            CalculationFactory.register_operation('half', lambda a, b: (a + b) / 2)
+            assert CalculationFactory.create('half', 1, 0).execute() == Fraction(1, 2)
+        finally:
+            CalculationFactory._operations.clear()
+            CalculationFactory._operations.update(original)
+            CalculationFactory.set_backend('float')
+    
+    def test_exact_batch(self):
+        """Test that exact backends return lists with nan for failures."""
+        CalculationFactory.set_backend('int')
+        results = CalculationFactory.execute_batch('divide', [7, 8, 9], [2, 0, 3])
+        assert results[0] == 3 and math.isnan(results[1]) and results[2] == 3
+        assert isinstance(results, list)
+        with pytest.raises(ValueError, match="cannot write into a float buffer"):
+            CalculationFactory.execute_batch('add', [1], [2], out=array('d', [0.0]))
+        with pytest.raises(ValueError, match="cannot write into a float buffer"):
+            compile_expression('x + 1').evaluate_many({'x': [1]}, out=array('d', [0.0]))
+    
+    def test_stream_uses_backend(self):
+        """Test that streamed lines are parsed and computed in the backend."""
+        CalculationFactory.set_backend('decimal')
+        out = io.StringIO()
+        assert run_stream(io.StringIO("add 0.1 0.2\ndivide 1 x\n"), out) == 1
+        assert out.getvalue().splitlines()[0] == "0.3"
+    
+    def test_expressions_use_backend(self):
+        """Test that expressions compiled under an exact backend stay exact."""
+        CalculationFactory.set_backend('fraction')
+        assert compile_expression('1 / 3 + 1 / 6').evaluate() == Fraction(1, 2)
+        assert compile_expression('x / 3').evaluate_many({'x': [1, 2]}) == [Fraction(1, 3), Fraction(2, 3)]
+        CalculationFactory.set_backend('float')
+        assert compile_expression('1 / 4').evaluate() == 0.25
+    
+    def test_graph_uses_backend(self):
+        """Test that graph nodes compute in the backend active when created."""
+        CalculationFactory.set_backend('decimal')
+        graph = CalculationGraph()
+        total = graph.calculation('add', graph.input('x', Decimal('0.1')), 0.2)
+        assert total.value == Decimal('0.3')
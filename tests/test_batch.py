@@ -0,0 +1,153 @@
+"""
+Unit tests for tolerant batch execution.
+
+This module tests CalculationFactory.execute_tolerant: error-code masks,
+the nan and IEEE policies, exact backends, and the BatchResult summary.
+"""
+
+import math
+from array import array
+from decimal import Decimal
+
+import pytest
+from app.batch import (
+    DIVISION_BY_ZERO, INVALID, OK, OVERFLOW, BatchResult, evaluate,
+)
+from app.calculation import CalculationFactory
+from app.operation import divide
+
+INF = float('inf')
+
+
+def checked(a: float, b: float) -> float:
+    """Custom operation failing in every way the batch records."""
+    if b < 0:
+        raise ValueError("negative")
+    if b == 1:
+        return 1 / 0
+    if b == 2:
+        return 10 ** 400
+    return a + b
+
+
+class TestBatchResult:
+    """Test cases for BatchResult."""
+    
+    def test_summary_and_failures(self):
+        """Test failed rows by reason."""
+        result = BatchResult([], bytearray([OK, DIVISION_BY_ZERO, INVALID, DIVISION_BY_ZERO]))
+        assert (len(result), result.failed) == (4, 3)
+        assert result.failures() == [1, 2, 3]
+        assert result.failures(DIVISION_BY_ZERO) == [1, 3]
+        assert result.summary() == {'division by zero': 2, 'invalid operands': 1}
+        assert str(result) == "3 of 4 rows failed: division by zero at 1, 3; invalid operands at 2"
+        assert repr(result) == "BatchResult(4 rows, 3 failed)"
+    
+    def test_str_is_compact(self):
+        """Test that runs of rows become ranges and long lists are cut short."""
+        codes = bytearray(40)
+        for index in [0, 1, 2, 5, 9, 10, 20, 30, 31, 32, 39]:
+            codes[index] = DIVISION_BY_ZERO
+        result = BatchResult([], codes)
+        assert str(result) == "11 of 40 rows failed: division by zero at 0-2, 5, 9-10, 20, 30-32 and 1 more"
+        assert str(BatchResult([], bytearray(3))) == "0 of 3 rows failed"
+        assert BatchResult([], bytearray(3)).summary() == {}
+
+
+class TestExecuteTolerant:
+    """Test cases for CalculationFactory.execute_tolerant."""
+    
+    def test_divide_by_zero_under_nan_policy(self):
+        """Test that zero divisors are flagged and give nan."""
+        result = CalculationFactory.execute_tolerant('divide', [10, 1, 9, 0], [2, 0, 3, -0.0])
+        assert result.values[0] == 5 and result.values[2] == 3
+        assert math.isnan(result.values[1]) and math.isnan(result.values[3])
+        assert list(result.codes) == [OK, DIVISION_BY_ZERO, OK, DIVISION_BY_ZERO]
+        assert str(result) == "2 of 4 rows failed: division by zero at 1, 3"
+    
+    def test_divide_by_zero_under_ieee_policy(self):
+        """Test IEEE 754 results: signed infinities and nan for 0 / 0."""
+        a = array('d', [1.0, -2.0, 1.0, 0.0, math.nan, 6.0])
+        b = array('d', [0.0, 0.0, -0.0, 0.0, 0.0, 3.0])
+        result = CalculationFactory.execute_tolerant('divide', a, b, policy='ieee')
+        assert list(result.values[:3]) == [INF, -INF, -INF]
+        assert math.isnan(result.values[3]) and math.isnan(result.values[4])
+        assert result.values[5] == 2.0
+        assert result.failures() == [0, 1, 2, 3, 4]
+    
+    def test_clean_columns(self):
+        """Test that clean columns match execute_batch with an all-zero mask."""
+        for operation in ('add', 'divide'):
+            result = CalculationFactory.execute_tolerant(operation, [1, 2, 3], [4, 5, 6])
+            assert result.values == CalculationFactory.execute_batch(operation, [1, 2, 3], [4, 5, 6])
+            assert result.codes == bytearray(3) and result.failed == 0
+    
+    def test_into_output_buffer_in_blocks(self, monkeypatch):
+        """Test blocks with and without failures written into a caller's buffer."""
+        monkeypatch.setattr('app.batch.BLOCK', 4)
+        b = array('d', [1.0] * 10)
+        b[6] = 0.0
+        out = bytearray(80)
+        result = CalculationFactory.execute_tolerant('divide', range(10), b, 'ieee', out=out)
+        assert result.values is out
+        assert array('d', out).tolist() == [0, 1, 2, 3, 4, 5, INF, 7, 8, 9]
+        assert result.failures() == [6]
+        with pytest.raises(ValueError, match="holds 10 values, not 1"):
+            CalculationFactory.execute_tolerant('add', [1], [2], out=out)
+    
+    def test_registered_operation_failures(self):
+        """Test that each exception a custom operation raises gets its code."""
+        CalculationFactory.register_operation('checked', checked)
+        try:
+            for policy in ('nan', 'ieee'):
+                result = CalculationFactory.execute_tolerant('checked', [5] * 4, [0, -1, 1, 2], policy)
+                assert result.values[0] == 5
+                assert all(math.isnan(value) for value in result.values[1:])
+                assert list(result.codes) == [OK, INVALID, DIVISION_BY_ZERO, OVERFLOW]
+        finally:
+            CalculationFactory.unregister_operation('checked')
+    
+    def test_replaced_divide_is_not_second_guessed(self):
+        """Test that a registered divide is run on zero divisors too."""
+        CalculationFactory.register_operation('divide', lambda a, b: a / b if b else 0.0)
+        try:
+            result = CalculationFactory.execute_tolerant('divide', [1, 4], [0, 2])
+            assert list(result.values) == [0.0, 2.0] and result.failed == 0
+        finally:
+            CalculationFactory.register_operation('divide', divide)
+    
+    def test_operands_beyond_float_range(self):
+        """Test that a block with huge ints falls back to one row at a time."""
+        result = CalculationFactory.execute_tolerant('divide', [10 ** 400, 1, 3], [0, 2, 0], 'ieee')
+        assert math.isnan(result.values[0])
+        assert list(result.values[1:]) == [0.5, INF]
+        assert result.failures(DIVISION_BY_ZERO) == [0, 2]
+    
+    def test_exact_backend(self):
+        """Test that exact backends record failures in a list of exact values."""
+        CalculationFactory.set_backend('decimal')
+        try:
+            result = CalculationFactory.execute_tolerant(
+                'divide', [Decimal(1), Decimal(3)], [Decimal(0), Decimal(4)])
+            assert math.isnan(result.values[0]) and result.values[1] == Decimal('0.75')
+            assert list(result.codes) == [DIVISION_BY_ZERO, OK]
+            with pytest.raises(ValueError, match="no IEEE special values"):
+                CalculationFactory.execute_tolerant('divide', [1], [0], 'ieee')
+            with pytest.raises(ValueError, match="cannot write into a float buffer"):
+                CalculationFactory.execute_tolerant('add', [1], [2], out=array('d', [0.0]))
+        finally:
+            CalculationFactory.set_backend('float')
+    
+    def test_invalid_arguments(self):
+        """Test unknown operations and policies and mismatched columns."""
+        with pytest.raises(ValueError, match="Unknown operation: power"):
+            CalculationFactory.execute_tolerant('power', [1], [2])
+        with pytest.raises(ValueError, match="Unknown policy: raise. Available: nan, ieee"):
+            CalculationFactory.execute_tolerant('add', [1], [2], policy='raise')
+        with pytest.raises(ValueError, match="differ in length"):
+            CalculationFactory.execute_tolerant('add', [1, 2], [1])
+    
+    def test_evaluate_directly(self):
+        """Test the engine without the factory's checks."""
+        values, codes = evaluate(lambda a, b: a - b, [[3.0, 1.0], [1.0, 1.0]])
+        assert list(values) == [2.0, 0.0] and codes == bytearray(2)
@@ -0,0 +1,154 @@
+"""
+Unit tests for the benchmark suite.
+
+This module tests benchmark registration, timing, baseline files,
+regression detection and the one-shot startup budget, using tiny sizes so the suite stays fast.
+"""
+
+import json
+import time
+
+from app.bench import (
+    BENCHMARKS, CALLS, check_startup, compare, import_times, load_baseline, main, measure, run_suite,
+    save_baseline,
+)
+from app.calculation import CalculationHistory
+
+
+class TestBenchmarks:
+    """Test cases for running benchmarks."""
+    
+    def test_every_benchmark_runs(self):
+        """Test that each registered benchmark produces a timing."""
+        results = run_suite(sizes=(5,), repeat=1, iterations=5)
+        for name, (_, sized, _) in BENCHMARKS.items():
+            key = f"{name}[5]" if sized else name
+            assert results[key] > 0
+        assert 'repl.scripted[5]' in results
+    
+    def test_filter(self):
+        """Test that only benchmarks matching the filter run."""
+        reported = []
+        results = run_suite('operation.', repeat=1, iterations=3,
+                            report=lambda name, ns: reported.append(name))
+        assert sorted(results) == sorted(reported)
+        assert set(results) == {'operation.add', 'operation.subtract',
+                                'operation.multiply', 'operation.divide'}
+    
+    def test_measure_is_per_operation(self):
+        """Test that measure divides the best run by the operation count."""
+        calls = []
+        ns = measure(lambda n: lambda: calls.append(n), 1000, repeat=2)
+        assert calls == [1000, 1000]
+        assert ns < 1e6
+    
+    def test_measure_single_operations(self):
+        """Test that a fixed operation count replaces the size as divisor."""
+        def setup(n):
+            return lambda: time.sleep(0.01)
+        assert measure(setup, 10 ** 6, repeat=1, operations=1) >= 1e7
+        assert measure(setup, 10 ** 6, repeat=1) < 1e5
+    
+    def test_single_operation_benchmarks(self):
+        """Test that history operations timed on a whole history report per call."""
+        fixed = {name for name, (_, _, operations) in BENCHMARKS.items() if operations == CALLS}
+        assert {'history.rollback', 'history.undo', 'history.query', 'history.tail'} <= fixed
+    
+    def test_benchmarks_leave_global_history_alone(self):
+        """Test that history and REPL benchmarks use private sessions."""
+        CalculationHistory().clear_history()
+        run_suite('history', sizes=(3,), repeat=1)
+        run_suite('repl', sizes=(3,), repeat=1)
+        assert len(CalculationHistory()) == 0
+
+
+class TestBaselines:
+    """Test cases for baseline files and comparison."""
+    
+    def test_round_trip(self, tmp_path):
+        """Test that saved results load back unchanged."""
+        path = tmp_path / 'baseline.json'
+        save_baseline({'operation.add': 80.5}, str(path))
+        assert load_baseline(str(path)) == {'operation.add': 80.5}
+        assert json.loads(path.read_text())['unit'] == 'ns/op'
+    
+    def test_compare(self):
+        """Test that only slowdowns over the threshold are regressions."""
+        baseline = {'fast': 100.0, 'slow': 100.0, 'faster': 100.0}
+        current = {'fast': 105.0, 'slow': 150.0, 'faster': 50.0, 'new': 1.0}
+        regressions = compare(current, baseline, threshold=0.10)
+        assert [(name, change) for name, _, _, change in regressions] == [('slow', 0.5)]
+        assert compare(current, baseline, threshold=0.6) == []
+
+
+class TestStartup:
+    """Test cases for the one-shot startup import budget."""
+    
+    def test_one_shot_imports_nothing_heavy(self):
+        """Test that 'python -m app.calculator add 5 3' avoids heavy modules."""
+        imports = import_times()
+        names = [name for name, _, _ in imports]
+        assert names[0] == 'app'
+        assert 'app.operation' in names
+        assert check_startup(imports, budget_us=10 ** 9) == []
+    
+    def test_full_import_is_flagged(self):
+        """Test that importing the REPL breaks the budget."""
+        imports = import_times(['-c', 'import app.calculator.repl'])
+        problems = check_startup(imports, budget_us=0)
+        assert 'imports app.calculation' in problems
+        assert problems[-1].startswith('spends ')
+    
+    def test_main_startup(self, monkeypatch, capsys):
+        """Test --startup with a passing and a failing budget."""
+        monkeypatch.setattr('app.bench.import_times',
+                            lambda: [('app', 0, 300), ('app.calculator', 0, 500), ('sys', 1, 10)])
+        assert main(['--startup']) == 0
+        output = capsys.readouterr().out
+        assert 'total' in output and '800 us' in output
+        assert 'within budget' in output
+        assert main(['--startup', '--startup-budget', '700']) == 1
+        assert 'over the 700 us budget' in capsys.readouterr().out
+
+
+class TestMain:
+    """Test cases for the command line runner."""
+    
+    def test_list(self, capsys):
+        """Test listing benchmark names."""
+        assert main(['--list']) == 0
+        output = capsys.readouterr().out
+        assert 'operation.add\n' in output
+        assert 'history.str[size]' in output
+    
+    def test_save_then_compare(self, tmp_path, capsys):
+        """Test writing a baseline and comparing a later run against it."""
+        path = str(tmp_path / 'baseline.json')
+        arguments = ['-k', 'operation.add', '--iterations', '10', '--repeat', '1']
+        assert main(arguments + ['--save', path]) == 0
+        assert 'Baseline written' in capsys.readouterr().out
+        
+        assert main(arguments + ['--compare', path, '--threshold', '1000']) == 0
+        output = capsys.readouterr().out
+        assert 'vs baseline' in output
+        assert 'No regressions over' in output
+    
+    def test_regression_fails(self, tmp_path, capsys):
+        """Test that a regression gives a non-zero exit status."""
+        path = str(tmp_path / 'baseline.json')
+        save_baseline({'history.append[4]': 1e-9}, path)
+        assert main(['-k', 'history.append', '--sizes', '4', '--repeat', '1',
+                     '--compare', path]) == 1
+        output = capsys.readouterr().out
+        assert '1 regression(s) over 10%' in output
+        assert 'history.append[4]' in output
+    
+    def test_full_sizes(self, monkeypatch):
+        """Test that --full selects sizes up to ten million."""
+        seen = []
+        monkeypatch.setattr('app.bench.run_suite',
+                            lambda pattern, sizes, *args: seen.append(sizes) or {})
+        assert main(['--full']) == 0
+        assert seen == [(1000, 10000, 100000, 1000000, 10000000)]
+        assert main([]) == 0
+        assert seen[-1] == (1000, 10000, 100000)
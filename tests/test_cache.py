@@ -0,0 +1,240 @@
+"""
+Unit tests for the result cache.
+
+This module tests LRU and TTL eviction and the statistics
+reported by ResultCache, and the cross-process SharedResultCache.
+"""
+
+import multiprocessing
+import pickle
+import struct
+from decimal import Decimal
+from multiprocessing import shared_memory
+
+import pytest
+from app.cache import MISSING, ResultCache, SharedResultCache
+
+
+class FakeClock:
+    """Manually advanced clock for TTL tests."""
+    
+    def __init__(self):
+        self.now = 0.0
+    
+    def __call__(self):
+        return self.now
+
+
+class TestResultCache:
+    """Test cases for ResultCache."""
+    
+    def test_size_must_be_positive(self):
+        """Test that an empty cache is rejected."""
+        with pytest.raises(ValueError, match="at least 1"):
+            ResultCache(0)
+    
+    def test_hit_and_miss(self):
+        """Test that lookups count hits and misses."""
+        cache = ResultCache()
+        assert cache.get(('add', 1, 2)) is MISSING
+        cache.put(('add', 1, 2), 3)
+        assert cache.get(('add', 1, 2)) == 3
+        stats = cache.stats()
+        assert (stats['hits'], stats['misses'], stats['hit_rate']) == (1, 1, 0.5)
+    
+    def test_lru_eviction(self):
+        """Test that the least recently used entry is evicted."""
+        cache = ResultCache(maxsize=2)
+        cache.put(('add', 1, 1), 2)
+        cache.put(('add', 2, 2), 4)
+        cache.get(('add', 1, 1))
+        cache.put(('add', 3, 3), 6)
+        assert cache.get(('add', 2, 2)) is MISSING
+        assert cache.get(('add', 1, 1)) == 2
+        assert len(cache) == 2
+        assert cache.stats()['evictions'] == 1
+    
+    def test_ttl_expiry(self):
+        """Test that entries expire after their time-to-live."""
+        clock = FakeClock()
+        cache = ResultCache(ttl=10, clock=clock)
+        cache.put(('add', 1, 1), 2)
+        clock.now = 9.9
+        assert cache.get(('add', 1, 1)) == 2
+        clock.now = 10
+        assert cache.get(('add', 1, 1)) is MISSING
+        assert cache.stats()['expirations'] == 1
+    
+    def test_invalidate_by_operation(self):
+        """Test that invalidation only drops the named operation."""
+        cache = ResultCache()
+        cache.put(('add', 1, 1), 2)
+        cache.put(('multiply', 1, 1), 1)
+        cache.invalidate('add')
+        assert cache.get(('add', 1, 1)) is MISSING
+        assert cache.get(('multiply', 1, 1)) == 1
+    
+    def test_clear(self):
+        """Test that clearing empties the cache."""
+        cache = ResultCache()
+        cache.put(('add', 1, 1), 2)
+        cache.clear()
+        assert len(cache) == 0
+        assert cache.stats()['hit_rate'] == 0.0
+
+
+def _put_square(cache, value):
+    """Store value squared from another process."""
+    cache.put(('square', value, 0), value * value)
+
+
+class TestSharedResultCache:
+    """Test cases for SharedResultCache."""
+    
+    def setup_method(self):
+        """Create a small shared cache."""
+        self.cache = SharedResultCache(16)
+    
+    def teardown_method(self):
+        """Free the shared memory."""
+        self.cache.close()
+        self.cache.unlink()
+    
+    def test_hit_and_miss(self):
+        """Test that stored results come back with their type."""
+        cache = self.cache
+        assert cache.get(('add', 1, 2)) is MISSING
+        cache.put(('add', 1, 2), 3)
+        cache.put(('add', 1.0, 2.0), 3.5)
+        assert cache.get(('add', 1, 2)) == 3 and type(cache.get(('add', 1, 2))) is int
+        assert cache.get(('add', 1.0, 2.0)) == 3.5
+        assert cache.get(('subtract', 1, 2)) is MISSING
+        stats = cache.stats()
+        assert (stats['size'], stats['hits'], stats['misses']) == (2, 3, 2)
+        assert stats['hit_rate'] == 0.6
+    
+    def test_keys_compare_bitwise(self):
+        """Test that NaN operands hit and signed zeros stay apart."""
+        cache = self.cache
+        cache.put(('add', float('nan'), 1.0), 7.0)
+        cache.put(('add', 0.0, 1.0), 1.0)
+        assert cache.get(('add', float('nan'), 1.0)) == 7.0
+        assert cache.get(('add', -0.0, 1.0)) is MISSING
+    
+    def test_unshareable_values_are_skipped(self):
+        """Test that values a double cannot hold exactly are never stored."""
+        cache = self.cache
+        cache.put(('add', 2 ** 60 + 1, 1), 2 ** 60 + 2)
+        cache.put(('add', 10 ** 400, 1), 10 ** 400 + 1)
+        cache.put(('add', Decimal(1), 1), Decimal(2))
+        cache.put(('add', True, 1), 2)
+        cache.put(('add', 1, 1), Decimal(2))
+        assert len(cache) == 0
+        assert cache.get(('add', 2 ** 60 + 1, 1)) is MISSING
+    
+    def test_memory_is_bounded(self):
+        """Test that a full probe window replaces an entry."""
+        cache = self.cache
+        for i in range(100):
+            cache.put(('add', i, i), 2 * i)
+        assert len(cache) <= 16
+        assert cache.stats()['evictions'] > 0
+        assert cache.get(('add', 99, 99)) == 198
+    
+    def test_torn_slot_reads_as_miss(self):
+        """Test that a slot failing its checksum is never served."""
+        cache = self.cache
+        cache.put(('add', 1, 2), 3)
+        offset = next(cache._live())[0]
+        cache._buf[offset + 30] ^= 0xFF
+        assert cache.get(('add', 1, 2)) is MISSING
+        cache.put(('add', 1, 2), 3)
+        assert cache.get(('add', 1, 2)) == 3
+    
+    def test_invalidate_and_clear(self):
+        """Test dropping one operation's results and then everything."""
+        cache = self.cache
+        cache.put(('add', 1, 1), 2)
+        cache.put(('multiply', 1, 1), 1)
+        cache.invalidate('add')
+        assert cache.get(('add', 1, 1)) is MISSING
+        assert cache.get(('multiply', 1, 1)) == 1
+        cache.clear()
+        assert len(cache) == 0
+        cache.put(('add', 1, 1), 2)
+        assert cache.get(('add', 1, 1)) == 2
+    
+    def test_clear_wraps_generation(self):
+        """Test that the generation counter skips zero when it wraps."""
+        struct.pack_into('<I', self.cache._buf, 16, 0xFFFFFFFF)
+        self.cache.clear()
+        assert struct.unpack_from('<I', self.cache._buf, 16)[0] == 1
+        assert SharedResultCache.attach(self.cache.name).maxsize == 16
+    
+    def test_probe_wraps_around(self):
+        """Test that probing past the last slot continues at the first."""
+        cache = SharedResultCache(2, probe=2)
+        try:
+            cache.put(('add', 1, 1), 2)
+            cache.put(('add', 2, 2), 4)
+            assert (cache.get(('add', 1, 1)), cache.get(('add', 2, 2))) == (2, 4)
+        finally:
+            cache.close()
+            cache.unlink()
+    
+    def test_invalid_sizes(self):
+        """Test that empty tables and oversized probes are rejected."""
+        with pytest.raises(ValueError, match="at least 1"):
+            SharedResultCache(0)
+        with pytest.raises(ValueError, match="Probe length"):
+            SharedResultCache(4, probe=5)
+    
+    def test_attach_by_name(self):
+        """Test that a second handle sees the same table."""
+        self.cache.put(('add', 1, 1), 2)
+        other = SharedResultCache.attach(self.cache.name)
+        assert (other.maxsize, other.probe) == (16, 4)
+        assert other.get(('add', 1, 1)) == 2
+        other.put(('add', 2, 2), 4)
+        other.close()
+        assert self.cache.get(('add', 2, 2)) == 4
+        copy = pickle.loads(pickle.dumps(self.cache))
+        assert copy.get(('add', 2, 2)) == 4
+        copy.close()
+    
+    def test_namespaces_keep_results_apart(self):
+        """Test that one operation caches separately per namespace."""
+        cache = self.cache
+        integers = cache.namespaced('IntBackend()')
+        integers.put(('divide', 7, 2), 3)
+        cache.put(('divide', 7, 2), 3.5)
+        assert integers.get(('divide', 7, 2)) == 3
+        assert cache.get(('divide', 7, 2)) == 3.5
+        assert (integers.hits, cache.hits) == (1, 1)
+        copy = pickle.loads(pickle.dumps(integers))
+        assert copy.namespace == 'IntBackend()' and copy.get(('divide', 7, 2)) == 3
+        copy.close()
+        # Replacing an operation drops its results in every namespace
+        cache.invalidate('divide')
+        assert integers.get(('divide', 7, 2)) is MISSING
+        assert len(cache) == 0
+    
+    def test_attach_rejects_other_memory(self):
+        """Test that a block without the cache header is rejected."""
+        for size in (4, 64):
+            memory = shared_memory.SharedMemory(create=True, size=size)
+            try:
+                with pytest.raises(ValueError, match="Not a shared result cache"):
+                    SharedResultCache.attach(memory.name)
+            finally:
+                memory.close()
+                memory.unlink()
+    
+    def test_shared_between_processes(self):
+        """Test that a result stored by another process is a hit here."""
+        context = multiprocessing.get_context('spawn')
+        process = context.Process(target=_put_square, args=(self.cache, 12))
+        process.start()
+        process.join()
+        assert process.exitcode == 0
+        assert self.cache.get(('square', 12, 0)) == 144
@@ -5,8 +5,18 @@ This module tests the calculation management classes including
 the Factory pattern and history management.
 """
 
+import math
+import operator
+import os
+import threading
+from array import array
+from decimal import Decimal
+from fractions import Fraction
+
 import pytest
-from app.calculation import Calculation, CalculationHistory, CalculationFactory
+from app.cache import SharedResultCache
+from app.calculation import Calculation, CalculationHistory, CalculationFactory, SessionHistory
+from app.storage import ROW_BYTES, ColumnarStore, DropOldest, EvictedError, SpillToDisk
 from app.operation import add, subtract, multiply, divide
 
 
@@ -64,6 +74,14 @@ class TestCalculation:
         calc.execute()
         assert str(calc) == "5 + 3 = 8"
     
+    def test_calculation_str_is_cached(self):
+        """Test that executed calculations format once and notice new results."""
+        calc = Calculation('add', 5, 3, add)
+        calc.execute()
+        assert str(calc) is str(calc)
+        calc._result = 9
+        assert str(calc) == "5 + 3 = 9"
+    
     def test_calculation_repr(self):
         """Test developer representation."""
         calc = Calculation('multiply', 4, 5, multiply)
@@ -188,6 +206,18 @@ class TestCalculationHistory:
         assert "Calculation History:" in result
         assert "1. 5 + 3 = 8" in result
         assert "2. 4 × 5 = 20" in result
+    
+    def test_history_lines(self):
+        """Test numbered lines for a slice of the history."""
+        history = SessionHistory()
+        for i in range(50):
+            calc = Calculation('add', i, 1, add)
+            calc.execute()
+            history.add_calculation(calc)
+        assert list(history.lines(-2)) == ["49. 48 + 1 = 49", "50. 49 + 1 = 50"]
+        assert list(history.lines(10, 12)) == ["11. 10 + 1 = 11", "12. 11 + 1 = 12"]
+        assert len(list(history.lines())) == 50
+        assert list(history.lines(60)) == []
 
 
 class TestCalculationFactory:
@@ -262,4 +292,1019 @@ class TestCalculationFactory:
         assert result == 8
         
         # Clean up - remove the operation
-        del CalculationFactory._operations['power']
\ No newline at end of file
+        CalculationFactory.unregister_operation('power')
+    
+    def test_register_operation_rejects_reduction_names(self):
+        """Test that an operation cannot take the name of a reduction."""
+        with pytest.raises(ValueError, match="Cannot register operation 'max': it is a reduction"):
+            CalculationFactory.register_operation('max', lambda a, b: a if a > b else b)
+        assert 'max' not in CalculationFactory.get_available_operations()
+    
+    def test_unregister_operation(self):
+        """Test that an unregistered operation is gone from every lookup."""
+        CalculationFactory.register_operation('power', lambda a, b: a ** b)
+        ident = CalculationFactory.operation_id('power')
+        CalculationFactory.unregister_operation('power')
+        assert not CalculationFactory.has_operation('power')
+        for operation in ('power', ident):
+            with pytest.raises(ValueError, match="Unknown operation"):
+                CalculationFactory.evaluate(operation, 2, 3)
+        with pytest.raises(ValueError, match="Unknown operation"):
+            CalculationFactory.operation_id('power')
+        CalculationFactory.register_operation('power', lambda a, b: a ** b)
+        try:
+            assert CalculationFactory.operation_id('power') == ident
+            assert CalculationFactory.evaluate(ident, 2, 3) == 8
+        finally:
+            CalculationFactory.unregister_operation('power')
+    
+    def test_unregister_unknown_operation(self):
+        """Test that unregistering an unknown operation is rejected."""
+        with pytest.raises(ValueError, match="Unknown operation: power"):
+            CalculationFactory.unregister_operation('power')
+
+
+class TestCalculationFactoryEvaluate:
+    """Test cases for the CalculationFactory.evaluate fast path."""
+    
+    def setup_method(self):
+        """Clear history before each test."""
+        CalculationHistory().clear_history()
+    
+    @pytest.mark.parametrize("operation, expected", [
+        ('add', 8), ('subtract', 2), ('multiply', 15), ('divide', 5 / 3),
+    ])
+    def test_evaluate(self, operation, expected):
+        """Test evaluate by name and by operation ID."""
+        assert CalculationFactory.evaluate(operation, 5, 3) == expected
+        operation_id = CalculationFactory.operation_id(operation)
+        assert CalculationFactory.evaluate(operation_id, 5, 3) == expected
+    
+    def test_evaluate_records_nothing(self):
+        """Test that evaluate builds no calculation and leaves history alone."""
+        CalculationFactory.evaluate('add', 1, 2)
+        assert len(CalculationHistory()) == 0
+    
+    def test_errors_are_not_rewrapped(self):
+        """Test that operation errors propagate as raised."""
+        with pytest.raises(ValueError, match="^Cannot divide by zero$"):
+            CalculationFactory.evaluate('divide', 1, 0)
+    
+    def test_unknown_operation(self):
+        """Test unknown names and IDs."""
+        for operation in ('modulo', 99):
+            with pytest.raises(ValueError, match=f"Unknown operation: {operation}. Available: add"):
+                CalculationFactory.evaluate(operation, 1, 2)
+            with pytest.raises(ValueError, match="Unknown operation"):
+                CalculationFactory.get_operation_function(operation)
+        with pytest.raises(ValueError, match="Unknown operation: modulo"):
+            CalculationFactory.operation_id('modulo')
+    
+    def test_operation_function(self):
+        """Test that the dispatched function can be bound once."""
+        assert CalculationFactory.get_operation_function('add') is add
+        assert CalculationFactory.get_operation_function(CalculationFactory.operation_id('add')) is add
+    
+    def test_registered_operations_and_stable_ids(self):
+        """Test that registered operations get IDs that survive replacement."""
+        CalculationFactory.register_operation('exponent', lambda a, b: a ** b)
+        try:
+            exponent_id = CalculationFactory.operation_id('exponent')
+            assert CalculationFactory.evaluate(exponent_id, 2, 10) == 1024
+            CalculationFactory.register_operation('exponent', lambda a, b: -(a ** b))
+            assert CalculationFactory.operation_id('exponent') == exponent_id
+            assert CalculationFactory.evaluate('exponent', 2, 3) == -8
+        finally:
+            CalculationFactory.unregister_operation('exponent')
+            # Rebuilds the dispatch table without the removed operation
+            CalculationFactory.set_backend('float')
+        with pytest.raises(ValueError, match="Unknown operation"):
+            CalculationFactory.evaluate('exponent', 2, 3)
+    
+    def test_follows_backend(self):
+        """Test that evaluate uses the selected backend's operations."""
+        CalculationFactory.set_backend('fraction')
+        try:
+            assert CalculationFactory.evaluate('divide', 1, 3) == Fraction(1, 3)
+        finally:
+            CalculationFactory.set_backend('float')
+        assert CalculationFactory.evaluate('divide', 1, 4) == 0.25
+    
+    def test_has_operation(self):
+        """Test membership checks without building a list."""
+        assert CalculationFactory.has_operation('add')
+        assert not CalculationFactory.has_operation('power')
+
+
+class TestCalculationFactoryBatch:
+    """Test cases for CalculationFactory.execute_batch."""
+    
+    @pytest.mark.parametrize("operation, expected", [
+        ('add', [5, 7, 9]),
+        ('subtract', [-3, -3, -3]),
+        ('multiply', [4, 10, 18]),
+        ('divide', [0.25, 0.4, 0.5]),
+    ])
+    def test_batch_lists(self, operation, expected):
+        """Test batch execution over plain lists."""
+        results = CalculationFactory.execute_batch(operation, [1, 2, 3], [4, 5, 6])
+        assert list(results) == pytest.approx(expected)
+    
+    def test_batch_returns_float_array(self):
+        """Test that batch results are a packed float64 array."""
+        results = CalculationFactory.execute_batch('add', [1, 2], [3, 4])
+        assert isinstance(results, array)
+        assert results.typecode == 'd'
+    
+    def test_batch_accepts_buffers(self):
+        """Test batch execution over array.array and memoryview inputs."""
+        a = array('d', [10.0, 20.0])
+        b = memoryview(array('i', [2, 4]))
+        results = CalculationFactory.execute_batch('divide', a, b)
+        assert list(results) == [5.0, 5.0]
+    
+    def test_batch_accepts_iterators(self):
+        """Test batch execution over generators."""
+        results = CalculationFactory.execute_batch(
+            'add', (x for x in [1, 2]), iter([3, 4]))
+        assert list(results) == [4, 6]
+    
+    def test_batch_divide_by_zero_is_element_wise(self):
+        """Test that division by zero yields nan without aborting the batch."""
+        results = CalculationFactory.execute_batch('divide', [10, 10, 9], [2, 0, 3])
+        assert results[0] == 5
+        assert math.isnan(results[1])
+        assert results[2] == 3
+    
+    def test_batch_reads_raw_bytes_as_doubles(self):
+        """Test that bytes and byte memoryviews are packed doubles."""
+        a = array('d', [1.5, 2.5]).tobytes()
+        b = memoryview(bytearray(array('d', [2.0, 4.0])))
+        assert list(CalculationFactory.execute_batch('multiply', a, b)) == [3.0, 10.0]
+        # Typed byte arrays keep their element type, also behind a memoryview
+        assert list(CalculationFactory.execute_batch('add', array('B', [1, 2]), [1, 1])) == [2, 3]
+        column = memoryview(array('B', [1, 2, 3, 4, 5, 6, 7, 8]))
+        assert list(CalculationFactory.execute_batch('add', column, [1] * 8)) == list(range(2, 10))
+        with pytest.raises(ValueError, match="10 bytes does not hold whole doubles"):
+            CalculationFactory.execute_batch('add', bytes(10), bytes(10))
+    
+    def test_batch_into_output_buffer(self):
+        """Test that results are written into a caller's buffer."""
+        out = array('d', [0.0] * 3)
+        result = CalculationFactory.execute_batch('divide', [10, 10, 9], [2, 0, 3], out=out)
+        assert result is out
+        assert out[0] == 5 and math.isnan(out[1]) and out[2] == 3
+        
+        raw = bytearray(16)
+        CalculationFactory.execute_batch('subtract', range(2), range(2, 4), out=memoryview(raw))
+        assert array('d', raw).tolist() == [-2.0, -2.0]
+    
+    def test_batch_into_output_buffer_in_blocks(self, monkeypatch):
+        """Test outputs longer than one block, with a failing row in one block."""
+        monkeypatch.setattr('app.calculation._BLOCK', 4)
+        a = array('d', range(10))
+        b = array('d', [1.0] * 10)
+        b[6] = 0.0
+        out = array('d', bytes(80))
+        CalculationFactory.execute_batch('divide', a, b, out=out)
+        assert math.isnan(out[6])
+        assert [out[i] for i in range(10) if i != 6] == [0, 1, 2, 3, 4, 5, 7, 8, 9]
+    
+    @pytest.mark.parametrize("out, message", [
+        ([0.0], "writable buffer of doubles"),
+        (memoryview(array('B', bytes(8))), "writable buffer of doubles"),
+        (bytes(8), "writable buffer of doubles"),
+        (array('f', [0.0]), "writable buffer of doubles"),
+        (array('d', [0.0, 0.0]), "holds 2 values, not 1"),
+    ])
+    def test_batch_rejects_bad_output(self, out, message):
+        """Test that outputs must be writable double buffers of the right length."""
+        with pytest.raises(ValueError, match=message):
+            CalculationFactory.execute_batch('add', [1], [2], out=out)
+    
+    def test_batch_registered_operation_into_buffer(self):
+        """Test that registered operations also fill output buffers."""
+        CalculationFactory.register_operation('hypot', lambda a, b: math.hypot(a, b))
+        try:
+            out = array('d', [0.0])
+            CalculationFactory.execute_batch('hypot', array('d', [3.0]).tobytes(), [4.0], out=out)
+            assert out[0] == 5.0
+        finally:
+            CalculationFactory.unregister_operation('hypot')
+    
+    def test_batch_length_mismatch(self):
+        """Test that mismatched operand columns raise an error."""
+        with pytest.raises(ValueError, match="differ in length"):
+            CalculationFactory.execute_batch('add', [1, 2], [1])
+    
+    def test_batch_rejects_multidimensional_buffers(self):
+        """Test that multi-dimensional buffers are rejected."""
+        grid = memoryview(bytes(16)).cast('B', (4, 4))
+        with pytest.raises(ValueError, match="one-dimensional"):
+            CalculationFactory.execute_batch('add', grid, grid)
+    
+    def test_batch_unknown_operation(self):
+        """Test that batch execution validates the operation name."""
+        with pytest.raises(ValueError, match="Unknown operation: power"):
+            CalculationFactory.execute_batch('power', [1], [2])
+    
+    def test_batch_registered_operation(self):
+        """Test batch execution with a custom operation and its failures."""
+        def root(a: float, b: float) -> float:
+            if a < 0:
+                raise ValueError("negative radicand")
+            return a ** (1 / b)
+        
+        CalculationFactory.register_operation('root', root)
+        try:
+            results = CalculationFactory.execute_batch('root', [9, -1], [2, 2])
+            assert results[0] == pytest.approx(3)
+            assert math.isnan(results[1])
+        finally:
+            CalculationFactory.unregister_operation('root')
+    
+    def test_register_operation_replaces_kernel(self):
+        """Test that overriding a built-in drops its vector kernel until it is restored."""
+        CalculationFactory.register_operation('add', lambda a, b: a + 2 * b)
+        try:
+            assert list(CalculationFactory.execute_batch('add', [1], [1])) == [3]
+        finally:
+            CalculationFactory.register_operation('add', add)
+        assert CalculationFactory._kernels['add'] is operator.add
+
+
+class TestCalculationHistoryStorage:
+    """Test cases for the columnar CalculationHistory storage."""
+    
+    def setup_method(self):
+        """Clear history before each test."""
+        CalculationHistory().clear_history()
+    
+    def test_calculation_equality(self):
+        """Test that calculations compare by value."""
+        calc1 = CalculationFactory.create('add', 1, 2)
+        calc2 = CalculationFactory.create('add', 1, 2)
+        assert calc1 == calc2
+        assert hash(calc1) == hash(calc2)
+        calc1.execute()
+        assert calc1 != calc2
+        assert calc1 != "1 + 2"
+    
+    def test_history_rebuilds_calculations(self):
+        """Test that stored calculations are rebuilt with their operation."""
+        history = CalculationHistory()
+        calc = CalculationFactory.create('divide', 7, 2)
+        calc.execute()
+        history.add_calculation(calc)
+        
+        restored = history.get_last_calculation()
+        assert restored is not calc
+        assert restored == calc
+        assert restored.operation_func is divide
+        assert str(restored) == "7 ÷ 2 = 3.5"
+    
+    def test_history_keeps_unexecuted_calculations(self):
+        """Test that calculations without a result round-trip."""
+        history = CalculationHistory()
+        history.add_calculation(CalculationFactory.create('add', 1.5, 2))
+        assert history.get_last_calculation().get_result() is None
+    
+    def test_history_boxes_inexact_values(self):
+        """Test that non-float operands are kept as the original object."""
+        history = CalculationHistory()
+        calc = Calculation('add', Decimal('0.1'), Decimal('0.2'), add)
+        calc.execute()
+        history.add_calculation(calc)
+        assert history.get_last_calculation() is calc
+    
+    def test_get_history_is_a_snapshot(self):
+        """Test that get_history is a stable view, even across clears."""
+        history = CalculationHistory()
+        history.add_calculation(CalculationFactory.create('add', 1, 2))
+        view = history.get_history()
+        history.add_calculation(CalculationFactory.create('add', 3, 4))
+        assert len(view) == 1
+        history.clear_history()
+        assert view[0].operand_a == 1
+    
+    def test_history_view_indexing(self):
+        """Test indexing, slicing and comparisons on a history view."""
+        history = CalculationHistory()
+        for i in range(5):
+            history.add_calculation(CalculationFactory.create('multiply', i, 2))
+        view = history.get_history()
+        assert view[-1].operand_a == 4
+        assert [calc.operand_a for calc in view[1:4]] == [1, 2, 3]
+        assert view == list(view)
+        assert view != view[:4]
+        assert view != 5
+        assert repr(view) == "HistoryView(5 calculations)"
+        with pytest.raises(IndexError):
+            view[5]
+    
+    def test_history_custom_operation(self):
+        """Test that custom operations are stored by opcode."""
+        CalculationFactory.register_operation('power', lambda a, b: a ** b)
+        try:
+            history = CalculationHistory()
+            calc = CalculationFactory.create('power', 2, 10)
+            calc.execute()
+            history.add_calculation(calc)
+            assert str(history.get_last_calculation()) == "2 power 10 = 1024"
+        finally:
+            CalculationFactory.unregister_operation('power')
+
+
+class TestBoundedCalculationHistory:
+    """Test cases for bounded CalculationHistory capacity and eviction."""
+    
+    def setup_method(self):
+        """Start each test from an empty history."""
+        CalculationHistory().clear_history()
+    
+    def teardown_method(self):
+        """Restore the unbounded default."""
+        history = CalculationHistory()
+        history.set_capacity(None)
+        history.clear_history()
+    
+    def add_many(self, history, count):
+        for i in range(count):
+            calc = CalculationFactory.create('add', i, 1)
+            calc.execute()
+            history.add_calculation(calc)
+    
+    def test_unbounded_stats(self):
+        """Test eviction statistics for the default unbounded history."""
+        history = CalculationHistory()
+        self.add_many(history, 2)
+        assert history.eviction_stats() == {
+            'capacity': None, 'in_memory': 2, 'evictions': 0, 'spilled': 0}
+    
+    def test_drop_oldest(self):
+        """Test that a bounded history keeps only the newest entries."""
+        history = CalculationHistory()
+        history.set_capacity(3, DropOldest())
+        self.add_many(history, 5)
+        assert len(history) == 3
+        assert [calc.operand_a for calc in history.get_history()] == [2, 3, 4]
+        assert history.get_last_calculation().operand_a == 4
+        assert history.eviction_stats()['evictions'] == 2
+        assert str(history).splitlines()[1] == "1. 2 + 1 = 3"
+    
+    def test_bounded_history_boxes_inexact_values(self):
+        """Test that boxed entries survive in a bounded history."""
+        history = CalculationHistory()
+        history.set_capacity(2)
+        calc = Calculation('add', Decimal('0.1'), Decimal('0.2'), add)
+        history.add_calculation(calc)
+        assert history.get_last_calculation() is calc
+    
+    def test_clear_keeps_capacity(self):
+        """Test that clearing a bounded history keeps it bounded."""
+        history = CalculationHistory()
+        history.set_capacity(2)
+        self.add_many(history, 3)
+        history.clear_history()
+        assert history.eviction_stats() == {
+            'capacity': 2, 'in_memory': 0, 'evictions': 0, 'spilled': 0}
+    
+    def test_set_capacity_keeps_existing_entries(self):
+        """Test that shrinking the capacity evicts existing entries."""
+        history = CalculationHistory()
+        self.add_many(history, 4)
+        history.set_capacity(2)
+        assert [calc.operand_a for calc in history.get_history()] == [2, 3]
+        history.set_capacity(None)
+        assert len(history) == 2
+    
+    def test_spill_to_disk(self, tmp_path):
+        """Test that spilled entries remain part of the history."""
+        history = CalculationHistory()
+        history.set_capacity(2, SpillToDisk(str(tmp_path / 'history.seg')))
+        self.add_many(history, 5)
+        assert len(history) == 5
+        assert [calc.operand_a for calc in history.get_history()] == [0, 1, 2, 3, 4]
+        assert str(history.get_history()[0]) == "0 + 1 = 1"
+        assert history.eviction_stats() == {
+            'capacity': 2, 'in_memory': 2, 'evictions': 3, 'spilled': 3}
+    
+    def test_replaced_spill_segment_is_removed(self):
+        """Test that changing the capacity removes a temporary spill segment."""
+        history = CalculationHistory()
+        policy = SpillToDisk()
+        history.set_capacity(2, policy)
+        self.add_many(history, 5)
+        history.set_capacity(None)
+        assert not os.path.exists(policy.path)
+        assert [calc.operand_a for calc in history.get_history()] == [0, 1, 2, 3, 4]
+    
+    def test_view_survives_eviction_until_row_is_dropped(self):
+        """Test that views keep addressing the same entries after eviction."""
+        history = CalculationHistory()
+        history.set_capacity(2)
+        self.add_many(history, 2)
+        view = history.get_history()
+        self.add_many(history, 1)
+        assert len(history) == 2
+        assert view[1].operand_a == 1
+        with pytest.raises(EvictedError, match="evicted"):
+            view[0]
+    
+    def test_iterating_a_stale_view(self):
+        """Test that iterating a view past evicted rows raises instead of stopping."""
+        history = CalculationHistory()
+        history.set_capacity(3)
+        self.add_many(history, 3)
+        view = history.get_history()
+        self.add_many(history, 3)
+        assert len(history) == 3
+        assert len(view) == 3
+        with pytest.raises(EvictedError, match="evicted"):
+            list(view)
+        with pytest.raises(LookupError):
+            next(iter(view))
+
+    
+    def test_open_log_persists(self, tmp_path):
+        """Test that a log-backed history can be reopened."""
+        path = str(tmp_path / 'history.log')
+        history = CalculationHistory()
+        history.open_log(path)
+        self.add_many(history, 3)
+        CalculationFactory.register_operation('power', lambda a, b: a ** b)
+        try:
+            calc = CalculationFactory.create('power', 2, 3)
+            calc.execute()
+            history.add_calculation(calc)
+        finally:
+            CalculationFactory.unregister_operation('power')
+        
+        history.set_capacity(None)
+        history.clear_history()
+        history.open_log(path)
+        assert len(history) == 4
+        assert str(history.get_history()[1]) == "1 + 1 = 2"
+        assert str(history.get_last_calculation()) == "2 power 3 = 8"
+        assert history.eviction_stats()['persisted'] == 4
+
+
+class TestHistorySnapshots:
+    """Test cases for undo, redo, snapshots and named checkpoints."""
+    
+    def add_many(self, history, values):
+        for value in values:
+            calc = CalculationFactory.create('add', value, 1)
+            calc.execute()
+            history.add_calculation(calc)
+    
+    def operands(self, history):
+        return [calc.operand_a for calc in history.get_history()]
+    
+    def test_undo_and_redo(self):
+        """Test stepping back and forward through added calculations."""
+        history = SessionHistory()
+        assert not history.undo()
+        assert not history.redo()
+        self.add_many(history, [1, 2, 3])
+        assert history.undo() and history.undo()
+        assert self.operands(history) == [1]
+        assert history.get_last_calculation().operand_a == 1
+        assert history.redo()
+        assert self.operands(history) == [1, 2]
+        assert history.redo() and not history.redo()
+        assert self.operands(history) == [1, 2, 3]
+        # Back at the newest state the history needs no snapshot to read through
+        assert history._version is None
+    
+    def test_adding_discards_redo(self):
+        """Test that a new calculation after an undo starts a new branch."""
+        history = SessionHistory()
+        self.add_many(history, [1, 2, 3])
+        history.undo()
+        history.undo()
+        self.add_many(history, [4])
+        assert not history.redo()
+        assert self.operands(history) == [1, 4]
+        assert str(history).splitlines()[1:] == ["1. 1 + 1 = 2", "2. 4 + 1 = 5"]
+        history.undo()
+        assert self.operands(history) == [1]
+    
+    def test_undo_clear(self):
+        """Test that clearing can be undone and redone."""
+        history = SessionHistory()
+        self.add_many(history, [1, 2])
+        history.clear_history()
+        self.add_many(history, [3])
+        assert history.undo()
+        assert len(history) == 0
+        assert history.undo()
+        assert self.operands(history) == [1, 2]
+        assert history.redo() and history.redo()
+        assert self.operands(history) == [3]
+    
+    def test_snapshot_and_rollback(self):
+        """Test returning to a snapshot and undoing the rollback."""
+        history = SessionHistory()
+        self.add_many(history, [1, 2])
+        snapshot = history.snapshot()
+        assert len(snapshot) == 2
+        assert repr(snapshot) == "HistorySnapshot(2 calculations)"
+        self.add_many(history, [3, 4])
+        history.rollback(snapshot)
+        assert self.operands(history) == [1, 2]
+        # The undone rows stay out of later snapshots
+        self.add_many(history, [5])
+        assert self.operands(history) == [1, 2, 5]
+        history.undo()
+        assert history.undo()
+        assert self.operands(history) == [1, 2, 3, 4]
+        assert history.redo()
+        assert self.operands(history) == [1, 2]
+    
+    def test_named_checkpoints(self):
+        """Test saving and restoring checkpoints by name."""
+        history = SessionHistory()
+        self.add_many(history, [1])
+        history.snapshot('start')
+        self.add_many(history, [2, 3])
+        history.snapshot('later')
+        history.clear_history()
+        assert history.checkpoints() == ['start', 'later']
+        history.rollback('start')
+        assert self.operands(history) == [1]
+        history.rollback('later')
+        assert self.operands(history) == [1, 2, 3]
+        with pytest.raises(ValueError, match="Unknown checkpoint: end. Available: start, later"):
+            history.rollback('end')
+        with pytest.raises(ValueError, match="Unknown checkpoint: end. Available: none"):
+            SessionHistory().rollback('end')
+    
+    def test_foreign_snapshot(self):
+        """Test that snapshots only restore into the storage they came from."""
+        history = SessionHistory()
+        with pytest.raises(ValueError, match="another history"):
+            history.rollback(SessionHistory().snapshot())
+        snapshot = history.snapshot('name')
+        history.set_capacity(4)
+        assert history.checkpoints() == []
+        with pytest.raises(ValueError, match="replaced storage"):
+            history.rollback(snapshot)
+    
+    def test_query_sees_visible_rows(self):
+        """Test that queries skip undone rows and use current positions."""
+        history = SessionHistory()
+        self.add_many(history, [1, 2])
+        history.clear_history()
+        self.add_many(history, [3, 4, 5])
+        assert history.query_positions('op=add') == [0, 1, 2]
+        history.undo()
+        history.undo()
+        self.add_many(history, [6, 7])
+        assert history.query_positions('a>3') == [1, 2]
+        assert [calc.operand_a for calc in history.query('a>=3')] == [3, 6, 7]
+    
+    def test_reads_across_many_runs(self):
+        """Test positional reads after every add was followed by an undo."""
+        history = SessionHistory()
+        for i in range(300):
+            self.add_many(history, [i, -1])
+            history.undo()
+        view = history.get_history()
+        assert self.operands(history) == list(range(300))
+        assert [view[i].operand_a for i in (0, 1, 150, 299, -1)] == [0, 1, 150, 299, 299]
+        assert history.query_positions('a>=297') == [297, 298, 299]
+        
+        bounded = SessionHistory()
+        bounded.set_capacity(250)
+        for i in range(300):
+            self.add_many(bounded, [i, -1])
+            bounded.undo()
+        # The ring holds the last 250 rows, every other one undone
+        assert self.operands(bounded) == list(range(175, 300))
+    
+    def test_undo_in_bounded_history(self):
+        """Test that evicted rows drop out of snapshots as well."""
+        history = SessionHistory()
+        history.set_capacity(3)
+        self.add_many(history, range(5))
+        history.undo()
+        assert self.operands(history) == [2, 3]
+        # An undone row keeps its slot until it is evicted
+        self.add_many(history, [9])
+        assert self.operands(history) == [3, 9]
+        assert history.query_positions('a>2') == [0, 1]
+        self.add_many(history, [10])
+        assert self.operands(history) == [9, 10]
+        assert history.query_positions('a>2') == [0, 1]
+    
+    def test_clearing_a_log_cannot_be_undone(self, tmp_path):
+        """Test that truncating a history log resets undo."""
+        history = SessionHistory()
+        history.open_log(str(tmp_path / 'history.log'))
+        self.add_many(history, [1, 2])
+        history.snapshot('before')
+        history.clear_history()
+        assert not history.undo()
+        assert history.checkpoints() == []
+    
+    def test_clearing_a_spilling_history_cannot_be_undone(self, tmp_path):
+        """Test that truncating the spill segment resets undo."""
+        history = SessionHistory()
+        history.set_capacity(2, SpillToDisk(str(tmp_path / 'history.seg')))
+        self.add_many(history, range(6))
+        history.snapshot('before')
+        history.clear_history()
+        assert not history.undo()
+        assert history.checkpoints() == []
+        assert len(history) == 0
+        assert list(history.get_history()) == []
+        self.add_many(history, range(3))
+        assert self.operands(history) == [0, 1, 2]
+        assert str(history.get_history()[0]) == "0 + 1 = 1"
+    
+    def test_retained_stores_are_counted_and_limited(self):
+        """Test that cleared stores kept for undo count and give way oldest first."""
+        history = SessionHistory()
+        self.add_many(history, range(4))
+        history.snapshot('full')
+        history.clear_history()
+        assert history.nbytes() == 4 * ROW_BYTES
+        self.add_many(history, range(2))
+        history.clear_history()
+        self.add_many(history, range(3))
+        assert history.nbytes() == 9 * ROW_BYTES
+        history.retained_limit = 4 * ROW_BYTES
+        history.clear_history()
+        # Undo entries go first; the checkpoint still holds the first store
+        assert history.nbytes() == 4 * ROW_BYTES
+        assert history.checkpoints() == ['full']
+        assert not history.undo()
+        history.rollback('full')
+        assert history.nbytes() == 4 * ROW_BYTES
+        history.retained_limit = 3 * ROW_BYTES
+        history.clear_history()
+        assert history.nbytes() == 0
+        assert history.checkpoints() == []
+        assert not history.undo()
+    
+    def test_retained_redo_is_limited(self):
+        """Test that a store kept only for redo is forgotten beyond the limit."""
+        history = SessionHistory()
+        self.add_many(history, range(4))
+        history.clear_history()
+        self.add_many(history, range(2))
+        history.retained_limit = ROW_BYTES
+        for _ in range(3):
+            assert history.undo()
+        assert len(history) == 4
+        assert history.nbytes() == 4 * ROW_BYTES
+        assert not history.redo()
+    
+    def test_undo_limit(self):
+        """Test that only the newest clears and rollbacks can be undone."""
+        history = SessionHistory()
+        history._undo = type(history._undo)(maxlen=1)
+        self.add_many(history, [1])
+        history.clear_history()
+        history.clear_history()
+        assert history.undo()
+        assert not history.undo()
+        assert len(history) == 0
+
+
+class TestHistoryTransfer:
+    """Test cases for bulk export and import of history."""
+    
+    def make_history(self):
+        history = SessionHistory()
+        for op, a, b in [('add', 5, 3), ('divide', 1.0, 3.0), ('multiply', 2, 0.5)]:
+            calc = CalculationFactory.create(op, a, b)
+            calc.execute()
+            history.add_calculation(calc)
+        decimal = Calculation('add', Decimal('0.1'), Decimal('0.2'), add)
+        decimal.execute()
+        history.add_calculation(decimal)
+        history.add_calculation(CalculationFactory.create('subtract', 4, 1))
+        return history
+    
+    @pytest.mark.parametrize("name", ['session.columnar', 'session.csv'])
+    def test_round_trip(self, tmp_path, name):
+        """Test that an exported session imports as the same calculations."""
+        path = str(tmp_path / name)
+        history = self.make_history()
+        assert history.export(path) == 5
+        restored = SessionHistory()
+        assert restored.import_(path) == 5
+        assert str(restored).splitlines() == [
+            "Calculation History:",
+            "1. 5 + 3 = 8",
+            "2. 1.0 ÷ 3.0 = 0.3333333333333333",
+            "3. 2 × 0.5 = 1.0",
+            # Decimal values come back as their float64 approximation
+            "4. 0.1 + 0.2 = 0.3",
+            "5. 4 - 1",
+        ]
+        assert restored.get_history()[0] == history.get_history()[0]
+    
+    def test_import_appends_and_can_be_undone(self, tmp_path):
+        """Test that imported rows follow existing ones and are queryable."""
+        path = str(tmp_path / 'session.columnar')
+        self.make_history().export(path)
+        history = SessionHistory()
+        CalculationFactory.register_operation('power', lambda a, b: a ** b)
+        try:
+            calc = CalculationFactory.create('power', 2, 3)
+            calc.execute()
+            history.add_calculation(calc)
+        finally:
+            CalculationFactory.unregister_operation('power')
+        assert history.query_positions('op=divide') == []
+        assert history.import_(path, 'columnar') == 5
+        assert history.query_positions('op=divide') == [2]
+        assert str(history.get_history()[2]) == "1.0 ÷ 3.0 = 0.3333333333333333"
+        assert history.undo()
+        assert len(history) == 5
+    
+    def test_export_visible_rows_only(self, tmp_path):
+        """Test that undone and evicted rows are not exported."""
+        path = str(tmp_path / 'session.csv')
+        history = self.make_history()
+        history.undo()
+        history.undo()
+        history.add_calculation(CalculationFactory.create('add', 9, 9))
+        assert history.export(path) == 4
+        restored = SessionHistory()
+        restored.set_capacity(2)
+        restored.import_(path)
+        assert [str(calc) for calc in restored.get_history()] == ["2 × 0.5 = 1.0", "9 + 9"]
+        assert restored.export(path) == 2
+        with open(path) as handle:
+            assert handle.read().splitlines()[1:] == ["multiply,2,0.5,1.0", "add,9,9,"]
+    
+    def test_import_into_log(self, tmp_path):
+        """Test that imported rows are appended to a history log in bulk."""
+        path = str(tmp_path / 'session.columnar')
+        self.make_history().export(path)
+        history = SessionHistory()
+        history.open_log(str(tmp_path / 'history.log'))
+        history.import_(path)
+        assert history.import_(path) == 5
+        assert len(history) == 10
+        assert str(history.get_last_calculation()) == "4 - 1"
+    
+    def test_import_nothing(self, tmp_path):
+        """Test importing an empty file."""
+        path = str(tmp_path / 'empty.csv')
+        SessionHistory().export(path)
+        history = SessionHistory()
+        assert history.import_(path) == 0
+        assert not history.undo()
+
+
+class TestCalculationFactoryCache:
+    """Test cases for result memoization through CalculationFactory."""
+    
+    def teardown_method(self):
+        """Turn caching back off."""
+        CalculationFactory.disable_cache()
+    
+    def test_cache_disabled_by_default(self):
+        """Test that no cache is active unless enabled."""
+        assert CalculationFactory.cache_stats() is None
+        assert CalculationFactory.create('add', 1, 2)._cache is None
+    
+    def test_repeated_calculation_hits_cache(self):
+        """Test that repeated triples are served from the cache."""
+        calls = []
+        
+        def tracked(a: float, b: float) -> float:
+            calls.append((a, b))
+            return a + b
+        
+        CalculationFactory.register_operation('tracked', tracked)
+        CalculationFactory.enable_cache(maxsize=8)
+        try:
+            for _ in range(3):
+                calc = CalculationFactory.create('tracked', 2, 3)
+                assert calc.execute() == 5
+                assert calc.get_result() == 5
+        finally:
+            CalculationFactory.unregister_operation('tracked')
+        assert calls == [(2, 3)]
+        stats = CalculationFactory.cache_stats()
+        assert (stats['hits'], stats['misses']) == (2, 1)
+    
+    def test_cache_keeps_operand_types_apart(self):
+        """Test that int and float operands are cached separately."""
+        CalculationFactory.enable_cache()
+        assert str(_executed('add', 1, 2)) == "1 + 2 = 3"
+        assert str(_executed('add', 1.0, 2.0)) == "1.0 + 2.0 = 3.0"
+    
+    def test_errors_are_not_cached(self):
+        """Test that failing calculations raise every time."""
+        CalculationFactory.enable_cache()
+        for _ in range(2):
+            with pytest.raises(ValueError, match="Calculation failed"):
+                CalculationFactory.create('divide', 1, 0).execute()
+        assert CalculationFactory.cache_stats()['size'] == 0
+    
+    def test_register_operation_invalidates(self):
+        """Test that replacing an operation drops its cached results."""
+        CalculationFactory.register_operation('scale', lambda a, b: a * b)
+        CalculationFactory.enable_cache()
+        try:
+            assert _executed('scale', 2, 3).get_result() == 6
+            CalculationFactory.register_operation('scale', lambda a, b: a * b * 10)
+            assert _executed('scale', 2, 3).get_result() == 60
+        finally:
+            CalculationFactory.unregister_operation('scale')
+    
+    def test_manual_calculations_bypass_cache(self):
+        """Test that calculations built by hand are never cached."""
+        CalculationFactory.enable_cache()
+        Calculation('add', 1, 2, add).execute()
+        assert CalculationFactory.cache_stats()['size'] == 0
+    
+    def test_shared_cache(self):
+        """Test that factories attached by name serve each other's results."""
+        cache = CalculationFactory.enable_shared_cache(slots=64)
+        try:
+            assert _executed('multiply', 3, 4).get_result() == 12
+            CalculationFactory.disable_cache()
+            named = CalculationFactory.enable_shared_cache(cache.name)
+            assert named is not cache and named.maxsize == 64
+            assert _executed('multiply', 3, 4).get_result() == 12
+            assert CalculationFactory.cache_stats()['hits'] == 1
+            named.close()
+        finally:
+            cache.close()
+            cache.unlink()
+    
+    def test_shared_cache_keys_by_backend(self):
+        """Test that backends never read each other's shared results."""
+        cache = CalculationFactory.enable_shared_cache(slots=64)
+        try:
+            other = SharedResultCache.attach(cache.name, cache.namespace)
+            other.put(('add', 1, 1), 2)
+            CalculationFactory.set_backend('int')
+            assert _executed('divide', 7, 2).get_result() == 3
+            CalculationFactory.set_backend('float')
+            assert _executed('divide', 7, 2).get_result() == 3.5
+            # Switching backend leaves other processes' entries alone
+            assert other.get(('add', 1, 1)) == 2
+            assert len(cache) == 3
+            other.close()
+        finally:
+            CalculationFactory.set_backend('float')
+            cache.close()
+            cache.unlink()
+    
+    def test_shared_cache_created_by_name(self):
+        """Test that the first process to ask for a name creates the cache."""
+        cache = CalculationFactory.enable_shared_cache(f'calc-test-{id(self)}', slots=8)
+        try:
+            assert cache.name.endswith(f'calc-test-{id(self)}')
+            assert cache.maxsize == 8
+        finally:
+            cache.close()
+            cache.unlink()
+
+
+def _executed(operation, a, b):
+    calc = CalculationFactory.create(operation, a, b)
+    calc.execute()
+    return calc
+
+
+class TestThreadSafeCalculationHistory:
+    """Test cases for CalculationHistory under concurrent threads."""
+    
+    def setup_method(self):
+        """Clear history before each test."""
+        CalculationHistory().clear_history()
+    
+    def run_threads(self, count, target):
+        barrier = threading.Barrier(count)
+        errors = []
+        
+        def worker(thread_id):
+            barrier.wait()
+            # A failing thread would otherwise only show up as a wrong count
+            try:
+                target(thread_id)
+            except Exception as e:
+                errors.append(e)
+        
+        threads = [threading.Thread(target=worker, args=(i,)) for i in range(count)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        if errors:
+            raise errors[0]
+    
+    def test_singleton_created_once_under_threads(self):
+        """Test that racing threads all get the same instance."""
+        saved = CalculationHistory._instance
+        CalculationHistory._instance = None
+        instances = []
+        try:
+            self.run_threads(8, lambda _: instances.append(CalculationHistory()))
+        finally:
+            CalculationHistory._instance = saved
+        assert len({id(instance) for instance in instances}) == 1
+    
+    def test_concurrent_appends_are_not_lost_or_torn(self):
+        """Test that concurrent appends keep every row intact and in thread order."""
+        history = CalculationHistory()
+        
+        def append(thread_id):
+            for i in range(2000):
+                calc = CalculationFactory.create('add', i, thread_id)
+                calc.execute()
+                history.add_calculation(calc)
+        
+        self.run_threads(6, append)
+        rows = history.get_history()
+        assert len(rows) == 12000
+        seen = {}
+        for calc in rows:
+            assert calc.get_result() == calc.operand_a + calc.operand_b
+            assert seen.get(calc.operand_b, -1) == calc.operand_a - 1
+            seen[calc.operand_b] = calc.operand_a
+    
+    def test_reads_during_writes(self):
+        """Test that readers can snapshot while writers append."""
+        history = SessionHistory()
+        lengths = []
+        
+        def work(thread_id):
+            for i in range(500):
+                if thread_id == 0:
+                    lengths.append(len(history.get_history()))
+                else:
+                    history.add_calculation(CalculationFactory.create('add', i, 1))
+        
+        self.run_threads(3, work)
+        assert lengths == sorted(lengths)
+        assert len(history) == 1000
+    
+    def test_writer_merges_full_shard(self):
+        """Test that a writer folds its shard into the store past the threshold."""
+        history = SessionHistory()
+        history.merge_threshold = 3
+        for i in range(4):
+            history.add_calculation(CalculationFactory.create('add', i, 1))
+        assert len(history._store) == 3
+        assert len(history) == 4
+    
+    def test_full_opcode_table_fails_the_writer(self):
+        """Test that an operation beyond 256 fails when added, not when read."""
+        history = SessionHistory()
+        
+        def work(thread_id):
+            for i in range(126):
+                name = f'op{thread_id}_{i}'
+                history.add_calculation(Calculation(name, i, 1, add))
+        
+        self.run_threads(2, work)
+        with pytest.raises(ValueError, match="Opcode table is full"):
+            history.add_calculation(Calculation('one_too_many', 1, 1, add))
+        history.add_calculation(Calculation('op0_0', 2, 2, add))
+        assert len(history) == 253
+        assert history.get_history()[-1].operation_name == 'op0_0'
+    
+    def test_merge_is_all_or_nothing(self):
+        """Test that rows whose opcodes do not fit stay pending, then merge in order."""
+        history = SessionHistory()
+        for name in ('add', 'power', 'hypot'):
+            history.add_calculation(Calculation(name, 2, 3, add))
+        full = ColumnarStore()
+        for i in range(252):
+            full.operations.code(f'op{i}')
+        history._store = full
+        with pytest.raises(ValueError, match="Opcode table is full"):
+            len(history)
+        assert len(full) == 0
+        history._store = ColumnarStore()
+        assert [calc.operation_name for calc in history.get_history()] == [
+            'add', 'power', 'hypot']
+        assert history.query_positions('op=hypot') == [2]
+    
+    def test_finished_thread_shards_are_dropped(self):
+        """Test that shards of finished threads are released after merging."""
+        history = SessionHistory()
+        thread = threading.Thread(
+            target=history.add_calculation, args=(CalculationFactory.create('add', 1, 1),))
+        thread.start()
+        thread.join()
+        assert len(history) == 1
+        assert history._shards == []
+    
+    def test_clear_discards_pending_rows(self):
+        """Test that clearing drops rows not merged yet."""
+        history = SessionHistory()
+        history.add_calculation(CalculationFactory.create('add', 1, 1))
+        history.clear_history()
+        assert len(history) == 0
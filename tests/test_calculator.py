@@ -5,10 +5,14 @@ This module tests the REPL interface including user interaction,
 special commands, and history management.
 """
 
+import io
+import re
+import sys
+
 import pytest
 from unittest.mock import patch
-from app.calculator import CalculatorREPL
-from app.calculation import CalculationHistory
+from app.calculator import CalculatorREPL, main
+from app.calculation import CalculationFactory, CalculationHistory, SessionHistory
 
 
 class TestCalculatorREPL:
@@ -29,6 +33,15 @@ class TestCalculatorREPL:
         assert hasattr(repl, 'history')
         assert repl.running is False
     
+    def test_repl_with_session_history(self):
+        """Test that a REPL can work on its own session instead of the singleton."""
+        history = SessionHistory()
+        repl = CalculatorREPL(history)
+        with patch('builtins.input', side_effect=['5', '3']):
+            repl.perform_calculation('add')
+        assert len(history) == 1
+        assert len(CalculationHistory()) == 0
+    
     def test_display_welcome(self, repl, capsys):
         """Test welcome message display."""
         repl.display_welcome()
@@ -60,6 +73,77 @@ class TestCalculatorREPL:
         assert "Calculation History" in captured.out
         assert "5 + 3 = 8" in captured.out or "5.0 + 3.0 = 8.0" in captured.out
     
+    def fill_history(self, repl, count):
+        """Add ``count`` calculations to the REPL's history."""
+        for i in range(1, count + 1):
+            calculation = CalculationFactory.create('add', i, 0)
+            calculation.execute()
+            repl.history.add_calculation(calculation)
+    
+    def test_display_history_long_shows_latest_page(self, repl, capsys):
+        """Test that a bare history command shows only the last page."""
+        self.fill_history(repl, 45)
+        repl.display_history()
+        lines = capsys.readouterr().out.splitlines()
+        assert lines[0] == "Calculation History (45 calculations):"
+        assert lines[1] == "26. 26 + 0 = 26"
+        assert lines[20] == "45. 45 + 0 = 45"
+        assert lines[21].startswith("Showing 26-45 of 45. Use 'history page N' (1-3)")
+    
+    @pytest.mark.parametrize('args, first, last', [
+        (['5'], "41. 41 + 0 = 41", "45. 45 + 0 = 45"),
+        (['100'], "1. 1 + 0 = 1", "45. 45 + 0 = 45"),
+        (['tail'], "26. 26 + 0 = 26", "45. 45 + 0 = 45"),
+        (['page', '1'], "1. 1 + 0 = 1", "20. 20 + 0 = 20"),
+        (['page', '3'], "41. 41 + 0 = 41", "45. 45 + 0 = 45"),
+        (['all'], "1. 1 + 0 = 1", "45. 45 + 0 = 45"),
+    ])
+    def test_display_history_pages(self, repl, capsys, args, first, last):
+        """Test the history N, tail, page and all forms."""
+        self.fill_history(repl, 45)
+        repl.display_history(args)
+        entries = [line for line in capsys.readouterr().out.splitlines() if line[0].isdigit()]
+        assert (entries[0], entries[-1]) == (first, last)
+    
+    @pytest.mark.parametrize('args', [['page', '4'], ['page', '0'], ['0'], ['last'], ['page']])
+    def test_display_history_invalid(self, repl, capsys, args):
+        """Test that bad history arguments print usage."""
+        self.fill_history(repl, 45)
+        repl.display_history(args)
+        assert "Invalid history command" in capsys.readouterr().out
+    
+    def test_display_history_where(self, repl, capsys):
+        """Test listing calculations that match a query."""
+        self.fill_history(repl, 45)
+        repl.display_history(['where', 'result>40', 'a<=44'])
+        lines = capsys.readouterr().out.splitlines()
+        assert lines == ["Matching Calculations (4 of 45):", "41. 41 + 0 = 41",
+                         "42. 42 + 0 = 42", "43. 43 + 0 = 43", "44. 44 + 0 = 44"]
+        
+        repl.display_history(['where', 'op=add'])
+        lines = capsys.readouterr().out.splitlines()
+        assert lines[1] == "26. 26 + 0 = 26"
+        assert lines[-1] == "Showing the last 20 of 45 matches."
+    
+    @pytest.mark.parametrize('args, message', [
+        (['where', 'op=divide'], "No calculations match."),
+        (['where', 'result>>1'], "Error: Invalid number"),
+    ])
+    def test_display_history_where_no_results(self, repl, capsys, args, message):
+        """Test empty and malformed queries."""
+        self.fill_history(repl, 3)
+        repl.display_history(args)
+        assert message in capsys.readouterr().out
+    
+    @patch('builtins.input', side_effect=['history page 1', 'exit'])
+    def test_run_history_page_command(self, mock_input, repl, capsys):
+        """Test history arguments typed at the prompt."""
+        self.fill_history(repl, 3)
+        repl.run()
+        out = capsys.readouterr().out
+        assert "3. 3 + 0 = 3" in out
+        assert "Showing" not in out
+    
     def test_clear_history(self, repl, capsys):
         """Test clearing history."""
         # Add a calculation
@@ -111,6 +195,22 @@ class TestCalculatorREPL:
         captured = capsys.readouterr()
         assert "Invalid input" in captured.out
     
+    @patch('builtins.input', side_effect=['2 +', 'x + 1', '(3 + 4) * 2'])
+    def test_get_operation_expression(self, mock_input, repl, capsys):
+        """Test that complete expressions are accepted, free variables are not."""
+        assert repl.get_operation() == '(3 + 4) * 2'
+        captured = capsys.readouterr()
+        assert "Invalid input '2 +'" in captured.out
+        assert "Invalid input 'x + 1'" in captured.out
+    
+    @patch('builtins.input', side_effect=['(3 + 4) * 2', '1 / (2 - 2)', 'exit'])
+    def test_run_expression(self, mock_input, repl, capsys):
+        """Test evaluating expressions typed into the REPL."""
+        repl.run()
+        captured = capsys.readouterr()
+        assert "Result: (3 + 4) * 2 = 14.0" in captured.out
+        assert "Error: Calculation failed: Cannot divide by zero" in captured.out
+    
     @patch('builtins.input', side_effect=['5.5'])
     def test_get_number_valid(self, mock_input, repl):
         """Test getting a valid number."""
@@ -179,9 +279,350 @@ class TestCalculatorREPL:
         captured = capsys.readouterr()
         assert "cleared" in captured.out.lower()
     
+    @patch('builtins.input', side_effect=['add', '5', '3', 'add', '1', '1', 'undo', 'undo',
+                                          'undo', 'redo', 'redo', 'redo', 'exit'])
+    def test_run_undo_redo_commands(self, mock_input, repl, capsys):
+        """Test undo and redo typed at the prompt."""
+        # A private history, so undo cannot reach the shared one's clear
+        repl.history = SessionHistory()
+        repl.run()
+        out = capsys.readouterr().out
+        assert "Undone. 0 calculations in history." in out
+        assert "Nothing to undo." in out
+        assert "Redone. 2 calculations in history." in out
+        assert "Nothing to redo." in out
+        assert len(repl.history) == 2
+    
+    @patch('builtins.input', side_effect=['add', '5', '3', 'checkpoint before', 'add', '1', '1',
+                                          'checkpoint', 'checkpoint a b', 'rollback before',
+                                          'rollback', 'rollback missing', 'exit'])
+    def test_run_checkpoint_commands(self, mock_input, repl, capsys):
+        """Test saving, listing and restoring checkpoints at the prompt."""
+        repl.history = SessionHistory()
+        repl.run()
+        out = capsys.readouterr().out
+        assert "Checkpoint 'before' saved at 1 calculations." in out
+        assert "Checkpoints: before" in out
+        assert "Error: Usage: checkpoint NAME" in out
+        assert "Rolled back to 'before'. 1 calculations in history." in out
+        assert "Error: Usage: rollback NAME" in out
+        assert "Error: Unknown checkpoint: missing" in out
+        assert [str(calc) for calc in repl.history.get_history()] == ["5.0 + 3.0 = 8.0"]
+    
+    def test_no_checkpoints(self, capsys):
+        """Test listing checkpoints of a history that has none."""
+        repl = CalculatorREPL()
+        repl.history = SessionHistory()
+        repl.checkpoint()
+        assert "No checkpoints saved." in capsys.readouterr().out
+    
+    @patch('builtins.input', side_effect=['cache', 'exit'])
+    def test_run_cache_command_disabled(self, mock_input, repl, capsys):
+        """Test cache command when caching is off."""
+        repl.run()
+        captured = capsys.readouterr()
+        assert "Result cache is disabled" in captured.out
+    
+    @patch('builtins.input', side_effect=['add', '1', '2', 'add', '1', '2', 'cache', 'exit'])
+    def test_run_cache_command_stats(self, mock_input, repl, capsys):
+        """Test cache command showing hit statistics."""
+        CalculationFactory.enable_cache(maxsize=16)
+        try:
+            repl.run()
+        finally:
+            CalculationFactory.disable_cache()
+        captured = capsys.readouterr()
+        assert "Result Cache:" in captured.out
+        assert "hits       1" in captured.out
+        assert "hit rate   50.0%" in captured.out
+    
+    @patch('builtins.input', side_effect=['stats', 'exit'])
+    def test_run_stats_command_disabled(self, mock_input, repl, capsys):
+        """Test stats command when metrics are off."""
+        repl.run()
+        assert "Metrics are disabled" in capsys.readouterr().out
+    
+    @patch('builtins.input', side_effect=['stats', 'add', '1', '2', 'divide', '1', '0', 'stats', 'exit'])
+    def test_run_stats_command(self, mock_input, repl, capsys):
+        """Test stats command listing per-operation calls and errors."""
+        CalculationFactory.enable_metrics().reset()
+        try:
+            repl.run()
+        finally:
+            CalculationFactory.disable_metrics()
+        captured = capsys.readouterr()
+        assert "No calculations measured yet." in captured.out
+        assert "Operation Metrics" in captured.out
+        assert re.search(r"add\s+1\s+0\s", captured.out)
+        assert re.search(r"divide\s+1\s+1\s", captured.out)
+    
+    @patch('builtins.input', side_effect=[
+        'backend', 'backend decimal 5', 'divide', '1', '3', 'backend',
+        'backend fraction', 'add', '1/3', '1/6', 'backend int 3', 'backend roman',
+        'backend float', 'exit',
+    ])
+    def test_run_backend_command(self, mock_input, repl, capsys):
+        """Test showing and switching backends from the prompt."""
+        try:
+            repl.run()
+        finally:
+            CalculationFactory.set_backend('float')
+        out = capsys.readouterr().out
+        assert "Backend: float" in out
+        assert "Backend set to decimal." in out
+        assert "Result: 1 ÷ 3 = 0.33333" in out
+        assert "Backend: decimal (precision 5)" in out
+        assert "Result: 1/3 + 1/6 = 1/2" in out
+        assert "Error: Precision only applies to the decimal backend" in out
+        assert "Error: Unknown backend: roman" in out
+        assert "Backend set to float." in out
+    
+    def test_backend_usage(self, repl, capsys):
+        """Test malformed backend arguments."""
+        repl.change_backend(['decimal', 'many'])
+        assert "Usage: backend NAME [PRECISION]" in capsys.readouterr().out
+    
+    @patch('builtins.input', side_effect=['', 'exit'])
+    def test_get_operation_empty_input(self, mock_input, repl, capsys):
+        """Test that an empty line is rejected."""
+        assert repl.get_operation() == 'exit'
+        assert "Invalid input ''" in capsys.readouterr().out
+    
     @patch('builtins.input', side_effect=KeyboardInterrupt())
     def test_run_keyboard_interrupt(self, mock_input, repl, capsys):
         """Test handling Ctrl+C."""
         repl.run()
         captured = capsys.readouterr()
         assert "interrupted" in captured.out.lower() or "Goodbye" in captured.out
+
+
+class TestMain:
+    """Test cases for the command-line entry point."""
+    
+    def teardown_method(self):
+        """Return the history to the in-memory default."""
+        history = CalculationHistory()
+        history.set_capacity(None)
+        history.clear_history()
+    
+    @patch('builtins.input', side_effect=['exit'])
+    def test_main_runs_repl(self, mock_input, capsys):
+        """Test that main starts the interactive calculator."""
+        main([])
+        assert "Advanced Calculator" in capsys.readouterr().out
+    
+    @patch('builtins.input', side_effect=['cache', 'exit'])
+    def test_main_cache_size(self, mock_input, capsys):
+        """Test that --cache-size enables the result cache."""
+        try:
+            main(['--cache-size', '10', '--cache-ttl', '60'])
+            assert CalculationFactory.cache_stats()['ttl'] == 60
+        finally:
+            CalculationFactory.disable_cache()
+        assert "size       0/10" in capsys.readouterr().out
+    
+    def test_main_stream_file(self, tmp_path, capsys):
+        """Test streaming lines from a file."""
+        ops = tmp_path / 'ops.txt'
+        ops.write_text("add 5 3\nmultiply 2 4\n")
+        assert main(['--stream', str(ops)]) == 0
+        assert capsys.readouterr().out == "8.0\n8.0\n"
+        assert len(CalculationHistory()) == 0
+    
+    def test_main_stream_stdin(self, capsys):
+        """Test streaming from stdin with recording and errors."""
+        with patch('sys.stdin', io.StringIO("divide 1 0\nadd 1 1\n")):
+            assert main(['--stream', '--record']) == 1
+        out = capsys.readouterr().out
+        assert "Advanced Calculator" not in out
+        assert out.endswith("2.0\n")
+        assert len(CalculationHistory()) == 1
+    
+    def test_main_history_file_persists(self, tmp_path, capsys):
+        """Test that a history file survives between sessions."""
+        path = str(tmp_path / 'history.log')
+        with patch('builtins.input', side_effect=['add', '5', '3', 'exit']):
+            main(['--history-file', path])
+        CalculationHistory().set_capacity(None)
+        CalculationHistory().clear_history()
+        
+        with patch('builtins.input', side_effect=['history', 'exit']):
+            main(['--history-file', path])
+        assert "1. 5.0 + 3.0 = 8.0" in capsys.readouterr().out
+    
+    def test_main_metrics_file(self, tmp_path, capsys):
+        """Test that --metrics-file writes a Prometheus dump on exit."""
+        path = tmp_path / 'calculator.prom'
+        with patch('builtins.input', side_effect=['multiply', '2', '3', 'exit']):
+            try:
+                main(['--metrics-file', str(path)])
+            finally:
+                CalculationFactory.disable_metrics()
+        assert 'calculator_operation_calls_total{operation="multiply"} 1' in path.read_text()
+    
+    def test_main_metrics_with_stream(self, capsys):
+        """Test that --metrics also counts streamed calculations."""
+        with patch('sys.stdin', io.StringIO("add 1 1\nadd 2 2\n")):
+            try:
+                assert main(['--stream', '--metrics']) == 0
+                assert CalculationFactory.metrics_snapshot()['add']['calls'] >= 2
+            finally:
+                CalculationFactory.disable_metrics()
+    
+    def test_main_backend(self, capsys):
+        """Test --backend and --precision for streamed input."""
+        with patch('sys.stdin', io.StringIO("divide 2 3\n")):
+            try:
+                assert main(['--stream', '--backend', 'decimal', '--precision', '3']) == 0
+            finally:
+                CalculationFactory.set_backend('float')
+        assert capsys.readouterr().out == "0.667\n"
+    
+    def test_main_backend_invalid_precision(self, capsys):
+        """Test that --precision with a non-decimal backend is rejected."""
+        with pytest.raises(SystemExit):
+            main(['--backend', 'int', '--precision', '3'])
+        assert "Precision only applies" in capsys.readouterr().err
+
+
+class TestOneShot:
+    """Test cases for one-shot calculations from the command line."""
+    
+    def setup_method(self):
+        """Clear history before each test."""
+        CalculationHistory().clear_history()
+    
+    def test_positional_calculation(self, capsys):
+        """Test that 'add 5 3' prints only the result."""
+        assert main(['add', '5', '3']) == 0
+        assert capsys.readouterr().out == "8.0\n"
+    
+    def test_command_option(self, capsys):
+        """Test -c with a quoted calculation."""
+        assert main(['-c', 'divide 10 4']) == 0
+        assert capsys.readouterr().out == "2.5\n"
+    
+    def test_expression(self, capsys):
+        """Test that an infix expression is evaluated."""
+        assert main(['(3 + 4) * 2']) == 0
+        assert capsys.readouterr().out == "14.0\n"
+    
+    @pytest.mark.parametrize("argv, message", [
+        (['divide', '1', '0'], "Error: Calculation failed: Cannot divide by zero"),
+        (['add', 'x', '3'], "Error: Invalid number in 'x 3'"),
+        (['power', '2', '3'], "Error: Unknown operation: power"),
+        (['-c', '2 * x'], "Error: Missing value for variable 'x'"),
+    ])
+    def test_errors(self, argv, message, capsys):
+        """Test that failures go to stderr with exit status 1."""
+        assert main(argv) == 1
+        captured = capsys.readouterr()
+        assert captured.out == ""
+        assert captured.err.startswith(message)
+    
+    def test_fresh_process_skips_factory(self, capsys):
+        """Test the path taken before app.calculation has been imported."""
+        with patch.dict(sys.modules):
+            del sys.modules['app.calculation']
+            assert main(['multiply', '6', '7']) == 0
+            assert main(['divide', '1', '0']) == 1
+            assert 'app.calculation' not in sys.modules
+        captured = capsys.readouterr()
+        assert captured.out == "42.0\n"
+        assert "Calculation failed: Cannot divide by zero" in captured.err
+        assert len(CalculationHistory()) == 0
+    
+    def test_with_options(self, tmp_path, capsys):
+        """Test that options such as --backend and --history-file apply."""
+        path = str(tmp_path / 'history.log')
+        try:
+            assert main(['--backend', 'fraction', '--history-file', path, 'add', '1/3', '1/6']) == 0
+            assert main(['--backend', 'decimal', '--precision', '3', '-c', 'divide 2 3']) == 0
+        finally:
+            CalculationFactory.set_backend('float')
+            CalculationHistory().set_capacity(None)
+        assert capsys.readouterr().out == "1/2\n0.667\n"
+        assert len(CalculationHistory()) == 1
+    
+    def test_trailing_options(self, capsys):
+        """Test that options after the calculation are not taken as part of it."""
+        try:
+            assert main(['add', '0.1', '0.2', '--backend', 'decimal']) == 0
+        finally:
+            CalculationFactory.set_backend('float')
+        assert capsys.readouterr().out == "0.3\n"
+    
+    def test_negative_operands_skip_argparse(self, capsys):
+        """Test that negative numbers are not mistaken for options."""
+        with patch.dict(sys.modules):
+            del sys.modules['app.calculation']
+            assert main(['add', '-1', '-.5']) == 0
+            assert 'app.calculation' not in sys.modules
+        assert capsys.readouterr().out == "-1.5\n"
+    
+    def test_reduction_from_file(self, tmp_path, capsys):
+        """Test that 'sum FILE' reduces a file of numbers in one pass."""
+        path = tmp_path / 'numbers.txt'
+        path.write_text("1 2\n3\n\n4\n")
+        assert main(['sum', str(path)]) == 0
+        assert main(['-c', f'mean {path}']) == 0
+        assert capsys.readouterr().out == "10.0\n2.5\n"
+    
+    def test_reduction_from_stdin(self, capsys):
+        """Test that a reduction without FILE reads stdin."""
+        with patch('sys.stdin', io.StringIO("4 1 3\n")):
+            assert main(['max']) == 0
+        assert capsys.readouterr().out == "4.0\n"
+    
+    def test_reduction_fresh_process(self, capsys):
+        """Test reductions before app.calculation has been imported."""
+        with patch.dict(sys.modules):
+            del sys.modules['app.calculation']
+            with patch('sys.stdin', io.StringIO("1 2 3")):
+                assert main(['count']) == 0
+            with patch('sys.stdin', io.StringIO("")):
+                assert main(['min']) == 1
+            assert 'app.calculation' not in sys.modules
+        captured = capsys.readouterr()
+        assert captured.out == "3\n"
+        assert "Error: Calculation failed: min requires at least one value" in captured.err
+    
+    def test_reduction_overflow(self, tmp_path, capsys):
+        """Test that an overflowing sum is an error on both reduction paths."""
+        path = tmp_path / 'huge.txt'
+        path.write_text("1e308 1e308\n")
+        with patch.dict(sys.modules):
+            del sys.modules['app.calculation']
+            assert main(['sum', str(path)]) == 1
+        assert main(['sum', str(path)]) == 1
+        assert capsys.readouterr().err.count("Calculation failed: intermediate overflow") == 2
+    
+    def test_reduction_errors(self, tmp_path, capsys):
+        """Test missing files and invalid numbers."""
+        assert main(['sum', str(tmp_path / 'missing.txt')]) == 1
+        assert "No such file or directory" in capsys.readouterr().err
+        with patch('sys.stdin', io.StringIO("1 x")):
+            assert main(['sum']) == 1
+        assert "could not convert string to float: 'x'" in capsys.readouterr().err
+    
+    def test_reduction_with_options(self, tmp_path, capsys):
+        """Test reductions under a backend, recorded into a history file."""
+        numbers = tmp_path / 'numbers.txt'
+        numbers.write_text("1/3 1/6\n")
+        path = str(tmp_path / 'history.log')
+        try:
+            assert main(['--backend', 'fraction', '--history-file', path, 'sum', str(numbers)]) == 0
+            # The log keeps results as floats
+            assert str(CalculationHistory().get_last_calculation()) == "sum of 2 values = 0.5"
+        finally:
+            CalculationFactory.set_backend('float')
+            CalculationHistory().set_capacity(None)
+        assert capsys.readouterr().out == "1/2\n"
+    
+    def test_repl_is_loaded_on_demand(self):
+        """Test that CalculatorREPL is still importable from the package."""
+        import app.calculator
+        
+        assert app.calculator.CalculatorREPL is CalculatorREPL
+        with pytest.raises(AttributeError):
+            app.calculator.missing
@@ -0,0 +1,189 @@
+"""
+Unit tests for the expression parser and compiler.
+
+This module tests tokenizing, parsing into an AST, compilation to Python
+functions, batch evaluation and the compiled-expression cache.
+"""
+
+import math
+import re
+from array import array
+
+import pytest
+from app.calculation import CalculationFactory
+from app.expression import (
+    CompiledExpression, ExpressionCache, Negate, Number, Operation, Variable,
+    compile_expression, evaluate, parse, tokenize,
+)
+
+
+def power(a: float, b: float) -> float:
+    return a ** b
+
+
+class TestParse:
+    """Test cases for tokenize and parse."""
+    
+    def test_tokenize(self):
+        """Test token kinds and positions."""
+        assert tokenize("2.5e1*(x)") == [
+            ('number', '2.5e1', 0), ('symbol', '*', 5), ('symbol', '(', 6),
+            ('name', 'x', 7), ('symbol', ')', 8),
+        ]
+    
+    def test_precedence_and_associativity(self):
+        """Test that * binds tighter than + and operators associate left."""
+        assert parse("1 - 2 - 3 * x") == Operation(
+            'subtract',
+            Operation('subtract', Number(1.0), Number(2.0)),
+            Operation('multiply', Number(3.0), Variable('x')),
+        )
+    
+    def test_unary_and_parentheses(self):
+        """Test unary signs and grouping."""
+        assert parse("-(+1 ÷ 2)") == Negate(Operation('divide', Number(1.0), Number(2.0)))
+    
+    @pytest.mark.parametrize("source, error", [
+        ("", "Unexpected end of expression at position 0"),
+        ("2 +", "Unexpected end of expression at position 3"),
+        ("(1", "Expected ')' but found end of expression at position 2"),
+        ("add(1)", "Expected ',' but found ')' at position 5"),
+        ("1 2", "Unexpected '2' at position 2"),
+        ("2 $ 3", "Unexpected character '$' at position 2"),
+        (")", "Unexpected ')' at position 0"),
+        ("foo(1, 2)", "Unknown operation: foo"),
+        ("lambda + 1", "Invalid variable name 'lambda'"),
+        ("__op_add + 1", "Invalid variable name '__op_add'"),
+        ("1e999 + 1", "Number out of range: 1e999 at position 0"),
+    ])
+    def test_syntax_errors(self, source, error):
+        """Test that malformed expressions raise helpful errors."""
+        with pytest.raises(ValueError, match="^" + re.escape(error)):
+            parse(source)
+
+
+class TestCompiledExpression:
+    """Test cases for CompiledExpression."""
+    
+    @pytest.mark.parametrize("source, expected", [
+        ("(3 + 4) * 2 / 7", 2.0),
+        ("2 × 3 ÷ 4", 1.5),
+        ("-2 * -(3 - 5)", -4.0),
+        ("1.5e2 / 3", 50.0),
+        ("add(1, multiply(2, 3))", 7.0),
+    ])
+    def test_constant_expressions(self, source, expected):
+        """Test evaluation of expressions without variables."""
+        assert evaluate(source) == expected
+    
+    def test_variables_in_order_of_appearance(self):
+        """Test binding variables by mapping and keyword."""
+        compiled = CompiledExpression("(y - x) / x + y")
+        assert compiled.variables == ('y', 'x')
+        assert compiled.evaluate({'x': 2}, y=6) == 8
+        assert compiled(x=1, y=1) == 1
+    
+    def test_missing_variable(self):
+        """Test that unbound variables are reported."""
+        with pytest.raises(ValueError, match="Missing value for variable 'x'"):
+            evaluate("x + 1")
+    
+    def test_division_by_zero(self):
+        """Test that failures are wrapped like Calculation.execute."""
+        with pytest.raises(ValueError, match="Calculation failed: Cannot divide by zero"):
+            evaluate("1 / (x - 1)", x=1)
+    
+    def test_registered_operations(self):
+        """Test that custom operations can be called by name."""
+        CalculationFactory.register_operation('power', power)
+        try:
+            assert evaluate("power(2, n) - 1", n=10) == 1023
+        finally:
+            CalculationFactory.unregister_operation('power')
+    
+    def test_evaluate_many(self):
+        """Test evaluating one expression over columns of bindings."""
+        compiled = compile_expression("(x + y) / y")
+        results = compiled.evaluate_many({'x': [1, 2, 3], 'y': array('d', [1, 0, 3])})
+        assert results[0] == 2
+        assert math.isnan(results[1])
+        assert results[2] == 2
+    
+    def test_evaluate_many_errors(self):
+        """Test column validation for batch evaluation."""
+        with pytest.raises(ValueError, match="differ in length"):
+            compile_expression("x + y").evaluate_many({'x': [1], 'y': [1, 2]})
+        with pytest.raises(ValueError, match="no variables"):
+            compile_expression("1 + 2").evaluate_many({})
+        with pytest.raises(ValueError, match="Missing value"):
+            compile_expression("x + y").evaluate_many({'x': [1]})
+    
+    def test_long_flat_expression(self):
+        """Test that thousands of terms compile without nesting limits."""
+        source = " + ".join(["1"] * 5000) + " * x - -2"
+        assert evaluate(source, x=3) == 4999 + 3 + 2
+        compiled = compile_expression(" / ".join(["x"] * 3000))
+        assert list(compiled.evaluate_many({'x': [1.0, 0.0]}))[0] == 1.0
+    
+    def test_deep_nesting_is_a_value_error(self):
+        """Test that parentheses nested beyond the parser's reach raise ValueError."""
+        with pytest.raises(ValueError, match="too deeply nested"):
+            compile_expression("(" * 5000 + "1" + ")" * 5000)
+        assert evaluate("(" * 50 + "-1" + ")" * 50) == -1
+    
+    def test_operation_named_like_generated_code(self):
+        """Test that operation names cannot collide with generated names."""
+        CalculationFactory.register_operation('compiled', power)
+        try:
+            assert evaluate("compiled(compiled(2, 2), 2)") == 16
+        finally:
+            CalculationFactory.unregister_operation('compiled')
+    
+    def test_repr(self):
+        """Test developer representation."""
+        assert repr(CompiledExpression("1+2")) == "CompiledExpression('1+2')"
+    
+    def test_evaluate_many_into_buffer(self):
+        """Test evaluate_many over raw bytes into an output buffer."""
+        compiled = compile_expression("x / y + 1")
+        out = array('d', [0.0, 0.0])
+        result = compiled.evaluate_many({'x': array('d', [4.0, 1.0]).tobytes(), 'y': [2, 0]}, out=out)
+        assert result is out
+        assert out[0] == 3.0 and math.isnan(out[1])
+
+
+class TestExpressionCache:
+    """Test cases for the compiled-expression cache."""
+    
+    def test_cache_reuses_compilation(self):
+        """Test that the same source text compiles once."""
+        cache = ExpressionCache()
+        first = cache.compile("x * 2")
+        assert cache.compile("x * 2") is first
+        assert (cache.hits, cache.misses, len(cache)) == (1, 1, 1)
+        cache.clear()
+        assert len(cache) == 0
+    
+    def test_cache_is_bounded(self):
+        """Test that the least recently used compilation is dropped."""
+        cache = ExpressionCache(maxsize=2)
+        first = cache.compile("1")
+        cache.compile("2")
+        cache.compile("1")
+        cache.compile("3")
+        assert cache.compile("1") is first
+        assert len(cache) == 2
+        assert cache.misses == 3
+    
+    def test_register_operation_recompiles(self):
+        """Test that replacing an operation invalidates compiled expressions."""
+        CalculationFactory.register_operation('power', power)
+        try:
+            first = compile_expression("power(x, 2)")
+            assert first(x=3) == 9
+            CalculationFactory.register_operation('power', lambda a, b: a ** b + 1)
+            second = compile_expression("power(x, 2)")
+            assert second is not first
+            assert second(x=3) == 10
+        finally:
+            CalculationFactory.unregister_operation('power')
@@ -0,0 +1,113 @@
+"""
+Unit tests for dependency-tracked calculation graphs.
+
+This module tests node evaluation, incremental recomputation with
+early cutoff, error propagation and recording into history.
+"""
+
+import pytest
+from app.calculation import CalculationHistory, SessionHistory
+from app.graph import CalculationGraph
+
+
+class TestCalculationGraph:
+    """Test cases for CalculationGraph."""
+    
+    def setup_method(self):
+        """Clear history before each test."""
+        CalculationHistory().clear_history()
+    
+    def test_chain(self):
+        """Test that nodes feed each other's results forward."""
+        graph = CalculationGraph()
+        x = graph.input('x', 3)
+        total = graph.calculation('add', x, 4, name='total')
+        doubled = graph.calculation('multiply', total, 2)
+        assert doubled.value == 14
+        x.set(5)
+        assert doubled.value == 18
+        assert graph['total'] is total
+        assert len(graph) == 3
+        assert x.value == 5
+        assert repr(x) == "InputNode(x=5)"
+        assert repr(doubled) == "CalculationNode(#2: multiply)"
+    
+    def test_only_downstream_nodes_recompute(self):
+        """Test that changing one leaf of many recomputes only its dependents."""
+        graph = CalculationGraph()
+        leaves = [graph.input(f"x{i}", i) for i in range(1000)]
+        squares = [graph.calculation('multiply', leaf, leaf) for leaf in leaves]
+        total = squares[0]
+        for square in squares[1:]:
+            total = graph.calculation('add', total, square)
+        
+        graph.set('x999', 1000)
+        recomputed = graph.recompute()
+        assert len(recomputed) == 2
+        assert total.value == sum(i * i for i in range(999)) + 1000 ** 2
+        
+        graph.set('x0', 2)
+        assert len(graph.recompute()) == 1000
+    
+    def test_unchanged_values_stop_propagation(self):
+        """Test early cutoff when a recomputed value does not change."""
+        graph = CalculationGraph()
+        x = graph.input('x', 1)
+        zero = graph.calculation('multiply', x, 0)
+        graph.calculation('add', zero, 1)
+        x.set(2)
+        assert [node.operation_name for node in graph.recompute()] == ['multiply']
+        x.set(2)
+        assert graph.recompute() == []
+    
+    def test_errors_propagate_and_recover(self):
+        """Test that a failing node fails its dependents until fixed."""
+        graph = CalculationGraph()
+        d = graph.input('d', 0)
+        ratio = graph.calculation('divide', 1, d, name='ratio')
+        scaled = graph.calculation('multiply', ratio, 10)
+        with pytest.raises(ValueError, match="Cannot divide by zero"):
+            ratio.value
+        with pytest.raises(ValueError, match="Depends on failed node ratio"):
+            scaled.value
+        d.set(4)
+        assert scaled.value == 2.5
+    
+    @pytest.mark.parametrize("build, error", [
+        (lambda g: g.calculation('power', 1, 2), "Unknown operation: power"),
+        (lambda g: g.calculation('add', CalculationGraph().input('x', 1), 2),
+         "same graph"),
+        (lambda g: g.input('a', 1) and g.input('a', 2), "Duplicate node name: a"),
+        (lambda g: g.set(g.calculation('add', 1, 2), 5), "Only input nodes"),
+    ])
+    def test_invalid_graphs(self, build, error):
+        """Test that invalid nodes and updates are rejected."""
+        with pytest.raises(ValueError, match=error):
+            build(CalculationGraph())
+    
+    def test_rejected_duplicate_keeps_dependents(self):
+        """Test that a node rejected for its name does not shadow a real dependent."""
+        graph = CalculationGraph()
+        x = graph.input('x', 1)
+        graph.calculation('add', x, 1, name='y')
+        with pytest.raises(ValueError, match="Duplicate node name: y"):
+            graph.calculation('add', x, 2, name='y')
+        doubled = graph.calculation('multiply', x, 2)
+        x.set(5)
+        assert doubled.value == 10
+        assert len(x.dependents) == 2
+    
+    def test_record_into_history(self):
+        """Test recording node results as calculations."""
+        graph = CalculationGraph()
+        x = graph.input('x', 6)
+        half = graph.calculation('divide', x, 2)
+        graph.calculation('divide', half, 0)
+        assert graph.record() == 1
+        assert str(CalculationHistory().get_last_calculation()) == "6 ÷ 2 = 3.0"
+        
+        session = SessionHistory()
+        x.set(8)
+        assert graph.record(graph.recompute(), history=session) == 1
+        assert str(session.get_last_calculation()) == "8 ÷ 2 = 4.0"
+        assert graph.recomputations == 2
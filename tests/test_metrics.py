@@ -0,0 +1,170 @@
+"""
+Unit tests for operation metrics.
+
+This module tests the log-linear latency histogram, per-operation
+counters collected through CalculationFactory, snapshots and the
+Prometheus text dump.
+"""
+
+import pytest
+from app.calculation import Calculation, CalculationFactory, MeteredCalculation
+from app.metrics import LatencyHistogram, Metrics
+
+
+class TestLatencyHistogram:
+    """Test cases for LatencyHistogram."""
+    
+    def test_empty(self):
+        """Test that an empty histogram reports zeros."""
+        histogram = LatencyHistogram()
+        assert histogram.count == 0
+        assert histogram.max == 0
+        assert histogram.mean() == 0.0
+        assert histogram.quantile(0.99) == 0
+    
+    def test_small_values_are_exact(self):
+        """Test that values below 64 ns get a bucket each."""
+        histogram = LatencyHistogram()
+        for value in range(1, 64):
+            histogram.record(value)
+        assert histogram.quantile(0.5) == 32
+        assert histogram.max == 63
+        assert histogram.count == 63
+    
+    @pytest.mark.parametrize('value', [64, 1000, 123456, 10 ** 9, 2 ** 62 + 12345])
+    def test_relative_error(self, value):
+        """Test that large values are reported within 1/32 of their size."""
+        histogram = LatencyHistogram()
+        histogram.record(value)
+        reported = histogram.quantile(1.0)
+        assert value <= reported < value * (1 + 1 / 32)
+    
+    def test_quantiles(self):
+        """Test percentiles over a uniform spread."""
+        histogram = LatencyHistogram()
+        for value in range(1, 10001):
+            histogram.record(value * 100)
+        assert abs(histogram.quantile(0.5) - 500000) / 500000 < 0.04
+        assert abs(histogram.quantile(0.99) - 990000) / 990000 < 0.04
+        assert histogram.mean() == 500050
+    
+    def test_power_of_two_buckets(self):
+        """Test coarsening into exact power-of-two ranges."""
+        histogram = LatencyHistogram()
+        for value in (100, 127, 128, 255, 1000):
+            histogram.record(value)
+        assert histogram.power_of_two_buckets() == {7: 2, 8: 2, 10: 1}
+
+
+class TestFactoryMetrics:
+    """Test cases for metrics collected through CalculationFactory."""
+    
+    def setup_method(self):
+        """Start each test with fresh metrics."""
+        self.metrics = CalculationFactory.enable_metrics()
+        self.metrics.reset()
+    
+    def teardown_method(self):
+        """Leave metrics disabled for other tests."""
+        CalculationFactory.disable_metrics()
+    
+    def test_disabled_by_default(self):
+        """Test that calculations are plain when metrics are off."""
+        CalculationFactory.disable_metrics()
+        assert CalculationFactory.metrics_snapshot() is None
+        assert type(CalculationFactory.create('add', 1, 2)) is Calculation
+    
+    def test_counts_calls_and_errors(self):
+        """Test per-operation call, error and create counts."""
+        for b in (1, 2, 0):
+            calculation = CalculationFactory.create('divide', 10, b)
+            try:
+                calculation.execute()
+            except ValueError:
+                pass
+        CalculationFactory.create('add', 1, 2).execute()
+        
+        snapshot = CalculationFactory.metrics_snapshot()
+        assert list(snapshot) == ['add', 'divide']
+        assert snapshot['divide']['calls'] == 3
+        assert snapshot['divide']['errors'] == 1
+        assert snapshot['divide']['creates'] == 3
+        assert snapshot['add']['calls'] == 1
+        assert 0 < snapshot['add']['p50_ns'] <= snapshot['add']['max_ns']
+        assert set(snapshot['add']) >= {'p90_ns', 'p99_ns', 'mean_ns', 'create_mean_ns'}
+    
+    def test_metered_calculation_behaves_like_calculation(self):
+        """Test that instrumentation does not change results or equality."""
+        calculation = CalculationFactory.create('multiply', 3, 4)
+        assert isinstance(calculation, MeteredCalculation)
+        assert calculation.execute() == 12
+        plain = Calculation('multiply', 3, 4, lambda a, b: a * b)
+        plain.execute()
+        assert calculation == plain
+        assert repr(calculation) == "Calculation(multiply, 3, 4)"
+        with pytest.raises(ValueError, match="Unknown operation"):
+            CalculationFactory.create('modulo', 1, 2)
+    
+    def test_cache_hits_are_counted(self):
+        """Test that metrics and the result cache work together."""
+        CalculationFactory.enable_cache()
+        try:
+            for _ in range(2):
+                CalculationFactory.create('add', 1, 2).execute()
+            assert CalculationFactory.cache_stats()['hits'] == 1
+        finally:
+            CalculationFactory.disable_cache()
+        assert self.metrics.operation('add').calls == 2
+    
+    def test_reset_keeps_live_calculations_reporting(self):
+        """Test that reset clears counters in place."""
+        calculation = CalculationFactory.create('add', 1, 2)
+        self.metrics.reset()
+        calculation.execute()
+        assert CalculationFactory.metrics_snapshot()['add']['calls'] == 1
+        assert CalculationFactory.enable_metrics() is self.metrics
+        assert len(self.metrics) == 1
+
+
+class TestPrometheus:
+    """Test cases for the Prometheus text format."""
+    
+    def test_format(self):
+        """Test counters and cumulative histogram buckets."""
+        metrics = Metrics()
+        add = metrics.operation('add')
+        add.errors = 1
+        for value in (100, 200, 300):
+            add.execute_latency.record(value)
+        metrics.operation('divide')
+        text = metrics.to_prometheus()
+        
+        assert "# TYPE calculator_operation_calls_total counter" in text
+        assert 'calculator_operation_calls_total{operation="add"} 3' in text
+        assert 'calculator_operation_errors_total{operation="add"} 1' in text
+        assert "# TYPE calculator_execute_duration_seconds histogram" in text
+        assert 'calculator_execute_duration_seconds_bucket{operation="add",le="1.28e-07"} 1' in text
+        assert 'calculator_execute_duration_seconds_bucket{operation="add",le="2.56e-07"} 2' in text
+        assert 'calculator_execute_duration_seconds_bucket{operation="add",le="5.12e-07"} 3' in text
+        assert 'calculator_execute_duration_seconds_bucket{operation="add",le="+Inf"} 3' in text
+        assert 'calculator_execute_duration_seconds_sum{operation="add"} 6e-07' in text
+        assert 'calculator_execute_duration_seconds_count{operation="divide"} 0' in text
+        assert text.endswith("\n")
+    
+    def test_write(self, tmp_path):
+        """Test writing the dump to a file."""
+        metrics = Metrics()
+        metrics.operation('add').create_latency.record(500)
+        path = tmp_path / 'calculator.prom'
+        metrics.write_prometheus(str(path), prefix='calc')
+        assert 'calc_operation_creates_total{operation="add"} 1' in path.read_text()
+        assert [p.name for p in tmp_path.iterdir()] == ['calculator.prom']
+    
+    def test_failed_write_leaves_no_temporary_file(self, tmp_path):
+        """Test that a failed rename cleans up after itself."""
+        target = tmp_path / 'directory'
+        target.mkdir()
+        (target / 'keep').write_text('')
+        with pytest.raises(OSError):
+            Metrics().write_prometheus(str(target))
+        assert [p.name for p in tmp_path.iterdir()] == ['directory']
@@ -0,0 +1,107 @@
+"""
+Unit tests for the process-pool parallel executor.
+
+This module tests chunking, ordering, history merging and the handling
+of operations registered at runtime.
+"""
+
+import multiprocessing
+
+import pytest
+from app.backend import FloatBackend
+from app.cache import MISSING, SharedResultCache
+from app.calculation import CalculationFactory, CalculationHistory
+from app.parallel import ParallelExecutor, _run_chunk
+
+
+def power(a: float, b: float) -> float:
+    """Module-level custom operation that can be pickled."""
+    return a ** b
+
+
+class TestRunChunk:
+    """Test cases for the worker chunk function."""
+    
+    def test_run_chunk(self):
+        """Test evaluation with shipped operations and failures."""
+        results = _run_chunk({'power': power}, [('power', 2, 3), ('divide', 1, 0), ('add', 1, 1)])
+        assert results == [8, None, 2]
+
+
+class TestParallelExecutor:
+    """Test cases for ParallelExecutor."""
+    
+    def setup_method(self):
+        """Clear history before each test."""
+        CalculationHistory().clear_history()
+    
+    def teardown_method(self):
+        """Remove operations registered by the tests."""
+        for name in ('power', 'offset'):
+            if CalculationFactory.has_operation(name):
+                CalculationFactory.unregister_operation(name)
+    
+    def test_chunk_size_must_be_positive(self):
+        """Test that empty chunks are rejected."""
+        with pytest.raises(ValueError, match="at least 1"):
+            ParallelExecutor(chunk_size=0)
+    
+    def test_unknown_operation(self):
+        """Test that unknown operations are rejected before dispatch."""
+        with pytest.raises(ValueError, match="Unknown operation: modulo"):
+            ParallelExecutor().map([('modulo', 1, 2)])
+    
+    def test_map_across_processes_keeps_order(self):
+        """Test that results from many chunks come back in input order."""
+        CalculationFactory.register_operation('power', power)
+        jobs = [('power', i, 2) for i in range(100)] + [('divide', 1, 0)]
+        results = ParallelExecutor(workers=2, chunk_size=7).map(jobs)
+        assert results == [i ** 2 for i in range(100)] + [None]
+    
+    def test_runtime_lambda_reaches_forked_workers(self):
+        """Test that unpicklable operations registered at runtime still work."""
+        executor = ParallelExecutor(workers=2, chunk_size=2)
+        CalculationFactory.register_operation('offset', lambda a, b: a + b + 100)
+        assert executor.map([('offset', i, 0) for i in range(5)]) == [100, 101, 102, 103, 104]
+    
+    def test_unpicklable_operation_without_fork(self):
+        """Test that spawned workers cannot receive lambdas."""
+        executor = ParallelExecutor(mp_context=multiprocessing.get_context('spawn'))
+        CalculationFactory.register_operation('offset', lambda a, b: a + b)
+        with pytest.raises(ValueError, match="cannot be sent to worker processes"):
+            executor.map([('offset', 1, 2)])
+    
+    def test_run_records_history_in_order(self):
+        """Test that successful calculations are merged into history in order."""
+        jobs = [('multiply', i, 2) for i in range(6)] + [('divide', 1, 0), ('add', 1, 1)]
+        calculations = ParallelExecutor(workers=1, chunk_size=3).run(jobs)
+        assert [calc.get_result() for calc in calculations] == [0, 2, 4, 6, 8, 10, None, 2]
+        history = CalculationHistory().get_history()
+        assert len(history) == 7
+        assert str(history[-1]) == "1 + 1 = 2"
+        assert str(history[2]) == "2 × 2 = 4"
+    
+    def test_workers_share_cache(self):
+        """Test that workers read and fill a shared result cache."""
+        # Workers key results by the float backend, like the factory does
+        cache = SharedResultCache(256, namespace=repr(FloatBackend()))
+        try:
+            # A planted result proves the workers consult the cache
+            cache.put(('power', 3, 2), -1)
+            executor = ParallelExecutor(workers=2, chunk_size=2, cache=cache)
+            CalculationFactory.register_operation('power', power)
+            jobs = [('power', i, 2) for i in range(6)] + [('divide', 1, 0)]
+            assert executor.map(jobs) == [0, 1, 4, -1, 16, 25, None]
+            assert cache.get(('power', 5, 2)) == 25
+            assert cache.get(('divide', 1, 0)) is MISSING
+            local = ParallelExecutor(workers=1, cache=cache)
+            assert local.map([('power', 5, 2), ('power', 7, 2)]) == [25, 49]
+            assert cache.get(('power', 7, 2)) == 49
+        finally:
+            cache.close()
+            cache.unlink()
+    
+    def test_run_without_recording(self):
+        """Test that history can be left untouched."""
+        ParallelExecutor().run([('add', 1, 2)], record=False)
+        assert len(CalculationHistory()) == 0
@@ -0,0 +1,221 @@
+"""
+Unit tests for indexed history queries.
+
+This module tests query parsing, the chunked sorted column, the
+per-operation history index and CalculationHistory.query against
+eviction, boxed values and incremental updates.
+"""
+
+import random
+from decimal import Decimal
+from fractions import Fraction
+
+import pytest
+from app.calculation import Calculation, CalculationFactory, CalculationHistory, SessionHistory
+from app.query import Condition, HistoryIndex, SortedColumn, parse_query
+
+
+def record(history, operation_name, a, b, execute=True):
+    """Create a calculation, optionally execute it, and add it to ``history``."""
+    calculation = CalculationFactory.create(operation_name, a, b)
+    if execute:
+        calculation.execute()
+    history.add_calculation(calculation)
+    return calculation
+
+
+class TestParseQuery:
+    """Test cases for query parsing."""
+    
+    def test_conditions(self):
+        """Test fields, operators and optional spaces."""
+        assert parse_query("op=divide result > 100 and a<=5 B!=0 OPERATION==add") == [
+            Condition('op', '=', 'divide'),
+            Condition('result', '>', 100.0),
+            Condition('a', '<=', 5.0),
+            Condition('b', '!=', 0.0),
+            Condition('op', '==', 'add'),
+        ]
+    
+    def test_operation_names_keep_their_case(self):
+        """Test that mixed-case operation names are matched as registered."""
+        assert parse_query("Op=logXY") == [Condition('op', '=', 'logXY')]
+        CalculationFactory.register_operation('logXY', lambda a, b: a * b)
+        try:
+            history = SessionHistory()
+            record(history, 'logXY', 2, 3)
+            record(history, 'add', 2, 3)
+            assert [str(c) for c in history.query('op=logXY')] == ["2 logXY 3 = 6"]
+            assert history.query('op=logxy') == []
+        finally:
+            CalculationFactory.unregister_operation('logXY')
+    
+    @pytest.mark.parametrize('text, message', [
+        ('', 'at least one condition'),
+        ('result', 'Invalid condition'),
+        ('op>add', 'only support = and !='),
+        ('result>ten', "Invalid number 'ten'"),
+        ('c=1', "Unknown field 'c'"),
+    ])
+    def test_invalid(self, text, message):
+        """Test that malformed queries raise ValueError."""
+        with pytest.raises(ValueError, match=message):
+            parse_query(text)
+
+
+class TestSortedColumn:
+    """Test cases for SortedColumn."""
+    
+    def test_matches_sorted_reference(self):
+        """Test range lookups against a brute-force scan across chunk splits."""
+        column = SortedColumn(load=8)
+        values = [float(random.Random(i).randrange(50)) for i in range(500)]
+        for sequence, value in enumerate(values):
+            column.add(value, sequence)
+        column.add(float('nan'), 999)
+        assert len(column) == 500
+        for low, high, include_low, include_high in [
+            (10, 20, True, True), (10, 20, False, False), (-1, 100, True, True),
+            (25, 25, True, True), (25, 25, False, True), (30, 10, True, True),
+        ]:
+            expected = sorted(
+                sequence for sequence, value in enumerate(values)
+                if (value > low or include_low and value == low)
+                and (value < high or include_high and value == high)
+            )
+            assert sorted(column.range(low, high, include_low, include_high)) == expected
+            assert column.count(low, high, include_low, include_high) == len(expected)
+    
+    def test_extend(self):
+        """Test bulk loading into an empty column and adding afterwards."""
+        column = SortedColumn(load=4)
+        column.extend([3.0, 1.0, float('nan'), 2.0, 1.0], [0, 1, 2, 3, 4])
+        column.extend([0.5], [5])
+        assert len(column) == 5
+        assert column.range(0, 1) == [5, 1, 4]
+        assert column.range(float('-inf'), float('inf')) == [5, 1, 4, 3, 0]
+
+
+class TestHistoryIndex:
+    """Test cases for HistoryIndex candidate selection."""
+    
+    def build(self):
+        """Index rows (seq, op, a, b, result) added one by one."""
+        index = HistoryIndex()
+        for sequence in range(100):
+            op = ('add', 'multiply')[sequence % 2]
+            index.add(sequence, op, float(sequence), 2.0, float(sequence * 2))
+        return index
+    
+    def test_exact_lookups(self):
+        """Test that single-column queries are answered from the index alone."""
+        index = self.build()
+        assert index.candidates(parse_query('op=add result<10')) == ([0, 2, 4], True)
+        assert index.candidates(parse_query('op!=add a>=95')) == ([95, 97, 99], True)
+        sequences, exact = index.candidates(parse_query('op=multiply'))
+        assert list(sequences) == list(range(1, 100, 2)) and exact
+    
+    def test_inexact_lookups(self):
+        """Test queries whose candidates still need checking."""
+        index = self.build()
+        assert index.candidates(parse_query('b!=2'))[1] is False
+        sequences, exact = index.candidates(parse_query('a>=0 a<100'))
+        assert sorted(sequences) == list(range(100)) and exact is False
+        sequences, exact = index.candidates(parse_query('a<10 result<10'))
+        assert sequences == [0, 1, 2, 3, 4] and exact
+        sequences, exact = index.candidates(parse_query('a<2 result<1000'))
+        assert sequences == [0, 1] and exact is False
+        assert index.candidates(parse_query('op=power')) == ([], True)
+
+
+class TestHistoryQuery:
+    """Test cases for CalculationHistory.query."""
+    
+    def setup_method(self):
+        """Clear history before each test."""
+        CalculationHistory().clear_history()
+    
+    def test_query_matches_scan(self):
+        """Test random queries against filtering the materialized history."""
+        history = SessionHistory()
+        rng = random.Random(3)
+        ops = ['add', 'subtract', 'multiply', 'divide']
+        for _ in range(2000):
+            record(history, rng.choice(ops), rng.randint(-50, 50), rng.randint(1, 20))
+        queries = ['op=divide result>5', 'a<0 b>=10', 'op!=add result=0',
+                   'op=multiply result>=-100 result<=100 b!=3', 'b<=1']
+        for query in queries:
+            conditions = parse_query(query)
+            fields = lambda c: {'op': c.operation_name, 'a': c.operand_a,
+                                'b': c.operand_b, 'result': c.get_result()}
+            expected = [c for c in history.get_history()
+                        if all(cond.test(fields(c)[cond.field]) for cond in conditions)]
+            assert history.query(query) == expected
+        
+        # Rows merged after the index was built are indexed incrementally
+        record(history, 'divide', 1000, 1)
+        assert history.query_positions('op=divide result>=1000') == [2000]
+        assert str(history.query('op=divide result>=1000')[0]) == "1000 ÷ 1 = 1000.0"
+    
+    def test_positions_and_boxed_values(self):
+        """Test that boxed and unexecuted rows are compared exactly."""
+        history = SessionHistory()
+        record(history, 'add', Decimal('0.1'), Decimal('0.2'))
+        record(history, 'add', Fraction(1, 3), 0)
+        record(history, 'add', 1, 2, execute=False)
+        record(history, 'add', 0.1, 0.2)
+        assert history.query_positions('result=0.3') == [0]
+        # Added after the index exists; its float approximation is 0.3
+        record(history, 'add', Decimal('0.3'), Decimal('1e-20'))
+        assert history.query_positions('result=0.3') == [0]
+        assert history.query_positions('result>0.3') == [1, 3, 4]
+        assert history.query_positions('result<0.34 result>0.33') == [1]
+        assert history.query_positions('a=1') == [2]
+        assert history.query_positions('op=add result!=0.3') == [1, 3, 4]
+        assert history.query_positions(parse_query('op=add')) == [0, 1, 2, 3, 4]
+        text = Calculation('add', 'x', 'y', lambda a, b: a + b)
+        text.execute()
+        history.add_calculation(text)
+        assert history.query_positions('a>1') == []
+        # Fraction('inf') fails, so the float bound is used as is
+        assert history.query_positions('result<inf a<1') == [0, 1, 3, 4]
+    
+    def test_clear_and_capacity_reset_index(self):
+        """Test that swapping the store drops the old index."""
+        history = SessionHistory()
+        record(history, 'multiply', 3, 4)
+        assert len(history.query('result=12')) == 1
+        history.clear_history()
+        assert history.query('result=12') == []
+        record(history, 'multiply', 3, 4)
+        history.set_capacity(5)
+        assert history.query_positions('result=12') == [0]
+    
+    def test_evicted_rows_are_skipped(self):
+        """Test queries on a bounded history after eviction."""
+        history = SessionHistory()
+        history.merge_threshold = 1
+        history.set_capacity(10)
+        record(history, 'add', 0, 0)
+        assert history.query_positions('op=add') == [0]
+        for i in range(1, 50):
+            record(history, 'add', i, 0)
+        assert [c.get_result() for c in history.query('result<45')] == list(range(40, 45))
+        assert history.query_positions('result>=48') == [8, 9]
+        # Stale entries of evicted rows led to a rebuild instead of growing
+        assert history._index is None or history._index.rows <= 2 * 10 + 1
+    
+    def test_open_log_resets_index(self, tmp_path):
+        """Test that a persistent log's existing rows are indexed."""
+        path = str(tmp_path / 'history.log')
+        history = SessionHistory()
+        history.open_log(path)
+        record(history, 'subtract', 10, 4)
+        assert len(history) == 1
+        history._store.close()
+        
+        reopened = SessionHistory()
+        assert reopened.query('op=subtract') == []
+        reopened.open_log(path)
+        assert [str(c) for c in reopened.query('op=subtract')] == ["10 - 4 = 6"]
+        reopened._store.close()
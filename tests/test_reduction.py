@@ -0,0 +1,155 @@
+"""
+Unit tests for streaming reductions.
+
+This module tests the single-pass reduction algorithms, reading numbers
+from files, and CalculationFactory.reduce with its history entries and
+numeric backends.
+"""
+
+import io
+import math
+import statistics
+from decimal import Decimal
+from fractions import Fraction
+
+import pytest
+from app.calculation import CalculationFactory, Reduction, SessionHistory
+from app.reduction import REDUCTIONS, read_numbers
+
+
+class TestReductions:
+    """Test cases for the reduction algorithms."""
+    
+    def test_results_and_counts(self):
+        """Test every reduction against the statistics module."""
+        values = [2.5, -1.0, 4.0, 10.25, 3.0]
+        expected = {
+            'sum': sum(values),
+            'mean': statistics.mean(values),
+            'variance': statistics.variance(values),
+            'stddev': statistics.stdev(values),
+            'min': -1.0,
+            'max': 10.25,
+            'count': 5,
+        }
+        for name, reducer in REDUCTIONS.items():
+            count, result = reducer(iter(values))
+            assert count == 5
+            assert result == pytest.approx(expected[name])
+    
+    def test_sum_is_compensated(self):
+        """Test that summation does not accumulate rounding error."""
+        assert REDUCTIONS['sum']([0.1] * 10)[1] == 1.0
+        assert REDUCTIONS['sum']([1e100, 1.0, -1e100])[1] == 1.0
+    
+    def test_variance_is_stable(self):
+        """Test Welford's algorithm on values with a large common offset."""
+        values = [1e9 + x for x in (4.0, 7.0, 13.0, 16.0)]
+        assert REDUCTIONS['variance'](values)[1] == pytest.approx(30.0)
+    
+    def test_consumes_generators_once(self):
+        """Test that a generator is read in a single pass."""
+        count, result = REDUCTIONS['mean'](float(i) for i in range(1, 1001))
+        assert (count, result) == (1000, 500.5)
+    
+    @pytest.mark.parametrize("name, values, message", [
+        ('mean', [], "mean requires at least one value"),
+        ('min', [], "min requires at least one value"),
+        ('max', [], "max requires at least one value"),
+        ('variance', [1.0], "variance requires at least two values"),
+        ('stddev', [], "variance requires at least two values"),
+    ])
+    def test_too_few_values(self, name, values, message):
+        """Test reductions that need a minimum number of values."""
+        with pytest.raises(ValueError, match=message):
+            REDUCTIONS[name](iter(values))
+    
+    def test_empty_sum_and_count(self):
+        """Test that sum and count of nothing are zero."""
+        assert REDUCTIONS['sum']([]) == (0, 0.0)
+        assert REDUCTIONS['count']([]) == (0, 0)
+    
+    def test_read_numbers(self):
+        """Test parsing whitespace-separated numbers from lines."""
+        lines = io.StringIO("1 2.5\n\n  -3e2\n4\n")
+        assert list(read_numbers(lines)) == [1.0, 2.5, -300.0, 4.0]
+        assert list(read_numbers(["1/3 2"], Fraction)) == [Fraction(1, 3), 2]
+
+
+class TestFactoryReduce:
+    """Test cases for CalculationFactory.reduce."""
+    
+    def teardown_method(self):
+        """Restore the float backend."""
+        CalculationFactory.set_backend('float')
+    
+    def test_reduce(self):
+        """Test that reduce returns an executed Reduction."""
+        reduction = CalculationFactory.reduce('sum', read_numbers(io.StringIO("1 2 3\n4")))
+        assert isinstance(reduction, Reduction)
+        assert reduction.get_result() == 10.0
+        assert reduction.operand_a == 4
+        assert str(reduction) == "sum of 4 values = 10.0"
+        assert repr(reduction) == "Reduction(sum, 4)"
+        # The stream is spent; executing again keeps the result
+        assert reduction.execute() == 10.0
+    
+    def test_unexecuted_text(self):
+        """Test the text of a reduction that has not run yet."""
+        reduction = Reduction('max', iter([1.0]), REDUCTIONS['max'])
+        assert str(reduction) == "max of a stream"
+    
+    def test_errors(self):
+        """Test unknown reductions and failures while reducing."""
+        assert CalculationFactory.get_available_reductions() == list(REDUCTIONS)
+        with pytest.raises(ValueError, match="Unknown reduction: median. Available: sum"):
+            CalculationFactory.reduce('median', [1.0])
+        with pytest.raises(ValueError, match="Calculation failed: mean requires"):
+            CalculationFactory.reduce('mean', [])
+        with pytest.raises(ValueError, match="Calculation failed: could not convert"):
+            CalculationFactory.reduce('sum', read_numbers(["1 x"]))
+        with pytest.raises(ValueError, match="Calculation failed: intermediate overflow"):
+            CalculationFactory.reduce('sum', [1e308, 1e308])
+        with pytest.raises(ValueError, match="Calculation failed: intermediate overflow"):
+            CalculationFactory.reduce('mean', [-1e308, -1e308])
+    
+    def test_one_history_entry(self):
+        """Test that a reduction is one history row however many values it read."""
+        history = SessionHistory()
+        history.add_calculation(CalculationFactory.reduce('sum', map(float, range(100000))))
+        history.add_calculation(CalculationFactory.reduce('count', range(7)))
+        assert len(history) == 2
+        restored = history.get_history()[0]
+        assert isinstance(restored, Reduction)
+        assert restored == CalculationFactory.reduce('sum', map(float, range(100000)))
+        assert str(history).splitlines()[1:] == [
+            "1. sum of 100000 values = 4999950000.0",
+            "2. count of 7 values = 7",
+        ]
+        assert history.query('op=count result<10') == [history.get_history()[1]]
+    
+    def test_exact_backends(self):
+        """Test that sum, mean, min and max stay in the backend's type."""
+        CalculationFactory.set_backend('fraction')
+        assert CalculationFactory.reduce('mean', ['1/3', 1, 2]).get_result() == Fraction(10, 9)
+        assert CalculationFactory.reduce('min', [0.5, '1/3']).get_result() == Fraction(1, 3)
+        # Variance is always computed in float
+        assert isinstance(CalculationFactory.reduce('variance', [1, 2]).get_result(), float)
+        
+        CalculationFactory.set_backend('decimal', 5)
+        reduction = CalculationFactory.reduce('sum', [0.1] * 3)
+        assert reduction.get_result() == Decimal('0.3')
+        history = SessionHistory()
+        history.add_calculation(reduction)
+        assert history.get_history()[0] is reduction
+        
+        CalculationFactory.set_backend('int')
+        assert CalculationFactory.reduce('mean', [1, 2]).get_result() == 1
+        with pytest.raises(ValueError, match="Calculation failed: 1.5 is not an integer"):
+            CalculationFactory.reduce('sum', [1.5])
+    
+    def test_stddev_matches_sqrt_variance(self):
+        """Test that stddev is the square root of variance."""
+        values = [1.0, 4.0, 9.0]
+        variance = CalculationFactory.reduce('variance', values).get_result()
+        assert CalculationFactory.reduce('stddev', values).get_result() == math.sqrt(variance)
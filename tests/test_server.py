@@ -0,0 +1,279 @@
+"""
+Unit tests for the asyncio calculation server.
+
+This module tests the JSON message handling, pipelined requests over
+TCP and Unix sockets, per-connection history and the load test.
+"""
+
+import asyncio
+import json
+import os
+import tempfile
+
+import pytest
+from app.calculation import CalculationFactory, CalculationHistory, SessionHistory
+from app.session import SessionRegistry
+from app.server import (
+    CalculationClient, CalculationServer, handle_message, load_test, main, read_line, respond,
+)
+
+
+class TestHandleMessage:
+    """Test cases for handle_message and respond."""
+    
+    @pytest.fixture
+    def history(self):
+        return SessionHistory()
+    
+    def test_calculate(self, history):
+        """Test a single calculation request."""
+        response = handle_message({'id': 7, 'op': 'add', 'a': 5, 'b': 3}, history)
+        assert response == {'id': 7, 'result': 8}
+        assert str(history.get_last_calculation()) == "5 + 3 = 8"
+    
+    def test_batch(self, history):
+        """Test that batch failures become null entries."""
+        message = {'type': 'batch', 'op': 'divide', 'a': [4, 1], 'b': [2, 0]}
+        assert handle_message(message, history)['results'] == [2.0, None]
+        assert len(history) == 0
+    
+    def test_history_and_clear(self, history):
+        """Test reading and clearing the connection history."""
+        handle_message({'op': 'multiply', 'a': 2, 'b': 4}, history)
+        assert handle_message({'type': 'history'}, history)['history'] == ["2 × 4 = 8"]
+        assert handle_message({'type': 'clear'}, history)['cleared'] is True
+        assert len(history) == 0
+    
+    @pytest.mark.parametrize("message, error", [
+        ({'op': 'divide', 'a': 1, 'b': 0}, "Calculation failed: Cannot divide by zero"),
+        ({'op': 'power', 'a': 1, 'b': 2}, "Unknown operation: power"),
+        ({'op': 'add', 'a': 1}, "Missing field: b"),
+        ({'op': 'add', 'a': '1', 'b': 2}, "Field 'a' must be a number"),
+        ({'op': 'add', 'a': True, 'b': 2}, "Field 'a' must be a number"),
+        ({'type': 'sleep'}, "Unknown message type: sleep"),
+        ([1, 2], "Request must be a JSON object"),
+    ])
+    def test_errors(self, history, message, error):
+        """Test that invalid requests produce error responses."""
+        assert handle_message(message, history)['error'].startswith(error)
+    
+    def test_named_sessions(self, history):
+        """Test that a named session replaces the connection history."""
+        sessions = SessionRegistry()
+        handle_message({'op': 'add', 'a': 1, 'b': 2, 'session': 'ann'}, history, sessions)
+        assert len(history) == 0
+        assert len(sessions.get('ann')) == 1
+        report = handle_message({'type': 'sessions'}, history, sessions)['sessions']
+        assert report['ann']['calculations'] == 1
+        response = handle_message({'op': 'add', 'a': 1, 'b': 2, 'session': 3}, history, sessions)
+        assert response['error'] == "Field 'session' must be a string"
+        response = handle_message({'type': 'history', 'session': 'ann'}, history)
+        assert response['error'] == "Named sessions are not enabled"
+    
+    def test_exact_results_are_strings(self, history):
+        """Test that exact backend results keep their digits and stay serializable."""
+        CalculationFactory.set_backend('decimal')
+        try:
+            line = respond(b'{"id": 1, "op": "divide", "a": 1, "b": 8}\n', history)
+            batch = handle_message({'type': 'batch', 'op': 'divide', 'a': [1, 1], 'b': [4, 0]}, history)
+        finally:
+            CalculationFactory.set_backend('float')
+        assert json.loads(line) == {'id': 1, 'result': '0.125'}
+        assert batch['results'] == ['0.25', None]
+    
+    def test_huge_integers_and_infinities(self, history):
+        """Test that overflowing operands are errors and infinite results stay valid JSON."""
+        big = 10 ** 400
+        line = respond(json.dumps({'id': 1, 'op': 'divide', 'a': big, 'b': 3}).encode(), history)
+        assert json.loads(line) == {
+            'id': 1, 'error': "integer division result too large for a float"}
+        batch = handle_message({'id': 2, 'type': 'batch', 'op': 'add', 'a': [big], 'b': [1]}, history)
+        assert batch == {'id': 2, 'error': "int too large to convert to float"}
+        line = respond(b'{"id": 3, "op": "multiply", "a": 1e308, "b": -10}', history)
+        assert json.loads(line, parse_constant=pytest.fail) == {'id': 3, 'result': '-inf'}
+        batch = handle_message({'type': 'batch', 'op': 'multiply', 'a': [1e308, 1], 'b': [10, 0]}, history)
+        assert batch['results'] == ['inf', 0.0]
+    
+    def test_respond_invalid_json(self, history):
+        """Test that malformed lines are answered, not dropped."""
+        response = json.loads(respond(b'{nope\n', history))
+        assert response['id'] is None
+        assert response['error'].startswith("Invalid JSON")
+    
+    def test_session_history_is_not_the_singleton(self):
+        """Test that every session history is independent."""
+        assert SessionHistory() is not SessionHistory()
+        assert SessionHistory() is not CalculationHistory()
+
+
+class TestReadLine:
+    """Test cases for reading lines under a length limit."""
+    
+    def test_long_lines_are_skipped(self):
+        """Test that over-long lines are dropped whole, however they arrive."""
+        async def scenario():
+            reader = asyncio.StreamReader(limit=16)
+            reader.feed_data(b'short\n' + b'x' * 40 + b'\nok\n' + b'y' * 40)
+            loop = asyncio.get_running_loop()
+            # The end of the second long line arrives later, in two pieces
+            loop.call_later(0.01, reader.feed_data, b'y' * 40)
+            loop.call_later(0.02, reader.feed_data, b'y\nnext\n' + b'z' * 40)
+            loop.call_later(0.03, reader.feed_eof)
+            return [await read_line(reader) for _ in range(6)]
+        
+        assert asyncio.run(scenario()) == [b'short\n', None, b'ok\n', None, b'next\n', None]
+    
+    def test_end_of_stream(self):
+        """Test a last line without a newline and the end of the stream."""
+        async def scenario():
+            reader = asyncio.StreamReader(limit=16)
+            reader.feed_data(b'last')
+            reader.feed_eof()
+            return await read_line(reader), await read_line(reader)
+        
+        assert asyncio.run(scenario()) == (b'last', b'')
+
+
+class TestServer:
+    """Test cases for CalculationServer and CalculationClient."""
+    
+    def setup_method(self):
+        """Clear the global history before each test."""
+        CalculationHistory().clear_history()
+    
+    def test_pipelined_requests(self):
+        """Test many in-flight requests on one connection."""
+        async def scenario():
+            async with CalculationServer() as server:
+                client = await CalculationClient.connect(port=server.port)
+                results = await asyncio.gather(
+                    *(client.calculate('add', i, 1) for i in range(100)))
+                batch = await client.batch('multiply', [1, 2], [3, 4])
+                await client.close()
+            return results, batch
+        
+        results, batch = asyncio.run(scenario())
+        assert results == [i + 1 for i in range(100)]
+        assert batch == [3, 8]
+        assert len(CalculationHistory()) == 0
+    
+    def test_per_connection_history(self):
+        """Test that connections do not share history."""
+        async def scenario():
+            async with CalculationServer() as server:
+                first = await CalculationClient.connect(port=server.port)
+                second = await CalculationClient.connect(port=server.port)
+                await first.calculate('add', 1, 1)
+                histories = await first.history(), await second.history()
+                await first.clear_history()
+                cleared = await first.history()
+                for client in (first, second):
+                    await client.close()
+            return histories, cleared
+        
+        histories, cleared = asyncio.run(scenario())
+        assert histories == (["1 + 1 = 2"], [])
+        assert cleared == []
+    
+    def test_named_session_outlives_connection(self):
+        """Test that clients naming a session share it across connections."""
+        async def scenario():
+            async with CalculationServer() as server:
+                first = await CalculationClient.connect(port=server.port, session='ann')
+                await first.calculate('add', 1, 1)
+                await first.close()
+                second = await CalculationClient.connect(port=server.port, session='ann')
+                history = await second.history()
+                sessions = await second.sessions()
+                await second.close()
+            return history, sessions
+        
+        history, sessions = asyncio.run(scenario())
+        assert history == ["1 + 1 = 2"]
+        assert sessions['ann']['calculations'] == 1
+    
+    def test_errors_raise_on_client(self):
+        """Test that error responses raise without closing the connection."""
+        async def scenario():
+            async with CalculationServer() as server:
+                client = await CalculationClient.connect(port=server.port)
+                with pytest.raises(ValueError, match="divide by zero"):
+                    await client.calculate('divide', 1, 0)
+                result = await client.calculate('subtract', 5, 2)
+                await client.close()
+            return result
+        
+        assert asyncio.run(scenario()) == 3
+    
+    def test_large_batch(self):
+        """Test a batch far beyond asyncio's default line limit."""
+        async def scenario():
+            async with CalculationServer() as server:
+                client = await CalculationClient.connect(port=server.port)
+                results = await client.batch('add', [0.1] * 20000, [0.2] * 20000)
+                await client.close()
+            return results
+        
+        assert asyncio.run(scenario()) == [0.1 + 0.2] * 20000
+    
+    def test_too_large_lines_keep_connection(self):
+        """Test that over-long requests and responses fail only themselves."""
+        async def scenario():
+            async with CalculationServer(limit=1024) as server:
+                client = await CalculationClient.connect(port=server.port)
+                with pytest.raises(ValueError, match="Request too large"):
+                    await client.batch('add', [1] * 1000, [1] * 1000)
+                small = await CalculationClient.connect(port=server.port, limit=64)
+                with pytest.raises(ValueError, match="Response too large"):
+                    await small.batch('add', [1.5] * 20, [1.5] * 20)
+                results = await client.calculate('add', 1, 2), await small.calculate('add', 2, 2)
+                for each in (client, small):
+                    await each.close()
+            return results
+        
+        assert asyncio.run(scenario()) == (3, 4)
+    
+    def test_unix_socket_and_disconnect(self):
+        """Test a Unix socket server and pending requests on disconnect."""
+        async def scenario(path):
+            async with CalculationServer(path=path) as server:
+                client = await CalculationClient.connect(path=path)
+                assert await client.calculate('divide', 9, 3) == 3
+                # A request with no reply is failed when the server goes away
+                loop = asyncio.get_running_loop()
+                orphan = loop.create_future()
+                client._pending[-1] = orphan
+                await server.close()
+                await server.close()
+                client._writer.close()
+                await client._listener
+            return orphan
+        
+        with tempfile.TemporaryDirectory() as directory:
+            orphan = asyncio.run(scenario(os.path.join(directory, 'calc.sock')))
+        with pytest.raises(ConnectionError):
+            orphan.result()
+
+
+class TestLoadTest:
+    """Test cases for the bundled load test."""
+    
+    def test_load_test_report(self):
+        """Test that the load test reports throughput and latency."""
+        report = asyncio.run(load_test(clients=2, requests=50, pipeline=8))
+        assert report['requests'] == 100
+        assert report['requests_per_second'] > 0
+        assert report['p99_ms'] >= report['p50_ms']
+    
+    def test_main_load_test(self, capsys):
+        """Test the load test command line."""
+        main(['--load-test', '--clients', '1', '--requests', '10'])
+        out = capsys.readouterr().out
+        assert "req/s" in out
+        assert "p99 latency" in out
+    
+    def test_main_invalid_session_budget(self, capsys):
+        """Test that a budget too small for one calculation is a usage error."""
+        with pytest.raises(SystemExit):
+            main(['--load-test', '--session-budget', '1'])
+        assert "Session budget must be at least" in capsys.readouterr().err
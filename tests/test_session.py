@@ -0,0 +1,144 @@
+"""
+Unit tests for named sessions.
+
+This module tests the SessionRegistry: isolated named histories, the
+default session, memory budgets, idle eviction and size reports.
+"""
+
+import pytest
+from app.calculation import CalculationFactory, CalculationHistory
+from app.session import DEFAULT_SESSION, SessionRegistry, budget_capacity
+from app.storage import ROW_BYTES
+
+
+class FakeClock:
+    """A clock the tests move by hand."""
+    
+    def __init__(self):
+        self.now = 1000.0
+    
+    def __call__(self):
+        return self.now
+
+
+def add_many(history, count):
+    for i in range(count):
+        calculation = CalculationFactory.create('add', i, 1)
+        calculation.execute()
+        history.add_calculation(calculation)
+
+
+class TestSessionRegistry:
+    """Test cases for SessionRegistry."""
+    
+    def test_default_session_is_the_singleton(self):
+        """Test that unnamed code and the default session share one history."""
+        registry = SessionRegistry()
+        assert registry.get() is CalculationHistory()
+        assert registry.get(DEFAULT_SESSION) is CalculationHistory()
+        assert registry.names() == [DEFAULT_SESSION]
+        with pytest.raises(ValueError, match="default session cannot be closed"):
+            registry.close(DEFAULT_SESSION)
+    
+    def test_named_sessions_are_isolated(self):
+        """Test that every name gets its own history, kept between lookups."""
+        registry = SessionRegistry()
+        ann, bob = registry.get('ann'), registry.get('bob')
+        assert ann is not bob and ann is not CalculationHistory()
+        add_many(ann, 2)
+        assert registry.get('ann') is ann
+        assert (len(ann), len(bob)) == (2, 0)
+        assert registry.names() == [DEFAULT_SESSION, 'ann', 'bob']
+        assert len(registry) == 3
+        registry.close('ann')
+        assert registry.get('ann') is not ann
+        with pytest.raises(ValueError, match="Unknown session: carl"):
+            registry.close('carl')
+    
+    def test_budget_bounds_memory(self):
+        """Test that a session over budget drops its oldest calculations."""
+        registry = SessionRegistry(budget=10 * ROW_BYTES)
+        history = registry.get('heavy')
+        add_many(history, 25)
+        assert len(history) == 10
+        assert history.get_history()[0].operand_a == 15
+        assert history.nbytes() <= 10 * ROW_BYTES
+    
+    def test_budget_bounds_memory_after_clears(self):
+        """Test that cleared histories kept for undo count against the budget."""
+        budget = 64 * 1024
+        registry = SessionRegistry(budget=budget)
+        history = registry.get('heavy')
+        for _ in range(60):
+            add_many(history, budget_capacity(budget))
+            history.clear_history()
+        assert 0 < registry.report()['heavy']['bytes'] <= 2 * budget
+        assert history.undo()
+        assert len(history) == budget_capacity(budget)
+        assert history.nbytes() <= 2 * budget
+        registry.set_budget('heavy', None)
+        assert history.retained_limit is None
+    
+    def test_budget_costs_nothing_until_used(self):
+        """Test that a generous budget is not allocated up front."""
+        registry = SessionRegistry(budget=1 << 30)
+        history = registry.get('light')
+        add_many(history, 3)
+        assert history.nbytes() == 3 * ROW_BYTES
+    
+    def test_set_budget(self):
+        """Test changing and lifting a session's budget."""
+        registry = SessionRegistry()
+        history = registry.get('ann')
+        add_many(history, 5)
+        registry.set_budget('ann', 2 * ROW_BYTES)
+        assert [calc.operand_a for calc in history.get_history()] == [3, 4]
+        assert registry.report()['ann']['budget'] == 2 * ROW_BYTES
+        registry.set_budget('ann', None)
+        add_many(history, 3)
+        assert len(history) == 5
+    
+    def test_invalid_budget(self):
+        """Test that a budget smaller than one calculation is rejected."""
+        assert budget_capacity(100) == 100 // ROW_BYTES
+        with pytest.raises(ValueError, match=f"at least {ROW_BYTES} bytes"):
+            SessionRegistry(budget=1)
+        with pytest.raises(ValueError, match=f"at least {ROW_BYTES} bytes"):
+            SessionRegistry().set_budget('ann', 0)
+    
+    def test_evict_idle(self):
+        """Test that only named sessions unused for long enough are evicted."""
+        clock = FakeClock()
+        registry = SessionRegistry(clock=clock)
+        registry.get('ann')
+        clock.now += 30
+        registry.get('bob')
+        clock.now += 30
+        assert registry.evict_idle(45) == ['ann']
+        assert registry.names() == [DEFAULT_SESSION, 'bob']
+        with pytest.raises(ValueError, match="No idle timeout given"):
+            registry.evict_idle()
+    
+    def test_idle_timeout_sweeps_on_lookup(self):
+        """Test that lookups close idle sessions once per timeout."""
+        clock = FakeClock()
+        registry = SessionRegistry(idle_timeout=60, clock=clock)
+        registry.get('ann')
+        clock.now += 59
+        registry.get('bob')
+        assert registry.names() == [DEFAULT_SESSION, 'ann', 'bob']
+        clock.now += 1
+        registry.get('bob')
+        assert registry.names() == [DEFAULT_SESSION, 'bob']
+        assert registry.evict_idle() == []
+    
+    def test_report(self):
+        """Test the per-session size report."""
+        clock = FakeClock()
+        registry = SessionRegistry(budget=100 * ROW_BYTES, clock=clock)
+        add_many(registry.get('ann'), 4)
+        clock.now += 2.5
+        report = registry.report()
+        assert report['ann'] == {'calculations': 4, 'bytes': 4 * ROW_BYTES,
+                                 'budget': 100 * ROW_BYTES, 'idle_seconds': 2.5}
+        assert report[DEFAULT_SESSION]['budget'] is None
@@ -0,0 +1,441 @@
+"""
+Unit tests for the columnar calculation storage.
+
+This module tests opcode assignment, value packing and the
+struct-of-arrays store backing CalculationHistory.
+"""
+
+import math
+import os
+from array import array
+from decimal import Decimal
+
+import pytest
+from app.storage import (
+    LOG_HEADER_SIZE, RECORD, ROW_BYTES,
+    BOXED, INT_A, INT_B, INT_RESULT, NO_RESULT,
+    ColumnarStore, DropOldest, EvictedError, MappedLogStore, OpcodeTable, RingStore, SpillToDisk, pack, unpack,
+    empty_columns, read_columns, transfer_format, write_columns,
+)
+
+
+class TestOpcodeTable:
+    """Test cases for OpcodeTable."""
+    
+    def test_builtin_opcodes_are_stable(self):
+        """Test that built-in operations get fixed opcodes."""
+        table = OpcodeTable()
+        assert [table.code(name) for name in ('add', 'subtract', 'multiply', 'divide')] == [0, 1, 2, 3]
+        assert len(table) == 4
+    
+    def test_new_names_get_next_opcode(self):
+        """Test that unknown names are assigned on demand."""
+        table = OpcodeTable()
+        assert table.code('power') == 4
+        assert table.code('power') == 4
+        assert table.name(4) == 'power'
+    
+    def test_table_full(self):
+        """Test that more than 256 operations are rejected."""
+        table = OpcodeTable(f"op{i}" for i in range(256))
+        with pytest.raises(ValueError, match="Opcode table is full"):
+            table.code('one_too_many')
+
+
+class TestPacking:
+    """Test cases for pack and unpack."""
+    
+    def test_pack_floats(self):
+        """Test that plain floats need no flags."""
+        assert pack(1.5, 2.5, 4.0) == (0, 1.5, 2.5, 4.0)
+    
+    def test_pack_ints_round_trip(self):
+        """Test that ints are flagged and restored as ints."""
+        flags, a, b, result = pack(5, 3, 8)
+        assert flags == INT_A | INT_B | INT_RESULT
+        restored = unpack(flags, a, b, result)
+        assert restored == (5, 3, 8)
+        assert all(type(value) is int for value in restored)
+    
+    def test_pack_missing_result(self):
+        """Test that a calculation without a result is flagged."""
+        flags, _, _, result = pack(1.0, 2.0, None)
+        assert flags == NO_RESULT
+        assert math.isnan(result)
+        assert unpack(flags, 1.0, 2.0, result) == (1.0, 2.0, None)
+    
+    @pytest.mark.parametrize("value", [
+        2 ** 53 + 1,
+        10 ** 400,
+        Decimal('0.1'),
+        True,
+        'text',
+    ])
+    def test_pack_inexact_values_are_boxed(self, value):
+        """Test that values a float64 cannot reproduce exactly are boxed."""
+        flags, packed, _, _ = pack(value, 1.0, 1.0)
+        assert flags & BOXED
+
+
+class TestColumnarStore:
+    """Test cases for ColumnarStore."""
+    
+    def test_append_and_record(self):
+        """Test appending rows and reading them back."""
+        store = ColumnarStore()
+        store.append(0, INT_A, 5.0, 3.5, 8.5)
+        store.append(3, 0, 1.0, 4.0, 0.25)
+        assert len(store) == 2
+        assert store.record(0) == (0, INT_A, 5.0, 3.5, 8.5)
+        assert store.record(1) == (3, 0, 1.0, 4.0, 0.25)
+    
+    def test_boxed_rows_keep_payload(self):
+        """Test that boxed rows keep their original object."""
+        store = ColumnarStore()
+        payload = object()
+        store.append(0, 0, 1.0, 1.0, 2.0)
+        store.append(0, BOXED, 1.0, 1.0, 2.0, payload)
+        assert store.payload(1) is payload
+        assert store.payload(0) is None
+    
+    def test_rows_cost_tens_of_bytes(self):
+        """Test that per-row memory stays in the tens of bytes."""
+        store = ColumnarStore()
+        for i in range(10000):
+            store.append(0, 0, float(i), 1.0, i + 1.0)
+        assert store.nbytes() / len(store) < 40
+
+
+def fill(store, count):
+    """Append ``count`` rows whose first operand is the row number."""
+    for i in range(count):
+        store.append(0, 0, float(i), 1.0, i + 1.0)
+
+
+class TestRingStore:
+    """Test cases for RingStore and its eviction policies."""
+    
+    def test_capacity_must_be_positive(self):
+        """Test that an empty ring is rejected."""
+        with pytest.raises(ValueError, match="at least 1"):
+            RingStore(0)
+    
+    def test_under_capacity_behaves_like_list(self):
+        """Test that nothing is evicted before the ring is full."""
+        store = RingStore(4)
+        fill(store, 3)
+        assert len(store) == 3
+        assert store.offset == 0
+        assert [store.record(i)[2] for i in range(3)] == [0.0, 1.0, 2.0]
+    
+    def test_grows_to_capacity(self):
+        """Test that ring memory follows the rows held, up to the capacity."""
+        store = RingStore(1000000)
+        assert store.nbytes() == 0
+        fill(store, 3)
+        assert store.nbytes() == 3 * ROW_BYTES
+        small = RingStore(2)
+        fill(small, 5)
+        assert small.nbytes() == 2 * ROW_BYTES
+    
+    def test_drop_oldest(self):
+        """Test that the oldest rows are dropped once the ring is full."""
+        store = RingStore(3, DropOldest())
+        fill(store, 5)
+        assert len(store) == 3
+        assert store.offset == 2
+        assert [store.record(i)[2] for i in range(2, 5)] == [2.0, 3.0, 4.0]
+        with pytest.raises(EvictedError, match="evicted"):
+            store.record(1)
+        assert store.stats() == {'capacity': 3, 'in_memory': 3, 'evictions': 2, 'spilled': 0}
+    
+    def test_dropped_boxed_payloads_are_released(self):
+        """Test that evicting a boxed row drops its payload."""
+        store = RingStore(1)
+        store.append(0, BOXED, 1.0, 1.0, 2.0, 'payload')
+        store.append(0, 0, 1.0, 1.0, 2.0)
+        assert store.boxed == {}
+    
+    def test_spill_to_disk(self, tmp_path):
+        """Test that spilled rows stay readable from the segment file."""
+        segment = tmp_path / 'history.seg'
+        store = RingStore(2, SpillToDisk(str(segment)))
+        store.append(0, BOXED, 0.5, 1.0, 1.5, 'payload')
+        fill(store, 4)
+        assert len(store) == 5
+        assert store.offset == 0
+        assert store.record(0) == (0, 0, 0.5, 1.0, 1.5)
+        assert [store.record(i)[2] for i in range(1, 5)] == [0.0, 1.0, 2.0, 3.0]
+        assert segment.stat().st_size == 3 * 32
+        assert store.stats() == {'capacity': 2, 'in_memory': 2, 'evictions': 3, 'spilled': 3}
+        store.eviction.close()
+    
+    def test_spill_to_temporary_segment(self):
+        """Test that a temporary segment is created and removed on close."""
+        policy = SpillToDisk()
+        assert os.path.exists(policy.path)
+        policy.close()
+        assert not os.path.exists(policy.path)
+        policy.close()
+    
+    def test_reset_replaces_temporary_segment(self):
+        """Test that clearing a temporary segment leaves no file behind."""
+        store = RingStore(1, SpillToDisk())
+        fill(store, 3)
+        old = store.eviction.path
+        fresh = store.cleared()
+        assert not os.path.exists(old)
+        assert os.path.exists(fresh.eviction.path)
+        fresh.close()
+        assert not os.path.exists(fresh.eviction.path)
+    
+    def test_close_keeps_named_segment(self, tmp_path):
+        """Test that a segment at a given path outlives the store."""
+        segment = tmp_path / 'history.seg'
+        store = RingStore(1, SpillToDisk(str(segment)))
+        fill(store, 3)
+        store.close()
+        assert segment.stat().st_size == 2 * RECORD.size
+    
+    def test_cleared_resets_spill_segment(self, tmp_path):
+        """Test that clearing starts a new, empty segment."""
+        store = RingStore(1, SpillToDisk(str(tmp_path / 'history.seg')))
+        fill(store, 3)
+        fresh = store.cleared()
+        assert len(fresh) == 0
+        assert fresh.stats()['evictions'] == 0
+        with pytest.raises(EvictedError, match="cleared"):
+            store.record(0)
+        fresh.eviction.close()
+    
+    def test_clears_in_place(self, tmp_path):
+        """Test which stores lose their old rows when cleared."""
+        spilling = RingStore(1, SpillToDisk(str(tmp_path / 'history.seg')))
+        assert spilling.clears_in_place
+        assert not RingStore(1).clears_in_place
+        assert not ColumnarStore().clears_in_place
+        spilling.eviction.close()
+
+
+class TestMappedLogStore:
+    """Test cases for the memory-mapped history log."""
+    
+    @pytest.fixture
+    def path(self, tmp_path):
+        return str(tmp_path / 'history.log')
+    
+    def test_append_and_reopen(self, path):
+        """Test that rows persist across reopening the log."""
+        log = MappedLogStore(path)
+        log.append(0, INT_A | INT_B | INT_RESULT, 5.0, 3.0, 8.0)
+        log.append(3, 0, 7.0, 2.0, 3.5)
+        log.flush()
+        log.close()
+        
+        reopened = MappedLogStore(path)
+        assert len(reopened) == 2
+        assert reopened.record(1) == (3, 0, 7.0, 2.0, 3.5)
+        assert reopened.payload(1) is None
+        assert reopened.nbytes() == 0
+        reopened.close()
+    
+    def test_fixed_width_records(self, path):
+        """Test that the file grows by fixed-width records."""
+        log = MappedLogStore(path, reserve=2)
+        fill(log, 5)
+        assert os.path.getsize(path) >= LOG_HEADER_SIZE + 5 * RECORD.size
+        assert [log.record(i)[2] for i in range(5)] == [0.0, 1.0, 2.0, 3.0, 4.0]
+        log.close()
+    
+    def test_out_of_range(self, path):
+        """Test that reading past the last row raises IndexError."""
+        log = MappedLogStore(path)
+        with pytest.raises(IndexError):
+            log.record(0)
+        log.close()
+    
+    def test_boxed_rows_are_stored_unboxed(self, path):
+        """Test that boxed rows keep only their float approximation."""
+        log = MappedLogStore(path)
+        log.append(0, BOXED, 0.5, 1.0, 1.5, 'payload')
+        assert log.record(0)[1] == 0
+        log.close()
+    
+    def test_shared_between_handles(self, path):
+        """Test that two handles on one file see each other's appends."""
+        writer = MappedLogStore(path, reserve=1)
+        reader = MappedLogStore(path)
+        fill(writer, 3)
+        assert len(reader) == 3
+        assert reader.record(2)[2] == 2.0
+        
+        code = writer.operations.code('power')
+        assert reader.operations.name(code) == 'power'
+        assert reader.operations.code('power') == code
+        assert reader.operations.code('modulo') == code + 1
+        assert writer.operations.name(code + 1) == 'modulo'
+        writer.close()
+        reader.close()
+    
+    def test_cleared_truncates(self, path):
+        """Test that clearing the log empties it for every handle."""
+        log = MappedLogStore(path)
+        fill(log, 2)
+        assert log.clears_in_place
+        assert log.cleared() is log
+        assert len(log) == 0
+        assert log.stats() == {'capacity': None, 'in_memory': 0, 'evictions': 0,
+                               'spilled': 0, 'persisted': 0}
+        log.close()
+    
+    def test_opcode_table_full(self, path):
+        """Test that the header rejects more names than it can hold."""
+        log = MappedLogStore(path)
+        with pytest.raises(ValueError, match="opcode table is full"):
+            for i in range(255):
+                log.operations.code(f"operation_with_a_long_name_{i}")
+        log.close()
+    
+    def test_rejects_foreign_files(self, path):
+        """Test that a file without the log header is refused."""
+        with open(path, 'wb') as handle:
+            handle.write(b'not a log')
+        with pytest.raises(ValueError, match="Not a calculation log"):
+            MappedLogStore(path)
+
+
+def as_lists(columns):
+    return [list(column) for column in columns]
+
+
+class TestColumns:
+    """Test cases for reading and appending whole columns of a store."""
+    
+    def test_columnar_store(self):
+        """Test column slices and bulk extend of an unbounded store."""
+        store = ColumnarStore()
+        fill(store, 4)
+        columns = store.columns(1, 3)
+        assert as_lists(columns) == [[0, 0], [0, 0], [1.0, 2.0], [1.0, 1.0], [2.0, 3.0]]
+        store.extend(columns)
+        assert len(store) == 6
+        assert store.record(5) == (0, 0, 2.0, 1.0, 3.0)
+    
+    def test_ring_store_wraps_and_spills(self, tmp_path):
+        """Test that ring columns join spilled rows and both halves of the ring."""
+        store = RingStore(3, SpillToDisk(str(tmp_path / 'history.seg')))
+        fill(store, 7)
+        assert as_lists(store.columns(0, 7))[2] == [0.0, 1.0, 2.0, 3.0, 4.0, 5.0, 6.0]
+        assert as_lists(store.columns(5, 6))[2] == [5.0]
+        store.extend(store.columns(4, 6))
+        assert [store.record(i)[2] for i in range(7, 9)] == [4.0, 5.0]
+    
+    def test_mapped_log(self, tmp_path):
+        """Test strided column reads and bulk appends on a history log."""
+        log = MappedLogStore(str(tmp_path / 'history.log'), reserve=1)
+        log.append(3, INT_A, 7.0, 2.0, 3.5)
+        reader = MappedLogStore(log.path)
+        assert as_lists(log.columns(0, 0)) == [[], [], [], [], []]
+        columns = (array('B', [0, 1]), array('B', [BOXED | INT_B, 0]),
+                   array('d', [1.0, 2.0]), array('d', [3.0, 4.0]), array('d', [4.0, -2.0]))
+        log.extend(columns)
+        assert len(log) == 3
+        assert log.record(1) == (0, INT_B, 1.0, 3.0, 4.0)
+        assert as_lists(log.columns(0, 3)) == [
+            [3, 0, 1], [INT_A, INT_B, 0], [7.0, 1.0, 2.0], [2.0, 3.0, 4.0], [3.5, 4.0, -2.0]]
+        # Another handle maps the rows the file grew by as it reads them
+        assert list(reader.columns(1, 3)[2]) == [1.0, 2.0]
+        reader.close()
+        log.close()
+
+
+class TestTransferFormats:
+    """Test cases for the columnar and CSV export formats."""
+    
+    def columns(self):
+        return (array('B', [0, 1, 0]), array('B', [INT_A | INT_B | INT_RESULT, NO_RESULT, BOXED]),
+                array('d', [5.0, 1.5, 0.1]), array('d', [3.0, -2.0, 0.2]),
+                array('d', [8.0, math.nan, 0.30000000000000004]))
+    
+    @pytest.mark.parametrize("name", ['calc.columnar', 'calc.csv'])
+    def test_round_trip(self, tmp_path, name):
+        """Test that both formats read back exactly what was written."""
+        path = str(tmp_path / name)
+        write_columns(path, ['add', 'divide'], self.columns())
+        names, columns = read_columns(path)
+        assert names == ['add', 'divide']
+        expected = as_lists(self.columns())
+        # Payloads stay behind; a boxed row keeps its float64 approximation
+        expected[1][2] = 0
+        assert as_lists(columns)[:4] == expected[:4]
+        assert as_lists(columns)[4][::2] == expected[4][::2]
+        assert math.isnan(columns[4][1])
+    
+    @pytest.mark.parametrize("name", ['empty.columnar', 'empty.csv'])
+    def test_empty(self, tmp_path, name):
+        """Test files without rows."""
+        path = str(tmp_path / name)
+        write_columns(path, ['add'], empty_columns())
+        assert as_lists(read_columns(path)[1]) == [[], [], [], [], []]
+    
+    def test_csv_layout(self, tmp_path):
+        """Test the CSV text, which keeps integers and leaves missing results empty."""
+        path = str(tmp_path / 'calc.csv')
+        write_columns(path, ['add', 'divide'], self.columns())
+        with open(path) as handle:
+            assert handle.read() == ("operation,a,b,result\nadd,5,3,8\ndivide,1.5,-2.0,\n"
+                                     "add,0.1,0.2,0.30000000000000004\n")
+    
+    def test_formats(self):
+        """Test choosing a format by name or suffix."""
+        assert transfer_format('session.CSV') == 'csv'
+        assert transfer_format('session.bin') == 'columnar'
+        assert transfer_format('session.csv', 'columnar') == 'columnar'
+        with pytest.raises(ValueError, match="Unknown format: json. Available: columnar, csv"):
+            transfer_format('session.json', 'json')
+    
+    def test_csv_rows_parsed_one_by_one(self, tmp_path):
+        """Test values outside the whole-column parser's rules."""
+        path = str(tmp_path / 'calc.csv')
+        with open(path, 'w') as handle:
+            handle.write("operation,a,b,result\npower,2,64,18446744073709551616\n"
+                         "add, 1,2.5,3.5\n")
+        names, columns = read_columns(path)
+        assert names == ['power', 'add']
+        # 2 ** 64 is exact in float64 but 2 ** 64 + 1 would not be
+        assert as_lists(columns)[1] == [INT_A | INT_B | INT_RESULT, INT_A]
+        assert columns[4][0] == 2.0 ** 64
+    
+    @pytest.mark.parametrize("text, message", [
+        ("a,b\n", "Not a calculation CSV file"),
+        ("", "Not a calculation CSV file"),
+        ("operation,a,b,result\nadd,1,2,3\nadd,x,2,3\n", "Invalid row 3 in .*: add,x,2,3"),
+        ("operation,a,b,result\nadd,1,2\n", "Invalid row 2"),
+    ])
+    def test_invalid_csv(self, tmp_path, text, message):
+        """Test that malformed CSV files are rejected with the offending line."""
+        path = str(tmp_path / 'calc.csv')
+        with open(path, 'w') as handle:
+            handle.write(text)
+        with pytest.raises(ValueError, match=message):
+            read_columns(path)
+    
+    def test_invalid_columnar(self, tmp_path):
+        """Test that foreign, truncated and inconsistent columnar files are rejected."""
+        path = str(tmp_path / 'calc.columnar')
+        with open(path, 'wb') as handle:
+            handle.write(b'CALCLOG1')
+        with pytest.raises(ValueError, match="Not a calculation columnar file"):
+            read_columns(path)
+        
+        write_columns(path, ['add', 'divide'], self.columns())
+        with open(path, 'rb') as handle:
+            data = handle.read()
+        with open(path, 'wb') as handle:
+            handle.write(data[:-1])
+        with pytest.raises(ValueError, match="Truncated calculation columnar file"):
+            read_columns(path)
+        
+        write_columns(path, ['add'], self.columns())
+        with pytest.raises(ValueError, match="Unknown opcode"):
+            read_columns(path)
@@ -0,0 +1,89 @@
+"""
+Unit tests for the streaming calculator.
+
+This module tests line tokenizing, evaluation and buffered output
+of the non-interactive streaming mode.
+"""
+
+import io
+
+import pytest
+from app.calculation import CalculationHistory
+from app.stream import evaluate, run_stream, tokenize
+
+
+class TestTokenize:
+    """Test cases for tokenize."""
+    
+    def test_skips_blank_lines_and_comments(self):
+        """Test that blank lines and comments are dropped but counted."""
+        lines = ["add 1 2\n", "\n", "# note\n", "divide 4 2\n"]
+        assert list(tokenize(lines)) == [(1, ['add', '1', '2']), (4, ['divide', '4', '2'])]
+
+
+class TestEvaluate:
+    """Test cases for evaluate."""
+    
+    @pytest.mark.parametrize("line, expected", [
+        ("add 5 3", "8.0\n"),
+        ("SUBTRACT 5 3", "2.0\n"),
+        ("multiply 2.5 4", "10.0\n"),
+        ("divide 7 2", "3.5\n"),
+        ("divide 1 0", "error: line 1: Calculation failed: Cannot divide by zero\n"),
+        ("power 2 3", "error: line 1: unknown operation 'power'\n"),
+        ("add x 3", "error: line 1: invalid number in 'x 3'\n"),
+        ("add 1", "error: line 1: expected 'operation a b'\n"),
+    ])
+    def test_evaluate_lines(self, line, expected):
+        """Test output for valid and invalid lines."""
+        assert list(evaluate(tokenize([line]))) == [expected]
+    
+    def test_evaluate_is_lazy(self):
+        """Test that lines are consumed one at a time."""
+        def lines():
+            yield "add 1 1"
+            raise AssertionError("read past the first result")
+        
+        assert next(evaluate(tokenize(lines()))) == "2.0\n"
+
+
+class TestRunStream:
+    """Test cases for run_stream."""
+    
+    def setup_method(self):
+        """Clear history before each test."""
+        CalculationHistory().clear_history()
+    
+    def test_writes_in_chunks(self):
+        """Test that results are written in buffered chunks."""
+        writes = []
+        
+        class Recorder(io.StringIO):
+            def write(self, text):
+                writes.append(text)
+                return super().write(text)
+        
+        out = Recorder()
+        errors = run_stream(io.StringIO("add 1 1\n" * 5), out, chunk_lines=2)
+        assert errors == 0
+        assert out.getvalue() == "2.0\n" * 5
+        assert writes == ["2.0\n2.0\n", "2.0\n2.0\n", "2.0\n"]
+    
+    def test_counts_errors_and_continues(self):
+        """Test that a bad row does not stop the stream."""
+        out = io.StringIO()
+        errors = run_stream(io.StringIO("divide 1 0\nadd 1 2\n"), out)
+        assert errors == 1
+        assert out.getvalue().splitlines()[1] == "3.0"
+    
+    def test_history_is_optional(self):
+        """Test that only recorded streams add to history."""
+        run_stream(io.StringIO("add 1 2\n"), io.StringIO())
+        assert len(CalculationHistory()) == 0
+        
+        out = io.StringIO()
+        errors = run_stream(io.StringIO("add 1 2\ndivide 1 0\n"), out, record=True)
+        assert errors == 1
+        assert out.getvalue() == "3.0\nerror: line 2: Calculation failed: Cannot divide by zero\n"
+        assert str(CalculationHistory().get_last_calculation()) == "1.0 + 2.0 = 3.0"
+        assert len(CalculationHistory()) == 1